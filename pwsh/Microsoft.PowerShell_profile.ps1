@@ -18,3 +18,5 @@ Import-Module "C:\Users\leons\Documents\vsCodeProjects\winwal\winwal.psm1"
 
 New-Alias nc ncat
 New-Alias wget wget2
+
+function apply-theme { python "$HOME\.config\scripts\ApplyTheme.py" @args }
\ No newline at end of file
@@ -0,0 +1,183 @@
+#!/usr/bin/env python3
+# filepath: ApplyFleet.py
+
+import argparse
+import concurrent.futures
+import json
+import os
+import sys
+import time
+from pathlib import Path
+
+import theme_template
+from ApplyTheme import FAILED, SKIPPED, UNCHANGED, WRITTEN
+from color_math import derive
+from target_registry import discover_targets
+from theme_history import ThemeHistory, palette_label, record_theme
+from theme_io import WriteBatch
+from theme_template import TemplateCache
+from wal_palette import WAL_COLORS_PATH
+from wal_sequences import load_palette_with_fallback
+
+# Set once per worker process by init_worker
+_worker = {}
+
+def read_roots(roots_file):
+    """Return the config roots listed one per line, skipping blanks and # comments"""
+    with open(roots_file, 'r', encoding='utf-8') as f:
+        lines = (line.strip() for line in f)
+        return [os.path.expanduser(line) for line in lines if line and not line.startswith('#')]
+
+def init_worker(colors, label, template_entries):
+    """Receive the parsed palette and the compiled template slots once per worker process"""
+    _worker["colors"] = colors
+    _worker["label"] = label
+    # Every root's configs fill their slots from this in-memory cache; nothing writes template-cache.json
+    theme_template.CACHE = TemplateCache(path=None, entries=template_entries)
+    derive(colors)
+
+def apply_root(root, names=None):
+    """Apply the worker's palette to every existing target under one config root
+
+    The root stands in for HOME: configs and plugin targets are looked up
+    under it and its theme history is kept in its own .cache/wal. Returns a picklable report.
+    """
+    started = time.monotonic()
+    colors, label = _worker["colors"], _worker["label"]
+    cache = theme_template.CACHE
+    known = set(cache.snapshot())
+    history = ThemeHistory(Path(root) / ".cache" / "wal" / "theme-history")
+
+    results = {}
+    staged = {}
+    batch = WriteBatch()
+    if not os.path.isdir(root):
+        results["*"] = (FAILED, f"{root} is not a directory")
+    else:
+        # Each root declares its own plugin targets, like a HOME would
+        config_dir = Path(root) / ".config" / "wal"
+        for name, target in discover_targets(root, config_dir / "targets.json", config_dir / "targets").items():
+            if names and name not in names:
+                continue
+            try:
+                with open(target.path, 'r') as f:
+                    content = f.read()
+            except FileNotFoundError:
+                if names:
+                    results[name] = (SKIPPED, f"{target.path} not found")
+                continue
+            except OSError as e:
+                results[name] = (FAILED, str(e))
+                continue
+
+            try:
+                rendered = target.render(content, colors)
+                if batch.stage(target.path, content, rendered):
+                    staged[name] = (target.path, content, rendered)
+                    results[name] = (WRITTEN, None)
+                else:
+                    results[name] = (UNCHANGED, None)
+            except Exception as e:
+                results[name] = (FAILED, str(e))
+
+    # Like ApplyTheme, a root whose targets did not all render keeps its old theme everywhere
+    failed = [name for name, (status, _) in results.items() if status == FAILED]
+    if failed:
+        batch.abort()
+        for name in staged:
+            results[name] = (SKIPPED, f"not written since {', '.join(failed)} failed")
+    else:
+        errors = batch.commit()
+        for name, (path, content, rendered) in staged.items():
+            if path in errors:
+                results[name] = (FAILED, str(errors[path]))
+            else:
+                record_theme(name, path, content, rendered, colors, history, label, batch.write_times.get(path))
+
+    compiled = {digest: slots for digest, slots in cache.snapshot().items() if digest not in known}
+    return {"root": str(root), "results": results, "elapsed_ms": (time.monotonic() - started) * 1000,
+            "worker": os.getpid(), "compiled": compiled}
+
+def print_report(reports, elapsed):
+    """Print one line per root that was not simply unchanged, then the totals"""
+    totals = {}
+    failed_roots = 0
+    for report in reports:
+        statuses = report["results"]
+        for name, (status, _) in statuses.items():
+            totals.setdefault(name, {}).setdefault(status, 0)
+            totals[name][status] += 1
+        problems = [f"{name}: {status} ({detail})" for name, (status, detail) in statuses.items() if status in (FAILED, SKIPPED)]
+        written = [name for name, (status, _) in statuses.items() if status == WRITTEN]
+        if any(status == FAILED for status, _ in statuses.values()):
+            failed_roots += 1
+        if problems or written:
+            summary = f"written: {', '.join(written)}" if written else "nothing written"
+            print(f"{report['root']}  {summary} ({report['elapsed_ms']:.1f} ms)")
+            for problem in problems:
+                print(f"  {problem}")
+        elif not statuses:
+            print(f"{report['root']}  no themed configs found")
+
+    print(f"Applied to {len(reports)} roots in {elapsed:.2f} s ({len(reports) / elapsed if elapsed else 0:.1f} roots/s), "
+          f"{failed_roots} with failures")
+    for name, counts in sorted(totals.items()):
+        print(f"  {name:<16} " + ', '.join(f"{status} {count}" for status, count in sorted(counts.items())))
+
+def main():
+    parser = argparse.ArgumentParser(description="Apply one winwal palette to many config roots, each treated as a HOME")
+    parser.add_argument('roots', nargs='*', help="config root directories (each laid out like a home directory)")
+    parser.add_argument('--roots-file', help="file listing config roots, one per line")
+    parser.add_argument('--colors', default=str(WAL_COLORS_PATH), help=f"palette to apply (default: {WAL_COLORS_PATH})")
+    parser.add_argument('--target', action='append', help="only apply to this target (repeatable)")
+    parser.add_argument('--jobs', type=int, default=os.cpu_count() or 1, help="worker processes (default: number of CPUs)")
+    parser.add_argument('--json', metavar='FILE', help="also write the per-root results as JSON")
+    args = parser.parse_args()
+
+    roots = list(args.roots)
+    if args.roots_file:
+        try:
+            roots += read_roots(args.roots_file)
+        except OSError as e:
+            print(f"Error: cannot read roots file: {e}")
+            return 1
+    roots = list(dict.fromkeys(os.path.abspath(root) for root in roots))
+    if not roots:
+        parser.error("no config roots given")
+
+    # Parse the palette once here; workers get the flat colors instead of re-reading colors.json
+    try:
+        palette = load_palette_with_fallback(args.colors)
+    except (OSError, json.JSONDecodeError) as e:
+        print(f"Error loading palette from {args.colors}: {e}")
+        return 1
+    colors = palette.flat()
+    disk_cache = theme_template.CACHE
+    initargs = (colors, palette_label(palette), disk_cache.snapshot())
+
+    started = time.monotonic()
+    jobs = max(1, min(args.jobs, len(roots)))
+    if jobs == 1:
+        init_worker(*initargs)
+        reports = [apply_root(root, args.target) for root in roots]
+    else:
+        with concurrent.futures.ProcessPoolExecutor(max_workers=jobs, initializer=init_worker, initargs=initargs) as executor:
+            # Chunks amortise the per-task overhead while still spreading roots over every worker
+            chunksize = max(1, len(roots) // (jobs * 4))
+            reports = list(executor.map(apply_root, roots, [args.target] * len(roots), chunksize=chunksize))
+    elapsed = time.monotonic() - started
+
+    # Keep the slots compiled by the workers for the next run, in one cache write
+    compiled = {digest: slots for report in reports for digest, slots in report.pop("compiled").items()}
+    if compiled:
+        disk_cache.put(*compiled.items())
+
+    print_report(reports, elapsed)
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump({"colors": args.colors, "elapsed_s": elapsed, "jobs": jobs, "roots": reports}, f, indent=1)
+        print(f"Report written to {args.json}")
+    return 1 if any(status == FAILED for report in reports for status, _ in report["results"].values()) else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,509 @@
+#!/usr/bin/env python3
+# filepath: ApplyTheme.py
+
+import argparse
+import concurrent.futures
+import ctypes
+import ctypes.util
+import json
+import os
+import select
+import struct
+import sys
+import threading
+import time
+from pathlib import Path
+
+from target_registry import discover_targets
+from theme_io import WriteBatch, print_change_summary
+from theme_history import ThemeHistory, list_history, palette_label, record_theme, rollback
+from theme_template import compile_template, memory_cache, strip_markers
+from theme_transition import CoalescingWriter, run_frames, transition_palettes
+from wal_palette import cached_palette
+from wal_sequences import load_palette_with_fallback
+
+# inotify event masks (see inotify(7))
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_CLOEXEC = 0o2000000
+INOTIFY_EVENT = struct.Struct('iIII')
+
+# Outcome of one target in an apply run
+WRITTEN = "written"
+UNCHANGED = "unchanged"
+SKIPPED = "skipped"
+FAILED = "failed"
+TIMED_OUT = "timed out"
+
+def theme_targets(home_dir):
+    """Return the themed configs as name -> Target, see target_registry"""
+    return discover_targets(home_dir)
+
+def marker_keys(text):
+    """The palette entries named by the template markers in text, in order"""
+    return tuple(dict.fromkeys(slot.key for slot in compile_template(text)))
+
+class TargetState:
+    """In-memory copy of one themed config, kept between watch events"""
+
+    def __init__(self, target, history=None):
+        self.target = target
+        self.name = target.name
+        self.path = Path(target.path)
+        self.content = None
+        self.stat_key = None
+        self.colors_key = None
+        self.marker_keys = ()
+        self.history = history
+        self.pending = None
+        self.lock = threading.Lock()
+
+    def refresh(self):
+        """Re-read the config only if it changed on disk since we last saw it"""
+        stat = os.stat(self.path)
+        stat_key = (stat.st_mtime_ns, stat.st_size)
+        if stat_key == self.stat_key:
+            return
+
+        with open(self.path, 'r') as f:
+            self.content = f.read()
+        self.marker_keys = marker_keys(self.content)
+        self.stat_key = stat_key
+        # Edited outside of this process, so the palette has to be reapplied
+        self.colors_key = None
+
+    def colors_key_for(self, colors):
+        """The palette entries this target's output depends on, including the ones its markers name"""
+        colors_key = tuple(colors.get(key) for key in (*self.target.color_keys, *self.marker_keys))
+        if None in colors_key:
+            # Missing entries fall back to the nearest palette color, and slots like zebar's
+            # secondary-background are computed from the palette; both depend on all of it
+            colors_key += tuple(sorted(colors.items()))
+        return colors_key
+
+    def written(self, rendered, colors, label=None, write_time=None):
+        """Record that rendered replaced the content on disk at write_time and remember it"""
+        record_theme(self.name, self.path, self.content, rendered, colors, self.history, label, write_time)
+        stat = os.stat(self.path)
+        self.content = rendered
+        self.marker_keys = marker_keys(rendered)
+        self.stat_key = (stat.st_mtime_ns, stat.st_size)
+        self.colors_key = self.colors_key_for(colors)
+
+    def stage(self, colors, batch):
+        """Render the config into batch if its palette entries changed, return True if staged
+
+        The rendered text is kept in pending until the batch is committed.
+        """
+        self.refresh()
+        colors_key = self.colors_key_for(colors)
+        if colors_key == self.colors_key:
+            return False
+
+        rendered = self.target.render(self.content, colors)
+        if not batch.stage(self.path, self.content, rendered):
+            self.colors_key = colors_key
+            return False
+        self.pending = rendered
+        return True
+
+def apply_target(state, colors, batch):
+    """Render one target and stage its new config in batch, returning (status, detail)
+
+    WRITTEN here means staged; apply_theme renames it into place.
+    """
+    # A target that timed out earlier may still be running in its worker thread
+    if not state.lock.acquire(blocking=False):
+        return SKIPPED, "previous update still running"
+    try:
+        if state.stage(colors, batch):
+            return WRITTEN, None
+        return UNCHANGED, None
+    except FileNotFoundError:
+        return SKIPPED, f"{state.path} not found"
+    except Exception as e:
+        return FAILED, str(e)
+    finally:
+        state.lock.release()
+
+def apply_theme(states, colors, executor, timeout=None, label=None, transition=None):
+    """Apply the palette to all targets concurrently, returning {name: (status, detail)}
+
+    Every target gets the same deadline, so one slow or hung config does
+    not delay reporting the others. New configs are staged next to the live
+    ones and renamed into place one after another once every target has
+    rendered; if any target failed or timed out nothing is renamed, so the
+    configs never end up with half a theme.
+
+    transition is (old_colors, seconds, fps) to animate the targets that
+    reload live: the others are renamed into place first, and the staged
+    render of an animated target is renamed in from the same batch as its
+    last frame.
+    """
+    batch = WriteBatch()
+    futures = {state.name: executor.submit(apply_target, state, colors, batch) for state in states}
+    deadline = None if timeout is None else time.monotonic() + timeout
+
+    results = {}
+    for state in states:
+        future = futures[state.name]
+        remaining = None if deadline is None else max(0, deadline - time.monotonic())
+        try:
+            results[state.name] = future.result(timeout=remaining)
+        except concurrent.futures.TimeoutError:
+            results[state.name] = (TIMED_OUT, f"no result after {timeout:g}s")
+            # Whatever it stages once it finishes is never committed
+            future.add_done_callback(lambda _, path=state.path: batch.discard(path))
+
+    failed = [name for name, (status, _) in results.items() if status in (FAILED, TIMED_OUT)]
+    if failed:
+        batch.abort()
+        for state in states:
+            if results[state.name][0] == WRITTEN:
+                results[state.name] = (SKIPPED, f"not written since {', '.join(failed)} failed")
+                state.pending = None
+        return results
+
+    animated = []
+    if transition is not None:
+        animated = [state for state in states if state.target.animate and results[state.name][0] == WRITTEN]
+    errors = batch.commit(hold=[state.path for state in animated])
+    try:
+        if animated:
+            old_colors, duration, fps = transition
+            animate_theme(animated, old_colors, colors, duration, fps)
+    finally:
+        errors.update(batch.commit())
+        for state in states:
+            if results[state.name][0] != WRITTEN:
+                continue
+            if state.path in errors:
+                results[state.name] = (FAILED, str(errors[state.path]))
+            else:
+                state.written(state.pending, colors, label, batch.write_times.get(state.path))
+            state.pending = None
+    return results
+
+def animate_theme(states, old_colors, colors, duration, fps):
+    """Stream frames from old_colors towards the staged render of each target
+
+    Marked configs (or ones that can be marked) render each frame by filling
+    their cached slots; the template offsets stay in memory so frames don't
+    rewrite the template cache. The last frame is not written here: it is
+    the staged normal render, which apply_theme renames into place, so the
+    result is the same as without a transition. A config whose marked copy
+    would render differently is animated from the original instead.
+    """
+    animated = []
+    for state in states:
+        if not state.lock.acquire(blocking=False):
+            continue
+        base = state.content
+        mark = state.target.mark
+        if mark is not None and not compile_template(base):
+            with memory_cache():
+                marked = mark(base, colors)
+                # Frames from a base that renders differently would snap to the real theme at the end
+                if strip_markers(state.target.render(marked, colors)) == state.pending:
+                    base = marked
+        animated.append((state, base))
+    if not animated:
+        return
+
+    writers = {state.name: CoalescingWriter(state.path, state.content, 1 / fps) for state, _ in animated}
+    failed = {}
+
+    def render_frame(frame_colors):
+        if frame_colors is colors:
+            return
+        for state, base in animated:
+            if state.name in failed:
+                continue
+            try:
+                writers[state.name].submit(state.target.render(base, frame_colors))
+            except Exception as e:
+                failed[state.name] = str(e)
+
+    try:
+        with memory_cache():
+            palettes = transition_palettes(old_colors, colors, max(1, round(duration * fps)))
+            rendered, skipped, elapsed = run_frames(palettes, render_frame, fps)
+    finally:
+        for writer in writers.values():
+            writer.close()
+        for state, _ in animated:
+            state.lock.release()
+
+    print(f"Transition: {rendered}/{len(palettes)} frames rendered in {elapsed:.2f} s "
+          f"({rendered / elapsed if elapsed else 0:.1f} fps, {skipped} skipped)")
+    for state, _ in animated:
+        writer = writers[state.name]
+        print(f"  {state.name}: {writer.writes} writes, {writer.dropped} frames dropped "
+              f"({writer.writes / elapsed if elapsed else 0:.1f} fps)")
+        error = failed.get(state.name) or writer.error
+        if error is not None:
+            print(f"  {state.name}: transition stopped ({error})")
+
+def exit_status(results):
+    """Aggregate per-target results into a process exit status"""
+    return 1 if any(status in (FAILED, TIMED_OUT) for status, _ in results.values()) else 0
+
+class InotifyWatcher:
+    """Wait for colors.json to be rewritten using Linux inotify"""
+
+    def __init__(self, colors_path):
+        libc_name = ctypes.util.find_library('c')
+        if not libc_name:
+            raise OSError("libc not found")
+        libc = ctypes.CDLL(libc_name, use_errno=True)
+        if not hasattr(libc, 'inotify_init1'):
+            raise OSError("inotify is not available")
+
+        self.name = os.fsencode(Path(colors_path).name)
+        self.fd = libc.inotify_init1(IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+
+        # Watch the directory since wal may replace colors.json instead of rewriting it
+        directory = os.fsencode(str(Path(colors_path).parent))
+        if libc.inotify_add_watch(self.fd, directory, IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE) < 0:
+            os.close(self.fd)
+            raise OSError(ctypes.get_errno(), "inotify_add_watch failed")
+
+    def wait(self, timeout=None):
+        """Block until colors.json changes or timeout seconds pass, return True on change"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            remaining = None if deadline is None else max(0, deadline - time.monotonic())
+            ready, _, _ = select.select([self.fd], [], [], remaining)
+            if not ready:
+                return False
+
+            data = os.read(self.fd, 4096)
+            offset = 0
+            while offset < len(data):
+                _, _, _, name_len = INOTIFY_EVENT.unpack_from(data, offset)
+                start = offset + INOTIFY_EVENT.size
+                name = data[start:start + name_len].rstrip(b'\0')
+                offset = start + name_len
+                if name == self.name:
+                    return True
+
+class PollingWatcher:
+    """Wait for colors.json to change by polling its mtime and size"""
+
+    def __init__(self, colors_path, interval):
+        self.colors_path = colors_path
+        self.interval = interval
+        self.stat_key = self._stat_key()
+
+    def _stat_key(self):
+        try:
+            stat = os.stat(self.colors_path)
+            return (stat.st_mtime_ns, stat.st_size)
+        except OSError:
+            return None
+
+    def wait(self, timeout=None):
+        """Block until colors.json changes or timeout seconds pass, return True on change"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            stat_key = self._stat_key()
+            if stat_key != self.stat_key:
+                self.stat_key = stat_key
+                return True
+
+            if deadline is not None:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                time.sleep(min(self.interval, remaining))
+            else:
+                time.sleep(self.interval)
+
+def make_watcher(colors_path, poll_interval):
+    """Prefer inotify and fall back to polling where it is unavailable"""
+    if sys.platform.startswith('linux'):
+        try:
+            return InotifyWatcher(colors_path)
+        except OSError as e:
+            print(f"inotify unavailable ({e}), falling back to polling")
+    return PollingWatcher(colors_path, poll_interval)
+
+def apply_and_report(states, colors_path, executor, timeout=None, report_latency=False, transition=None):
+    """Load the palette once, apply it to every target, and print a summary
+
+    transition is (seconds, fps) to animate from the previously loaded palette.
+    """
+    started = time.monotonic()
+    # The palette cache still holds the theme we are switching away from
+    previous = cached_palette(colors_path) if transition else None
+    try:
+        palette = load_palette_with_fallback(colors_path)
+    except (OSError, json.JSONDecodeError) as e:
+        print(f"Error loading palette from {colors_path}: {e}")
+        return None
+
+    colors = palette.flat()
+    if previous is not None and previous.flat() != colors:
+        transition = (previous.flat(), *transition)
+    else:
+        transition = None
+    results = apply_theme(states, colors, executor, timeout, palette_label(palette), transition)
+    written_at = time.time()
+    elapsed_ms = (time.monotonic() - started) * 1000
+
+    for name, (status, detail) in results.items():
+        if status not in (WRITTEN, UNCHANGED):
+            print(f"  {name}: {status} ({detail})")
+
+    changed = [name for name, (status, _) in results.items() if status == WRITTEN]
+    if not changed:
+        print(f"Palette unchanged for all targets ({elapsed_ms:.1f} ms)")
+        return results
+
+    latency = ""
+    if report_latency:
+        try:
+            since_change_ms = (written_at - os.stat(colors_path).st_mtime) * 1000
+            latency = f", {since_change_ms:.1f} ms after colors.json changed"
+        except OSError:
+            pass
+    unchanged = [name for name, (status, _) in results.items() if status == UNCHANGED]
+    skipped_writes = f" (unchanged: {', '.join(unchanged)})" if unchanged else ""
+    print(f"Applied theme to {', '.join(changed)}{skipped_writes} in {elapsed_ms:.1f} ms{latency}")
+    return results
+
+def mark_templates(states, colors_path):
+    """Mark the color slots of every supported target so later applies use template mode"""
+    palette = load_palette_with_fallback(colors_path)
+    colors = palette.flat()
+    results = {}
+    staged = {}
+    batch = WriteBatch()
+    try:
+        for state in states:
+            mark = state.target.mark
+            if mark is None:
+                continue
+            try:
+                state.refresh()
+            except FileNotFoundError:
+                print(f"Skipping {state.name}: {state.path} not found")
+                continue
+
+            marked = mark(state.content, colors)
+            results[state.name] = batch.stage(state.path, state.content, marked)
+            if results[state.name]:
+                staged[state.name] = marked
+            print(f"{state.name}: {len(compile_template(marked))} color slots marked")
+    except BaseException:
+        batch.abort()
+        raise
+
+    errors = batch.commit()
+    for state in states:
+        if state.name not in staged:
+            continue
+        if state.path in errors:
+            print(f"Error writing {state.path}: {errors[state.path]}")
+            results[state.name] = False
+        else:
+            record_theme(state.name, state.path, state.content, staged[state.name], colors, state.history,
+                         palette_label(palette), batch.write_times.get(state.path))
+    print_change_summary(results)
+
+def watch(states, colors_path, executor, timeout, debounce, poll_interval, transition=None):
+    """Stay resident and reapply the theme whenever colors.json is rewritten"""
+    watcher = make_watcher(colors_path, poll_interval)
+    print(f"Watching {colors_path} with {type(watcher).__name__} (Ctrl+C to stop)")
+    apply_and_report(states, colors_path, executor, timeout, transition=transition)
+
+    while True:
+        if not watcher.wait():
+            continue
+        # wal writes in bursts; wait for the file to settle before reapplying
+        while watcher.wait(debounce):
+            pass
+        apply_and_report(states, colors_path, executor, timeout, report_latency=True, transition=transition)
+
+def main():
+    home_dir = Path.home()
+    targets = theme_targets(home_dir)
+
+    parser = argparse.ArgumentParser(description="Apply the winwal palette to every themed config that exists")
+    parser.add_argument('--target', action='append', choices=list(targets),
+                        help="only apply to this target (repeatable); by default every target whose config exists")
+    parser.add_argument('--timeout', type=float, default=10.0, help="seconds to wait for each target (default: 10)")
+    parser.add_argument('--mark-templates', action='store_true', help="mark the color slots in the configs for template mode")
+    parser.add_argument('--list-history', action='store_true', help="list the recorded themes, newest first")
+    parser.add_argument('--rollback', type=int, metavar='N', help="restore the theme N entries back in the history")
+    parser.add_argument('--watch', action='store_true', help="stay resident and reapply when colors.json changes")
+    parser.add_argument('--debounce', type=float, default=0.2, help="seconds of quiet before reapplying (default: 0.2)")
+    parser.add_argument('--poll-interval', type=float, default=0.5, help="polling interval without inotify (default: 0.5)")
+    parser.add_argument('--transition', type=float, metavar='SECONDS',
+                        help="animate from the previous palette to yasb, Zebar and komorebi over SECONDS")
+    parser.add_argument('--fps', type=float, default=10.0, help="transition frame rate (default: 10)")
+    args = parser.parse_args()
+    if args.fps <= 0:
+        parser.error("--fps must be positive")
+    transition = (args.transition, args.fps) if args.transition and args.transition > 0 else None
+
+    colors_path = home_dir / ".cache" / "wal" / "colors.json"
+    history = ThemeHistory()
+
+    if args.list_history:
+        list_history(history)
+        return 0
+
+    if args.rollback is not None:
+        try:
+            restored = rollback(history, args.rollback)
+        except (IndexError, OSError) as e:
+            print(f"Error: cannot roll back {args.rollback} entries: {e}")
+            return 1
+        print(f"Rolled back {', '.join(restored)}" if restored else "Already at that theme")
+        return 0
+
+    # Targets without a config are left out unless asked for, so their modules are never imported
+    states = [TargetState(target, history) for name, target in targets.items()
+              if (name in args.target if args.target else target.path.exists())]
+    if not states:
+        print("Error: none of the themed configs exist")
+        return 1
+    executor = concurrent.futures.ThreadPoolExecutor(max_workers=len(states), thread_name_prefix="apply-theme")
+
+    if args.mark_templates:
+        try:
+            mark_templates(states, colors_path)
+        except (OSError, json.JSONDecodeError) as e:
+            print(f"Error: cannot mark templates: {e}")
+            return 1
+        return 0
+
+    if args.watch:
+        try:
+            watch(states, colors_path, executor, args.timeout, args.debounce, args.poll_interval, transition)
+        except KeyboardInterrupt:
+            print("Stopped watching")
+        return 0
+
+    if not colors_path.exists():
+        print(f"Error: winwal colors file not found at {colors_path}")
+        return 1
+
+    results = apply_and_report(states, colors_path, executor, args.timeout, transition=transition)
+    if results is None:
+        return 1
+
+    status = exit_status(results)
+    executor.shutdown(wait=False, cancel_futures=True)
+    if any(result == TIMED_OUT for result, _ in results.values()):
+        # Worker threads cannot be interrupted; don't let a hung target block interpreter exit
+        sys.stdout.flush()
+        os._exit(status)
+    return status
+
+if __name__ == "__main__":
+    sys.exit(main())
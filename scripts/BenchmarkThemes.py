@@ -0,0 +1,280 @@
+#!/usr/bin/env python3
+# filepath: BenchmarkThemes.py
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import re
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+import jsonc
+
+REPO_DIR = Path(__file__).resolve().parent.parent
+
+# The parts of GlazeWM's and Zebar's starter configs the updaters touch;
+# neither file is checked in, so the fixtures are grown from these.
+GLAZEWM_BASE = """general:
+  # Commands to run when the WM has started.
+  startup_commands: ['shell-exec zebar']
+  focus_follows_cursor: false
+
+gaps:
+  inner_gap: '20px'
+  outer_gap:
+    top: '60px'
+    right: '20px'
+    bottom: '20px'
+    left: '20px'
+
+window_effects:
+  # Visual effects to apply to the focused window.
+  focused_window:
+    # Highlight the window with a colored border.
+    # ** Exclusive to Windows 11 due to API limitations.
+    border:
+      enabled: true
+      color: "#8dbcff"
+
+    # Remove the title bar from the window's frame.
+    hide_title_bar:
+      enabled: false
+
+  # Visual effects to apply to non-focused windows.
+  other_windows:
+    border:
+      enabled: true
+      color: "#a1a1a1"
+    hide_title_bar:
+      enabled: false
+
+keybindings:
+"""
+
+GLAZEWM_KEYBINDING = """  # Focus workspace {n}.
+  - commands: ['focus --workspace {n}']
+    bindings: ['alt+{n}']
+  - commands: ['move --workspace {n}', 'focus --workspace {n}']
+    bindings: ['alt+shift+{n}']
+"""
+
+ZEBAR_BASE = """/**
+ * Import the Nerdfonts icon font.
+ */
+@import 'https://www.nerdfonts.com/assets/css/webfont.css';
+
+.app {
+  display: grid;
+  grid-template-columns: 1fr 1fr 1fr;
+  align-items: center;
+  height: 40px;
+  color: rgb(255 255 255 / 90%);
+  font-family: ui-monospace, monospace;
+  font-size: 12px;
+  padding: 4px 24px;
+  background: linear-gradient(rgb(0 0 0 / 90%), rgb(5 2 20 / 85%));
+}
+
+body {
+  color: rgb(255 255 255 / 90%);
+}
+
+i {
+  color: rgb(115 130 175 / 95%);
+  margin-right: 7px;
+}
+
+.workspace {
+  background: rgb(255 255 255 / 5%);
+  margin-right: 4px;
+  padding: 4px 8px;
+  color: #ffffffe6;
+  border: none;
+  border-radius: 2px;
+  cursor: pointer;
+
+  &.displayed {
+    background: rgb(255 255 255 / 15%);
+  }
+
+  &.focused,
+  &:hover {
+    background: rgb(75 115 255 / 50%);
+  }
+}
+"""
+
+ZEBAR_RULE = """
+.widget-{n} {{
+  color: rgb(255 255 255 / 90%);
+  padding: 0 {n}px;
+  border-radius: 2px;
+}}
+"""
+
+PALETTE = {
+    "wallpaper": "C:\\Users\\bench\\Pictures\\walls\\bench.png",
+    "special": {"background": "#0F3558", "foreground": "#c9e5eb", "cursor": "#c9e5eb"},
+    "colors": {
+        "color0": "#0F3558", "color1": "#288CB0", "color2": "#24ABD3", "color3": "#24ABD3",
+        "color4": "#63B2CD", "color5": "#9DACBB", "color6": "#9DACBB", "color7": "#c9e5eb",
+        "color8": "#8ca0a4", "color9": "#288CB0", "color10": "#24ABD3", "color11": "#24ABD3",
+        "color12": "#63B2CD", "color13": "#9DACBB", "color14": "#9DACBB", "color15": "#c9e5eb",
+    },
+}
+
+CSS_RULE = re.compile(r'[^{}]+\{[^{}]*\}')
+
+def scale_yasb(base, scale):
+    """Repeat every rule of the checked-in stylesheet under renamed selectors"""
+    rules = CSS_RULE.findall(base)
+    parts = [base]
+    for n in range(1, scale):
+        parts.extend(re.sub(r'([.#][\w-]+)', rf'\1-{n}', rule, count=1) for rule in rules)
+    return ''.join(parts)
+
+def scale_komorebi(base, scale):
+    """Give the checked-in komorebi.json scale monitors with ten workspaces each"""
+    config = jsonc.loads(base)
+    layouts = ["BSP", "VerticalStack", "HorizontalStack", "UltrawideVerticalStack", "Rows"]
+    config["monitors"] = [
+        {"workspaces": [{"name": f"{m}-{w}", "layout": layouts[w % len(layouts)]} for w in range(10)]}
+        for m in range(scale)
+    ]
+    return json.dumps(config, indent='\t')
+
+def scale_glazewm(scale):
+    return GLAZEWM_BASE + ''.join(GLAZEWM_KEYBINDING.format(n=n) for n in range(10 * scale))
+
+def scale_zebar(scale):
+    return ZEBAR_BASE + ''.join(ZEBAR_RULE.format(n=n) for n in range(10 * (scale - 1)))
+
+def percentile(sorted_values, fraction):
+    """Nearest-rank percentile of an already sorted list"""
+    index = max(0, min(len(sorted_values) - 1, round(fraction * len(sorted_values) + 0.5) - 1))
+    return sorted_values[index]
+
+def measure(setup, run, runs):
+    """Time run() runs times after setup() each, then once more under tracemalloc for the peak"""
+    timings = []
+    for _ in range(runs):
+        setup()
+        started = time.perf_counter()
+        run()
+        timings.append((time.perf_counter() - started) * 1000)
+
+    setup()
+    tracemalloc.start()
+    run()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    timings.sort()
+    return {
+        "runs": runs,
+        "min_ms": timings[0],
+        "p50_ms": percentile(timings, 0.50),
+        "p90_ms": percentile(timings, 0.90),
+        "p99_ms": percentile(timings, 0.99),
+        "max_ms": timings[-1],
+        "peak_kib": peak / 1024,
+    }
+
+def peak_rss_kib():
+    """Peak resident set size of this process so far, or None where unknown"""
+    try:
+        import resource
+    except ImportError:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss // 1024 if sys.platform == 'darwin' else rss
+
+def benchmark(home_dir, scales, runs, templates=False):
+    """Run every updater against fixtures of each scale under home_dir, return the result rows"""
+    # Imported only now, as the updaters resolve their cache and history paths from HOME at import
+    from UpdateGlazeColors import mark_glazewm, mark_zebar_css, update_glazewm, update_zebar_css
+    from UpdateKomorebiColors import update_komorebi
+    from UpdateYasbColors import mark_yasb_css, update_yasb_css
+    from wal_palette import load_palette
+
+    colors_path = home_dir / ".cache" / "wal" / "colors.json"
+    colors_path.parent.mkdir(parents=True, exist_ok=True)
+    colors_path.write_text(json.dumps(PALETTE, indent=4), encoding='utf-8')
+    colors = load_palette(colors_path).flat()
+
+    yasb_base = (REPO_DIR / "yasb" / "styles.css").read_text(encoding='utf-8')
+    komorebi_base = (REPO_DIR / "komorebi" / "komorebi.json").read_text(encoding='utf-8')
+    config_dir = home_dir / "bench"
+    config_dir.mkdir(exist_ok=True)
+
+    targets = [
+        ("yasb", lambda scale: scale_yasb(yasb_base, scale), mark_yasb_css,
+         lambda path, text: update_yasb_css(path, colors)),
+        ("glazewm", scale_glazewm, mark_glazewm,
+         lambda path, text: update_glazewm(path, colors)),
+        ("zebar", scale_zebar, mark_zebar_css,
+         lambda path, text: update_zebar_css(path, colors)),
+        # The komorebi script reads and validates the file itself before patching
+        ("komorebi", lambda scale: scale_komorebi(komorebi_base, scale), None,
+         lambda path, text: update_komorebi(path, text, colors)),
+    ]
+
+    results = []
+    for scale in scales:
+        for name, generate, mark, update in targets:
+            fixture = generate(scale)
+            if templates and mark is not None:
+                fixture = mark(fixture, {})
+            path = config_dir / f"{name}-{scale}"
+
+            def setup():
+                path.write_text(fixture, encoding='utf-8')
+
+            def run():
+                with contextlib.redirect_stdout(io.StringIO()):
+                    update(path, fixture)
+
+            row = {"target": name, "scale": scale, "bytes": len(fixture.encode('utf-8'))}
+            row.update(measure(setup, run, runs))
+            results.append(row)
+            print(f"  {name:<9} x{scale:<5} {row['bytes'] / 1024:9.1f} KiB  "
+                  f"min {row['min_ms']:8.2f}  p50 {row['p50_ms']:8.2f}  p90 {row['p90_ms']:8.2f}  "
+                  f"p99 {row['p99_ms']:8.2f}  max {row['max_ms']:8.2f} ms  peak {row['peak_kib']:9.1f} KiB")
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the theme updaters on scaled synthetic configs")
+    parser.add_argument('--scales', type=int, nargs='+', default=[1, 20, 200],
+                        help="fixture scale factors; 200 grows yasb/styles.css past 10k rules (default: 1 20 200)")
+    parser.add_argument('--runs', type=int, default=20, help="timed runs per updater and scale (default: 20)")
+    parser.add_argument('--templates', action='store_true', help="mark the fixtures for template mode first")
+    parser.add_argument('--json', metavar='FILE', help="also write the results as JSON")
+    args = parser.parse_args()
+    if args.runs < 1 or min(args.scales) < 1:
+        parser.error("--runs and --scales must be at least 1")
+
+    with tempfile.TemporaryDirectory(prefix="theme-bench-") as home:
+        # Never touch the real ~/.config or ~/.cache
+        os.environ["HOME"] = os.environ["USERPROFILE"] = home
+        print(f"Benchmarking {'template' if args.templates else 'regex'} mode, {args.runs} runs each (times in ms)")
+        results = benchmark(Path(home), args.scales, args.runs, args.templates)
+
+    rss = peak_rss_kib()
+    if rss is not None:
+        print(f"Peak RSS: {rss / 1024:.1f} MiB")
+
+    if args.json:
+        report = {"python": sys.version.split()[0], "platform": sys.platform, "templates": args.templates,
+                  "runs": args.runs, "peak_rss_kib": rss, "results": results}
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+        print(f"Results written to {args.json}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
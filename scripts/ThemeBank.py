@@ -0,0 +1,238 @@
+#!/usr/bin/env python3
+# filepath: ThemeBank.py
+
+import argparse
+import concurrent.futures
+import hashlib
+import json
+import shutil
+import sys
+from pathlib import Path
+
+from ApplyTheme import theme_targets
+from color_math import derive_many
+from theme_history import ThemeHistory, palette_key
+from theme_io import WriteBatch, atomic_write, content_hash
+from wal_palette import parse_palette
+
+BANK_DIR = Path.home() / ".cache" / "wal" / "theme-bank"
+
+def theme_dir(bank_dir, name):
+    """Where a compiled theme lives; kept apart from base/ and manifest.json, whatever its name"""
+    return bank_dir / "themes" / name
+
+def find_palettes(source_dir):
+    """Return {theme name: colors.json path} for *.json and */colors.json under source_dir"""
+    source_dir = Path(source_dir)
+    palettes = {}
+    for path in sorted(source_dir.glob('*.json')):
+        palettes[path.stem] = path
+    for path in sorted(source_dir.glob('*/colors.json')):
+        palettes[path.parent.name] = path
+    return palettes
+
+def load_manifest(bank_dir):
+    try:
+        with open(bank_dir / "manifest.json", 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {"themes": {}}
+
+def save_manifest(bank_dir, manifest):
+    atomic_write(bank_dir / "manifest.json", json.dumps(manifest, indent=1).encode('utf-8'))
+
+def rebase(bank_dir, targets):
+    """Copy the live configs into the bank as the base every theme is rendered from"""
+    base_dir = bank_dir / "base"
+    base_dir.mkdir(parents=True, exist_ok=True)
+    for name, target in targets.items():
+        if target.path.exists():
+            shutil.copy2(target.path, base_dir / f"{name}{target.path.suffix}")
+            print(f"Captured {name} base from {target.path}")
+        else:
+            print(f"Skipping {name}: {target.path} not found")
+
+def read_bases(bank_dir, targets):
+    """Return {target: base config text} from the bank's base directory"""
+    bases = {}
+    for name, target in targets.items():
+        base_path = bank_dir / "base" / f"{name}{target.path.suffix}"
+        if base_path.exists():
+            with open(base_path, 'r') as f:
+                bases[name] = f.read()
+    return bases
+
+def render_theme(theme_dir, palette_raw, bases, home_dir):
+    """Render every target for one palette into theme_dir, return its manifest entry
+
+    Runs in a worker process when building with --jobs, so it only takes
+    plain data and looks the render functions up itself.
+    """
+    targets = theme_targets(Path(home_dir))
+    palette = parse_palette(palette_raw)
+    colors = palette.flat()
+
+    theme_dir = Path(theme_dir)
+    theme_dir.mkdir(parents=True, exist_ok=True)
+    outputs = {}
+    for name, base in bases.items():
+        target = targets[name]
+        rendered = target.render(base, colors)
+        atomic_write(theme_dir / f"{name}{target.path.suffix}", rendered)
+        outputs[name] = content_hash(rendered)
+
+    return {"colors": colors, "wallpaper": palette.wallpaper, "outputs": outputs}
+
+def build(bank_dir, source_dir, targets, home_dir, jobs=1):
+    """Render every palette in source_dir, regenerating only changed entries"""
+    if not (bank_dir / "base").exists():
+        rebase(bank_dir, targets)
+
+    bases = read_bases(bank_dir, targets)
+    base_hashes = {name: content_hash(text) for name, text in bases.items()}
+    manifest = load_manifest(bank_dir)
+    themes = manifest.setdefault("themes", {})
+
+    palettes = find_palettes(source_dir)
+    pending = {}
+    for name, path in palettes.items():
+        with open(path, 'rb') as f:
+            raw = f.read()
+        palette_sha = hashlib.sha256(raw).hexdigest()
+
+        entry = themes.get(name)
+        if (entry and entry.get("palette_sha") == palette_sha and entry.get("bases") == base_hashes
+                and theme_dir(bank_dir, name).is_dir()):
+            continue
+        pending[name] = (str(path), palette_sha, raw)
+
+    # Drop themes whose palette file is gone
+    for name in set(themes) - set(palettes):
+        shutil.rmtree(theme_dir(bank_dir, name), ignore_errors=True)
+        del themes[name]
+        print(f"Removed {name}")
+
+    def finish(name, entry):
+        source, palette_sha, _ = pending[name]
+        entry.update({"source": source, "palette_sha": palette_sha, "bases": base_hashes})
+        themes[name] = entry
+        print(f"Built {name}")
+
+    if jobs > 1 and len(pending) > 1:
+        with concurrent.futures.ProcessPoolExecutor(max_workers=jobs) as executor:
+            futures = {
+                executor.submit(render_theme, str(theme_dir(bank_dir, name)), palette_raw, bases, str(home_dir)): name
+                for name, (_, _, palette_raw) in pending.items()
+            }
+            for future in concurrent.futures.as_completed(futures):
+                name = futures[future]
+                try:
+                    finish(name, future.result())
+                except Exception as e:
+                    print(f"Error building {name}: {e}")
+    else:
+        # Derive every palette's shades in one batch so the renderers only look them up
+        palettes = []
+        for _, _, palette_raw in pending.values():
+            try:
+                palettes.append(parse_palette(palette_raw).flat())
+            except ValueError:
+                pass  # reported by render_theme below
+        derive_many(palettes)
+
+        for name, (_, _, palette_raw) in pending.items():
+            try:
+                finish(name, render_theme(theme_dir(bank_dir, name), palette_raw, bases, home_dir))
+            except Exception as e:
+                print(f"Error building {name}: {e}")
+
+    save_manifest(bank_dir, manifest)
+    print(f"Theme bank up to date: {len(themes)} themes, {len(pending)} rebuilt")
+
+def switch(bank_dir, name, targets, use_symlinks=False):
+    """Swap the live configs to a compiled theme with one rename per target"""
+    manifest = load_manifest(bank_dir)
+    entry = manifest.get("themes", {}).get(name)
+    if entry is None:
+        print(f"Error: theme {name} is not in the bank; run build first")
+        return 1
+
+    history = ThemeHistory()
+    staged = {}
+    batch = WriteBatch()
+    try:
+        for target, output_hash in entry["outputs"].items():
+            live_path = targets[target].path
+            compiled_path = theme_dir(bank_dir, name) / f"{target}{live_path.suffix}"
+
+            try:
+                with open(live_path, 'r') as f:
+                    current = f.read()
+            except FileNotFoundError:
+                current = None
+            if current is not None and content_hash(current) == output_hash:
+                continue
+
+            with open(compiled_path, 'r') as f:
+                compiled = f.read()
+            if use_symlinks:
+                batch.stage_symlink(live_path, compiled_path.resolve())
+            else:
+                batch.stage(live_path, "" if current is None else current, compiled)
+            staged[target] = (live_path, current, compiled)
+    except BaseException:
+        batch.abort()
+        raise
+
+    # Every target is staged, so the live configs switch over in one run of renames
+    errors = batch.commit()
+    for target, (live_path, current, compiled) in staged.items():
+        if live_path in errors:
+            print(f"Error switching {target}: {errors[live_path]}")
+            continue
+        if current is not None:
+            history.record(target, live_path, current, compiled, palette_key(entry["colors"]), name,
+                           batch.write_times.get(live_path))
+        print(f"Switched {target} to {name}")
+    return 1 if errors else 0
+
+def list_themes(bank_dir):
+    themes = load_manifest(bank_dir).get("themes", {})
+    if not themes:
+        print("Theme bank is empty")
+    for name, entry in sorted(themes.items()):
+        print(f"{name}  [{', '.join(sorted(entry['outputs']))}]  {entry['source']}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Precompile pywal palettes into a bank of ready-to-switch configs")
+    parser.add_argument('--bank', type=Path, default=BANK_DIR, help=f"bank directory (default: {BANK_DIR})")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    build_parser = commands.add_parser('build', help="render every colors.json in a directory into the bank")
+    build_parser.add_argument('source_dir', type=Path, help="directory of *.json or */colors.json palettes")
+    build_parser.add_argument('--jobs', '-j', type=int, default=1, help="worker processes (default: 1)")
+
+    switch_parser = commands.add_parser('switch', help="swap the live configs to a compiled theme")
+    switch_parser.add_argument('name', help="theme name, from the palette file or directory name")
+    switch_parser.add_argument('--symlink', action='store_true', help="link live configs to the bank instead of copying")
+
+    commands.add_parser('rebase', help="capture the live configs as the base for future builds")
+    commands.add_parser('list', help="list compiled themes")
+    args = parser.parse_args()
+
+    home_dir = Path.home()
+    targets = theme_targets(home_dir)
+    args.bank.mkdir(parents=True, exist_ok=True)
+
+    if args.command == 'build':
+        build(args.bank, args.source_dir, targets, home_dir, args.jobs)
+    elif args.command == 'switch':
+        return switch(args.bank, args.name, targets, args.symlink)
+    elif args.command == 'rebase':
+        rebase(args.bank, targets)
+    elif args.command == 'list':
+        list_themes(args.bank)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
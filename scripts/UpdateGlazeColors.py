@@ -3,14 +3,40 @@
 
 import json
 import os
-import shutil
 import re
 from pathlib import Path
 
-def hex_to_rgb(hex_color):
-    """Convert hex color to RGB tuple"""
-    hex_color = hex_color.lstrip('#')
-    return tuple(int(hex_color[i:i+2], 16) for i in (0, 2, 4))
+from color_math import derive, format_css_rgb
+from css_stream import STREAM_THRESHOLD, update_css_file
+from theme_history import ThemeHistory, palette_label, record_theme
+from theme_io import print_change_summary, write_if_changed
+from theme_template import css_marker, fill_markers, render_template, yaml_marker
+from theme_trace import TRACE, run_main
+from wal_sequences import load_palette_with_fallback
+from yaml_index import index_yaml, set_yaml_values
+
+# Palette entries each renderer reads, used to skip targets whose colors did not change
+GLAZEWM_COLOR_KEYS = ('color4', 'color8')
+ZEBAR_COLOR_KEYS = ('color4', 'background', 'foreground', 'color0')
+
+# Fallback colors for entries missing from the palette
+GLAZEWM_DEFAULTS = {'color4': '#0000FF', 'color8': '#A1A1A1'}
+ZEBAR_DEFAULTS = {'color4': '#4B73FF', 'background': '#000000', 'foreground': '#FFFFFF', 'color0': '#050214'}
+
+# config.yaml key path -> palette key; theming another GlazeWM key is one more line here
+GLAZEWM_PATHS = {
+    'window_effects.focused_window.border.color': 'color4',
+    'window_effects.other_windows.border.color': 'color8',
+}
+
+# (pattern up to the rgb() value, palette key, alpha percent) for the Zebar starter styles
+ZEBAR_SLOTS = [
+    (r'i \{\s*color: ', 'color4', 95),
+    (r'body \{\s*color: ', 'foreground', 90),
+    (r'background: linear-gradient\(', 'background', 90),
+    (r'background: linear-gradient\((?:/\*[^*]*\*/)?rgb\([^)]+\), ', 'secondary-background', 85),
+    (r'&\.focused,\s*&:hover\s*\{\s*background: ', 'color4', 50),
+]
 
 def main():
     # Get home directory
@@ -34,185 +60,193 @@ def main():
         print(f"Error: Zebar CSS file not found at {zebar_css_path}")
         return
     
-    # Load pywal colors with error handling
+    # Load pywal colors (served from the shared palette cache when unchanged),
+    # falling back to the sequences file if colors.json cannot be parsed
     try:
-        # Read the file contents and fix any invalid escape sequences
-        with open(wal_colors_path, 'r') as f:
-            json_content = f.read()
-            
-        # Fix common issues with escape sequences
-        json_content = json_content.replace('\\', '\\\\')  # Double all backslashes
-        json_content = json_content.replace('\\\\\"', '\\"')  # Fix any already escaped quotes
-        json_content = json_content.replace('\\\\n', '\\n')  # Fix any already escaped newlines
-        
-        # Parse the fixed JSON content
-        wal_data = json.loads(json_content)
-        
-        # Extract colors
-        colors = {
-            'background': wal_data['special']['background'],
-            'foreground': wal_data['special']['foreground'],
-            'cursor': wal_data['special']['cursor'],
-            'color0': wal_data['colors']['color0'],
-            'color1': wal_data['colors']['color1'],
-            'color2': wal_data['colors']['color2'],
-            'color3': wal_data['colors']['color3'],
-            'color4': wal_data['colors']['color4'],
-            'color5': wal_data['colors']['color5'],
-            'color6': wal_data['colors']['color6'],
-            'color7': wal_data['colors']['color7'],
-            'color8': wal_data['colors']['color8'],
-            'color9': wal_data['colors']['color9'],
-            'color10': wal_data['colors']['color10'],
-            'color11': wal_data['colors']['color11'],
-            'color12': wal_data['colors']['color12'],
-            'color13': wal_data['colors']['color13'],
-            'color14': wal_data['colors']['color14'],
-            'color15': wal_data['colors']['color15'],
-        }
+        palette = load_palette_with_fallback(wal_colors_path)
+        colors = palette.flat()
+        label = palette_label(palette)
         
     except json.JSONDecodeError as e:
         print(f"Error parsing colors.json: {e}")
-        print("Trying alternative approach...")
-        
-        try:
-            # Alternative approach: read colors directly from sequences file
-            colors_file = home_dir / ".cache" / "wal" / "sequences"
-            if colors_file.exists():
-                with open(colors_file, 'r') as f:
-                    sequences = f.read()
-                
-                # Extract colors from sequences (simplified fallback)
-                color_matches = re.findall(r'\]10;(#[0-9A-Fa-f]{6})', sequences)
-                if color_matches and len(color_matches) >= 2:
-                    colors = {
-                        'background': color_matches[0],
-                        'foreground': color_matches[1],
-                        'color4': color_matches[0],  # Use background as fallback
-                        'color8': "#a1a1a1",  # Default gray
-                    }
-                else:
-                    print("Could not extract sufficient colors from sequences file")
-                    return
-            else:
-                print(f"Alternative colors file not found at {colors_file}")
-                return
-        except Exception as e:
-            print(f"Error with alternative approach: {e}")
-            return
-    
-    # Update GlazeWM config
-    update_glazewm(glazewm_config_path, colors)
-    
-    # Update Zebar CSS
-    update_zebar_css(zebar_css_path, colors)
+        return
+    
+    # Update GlazeWM config and Zebar CSS
+    history = ThemeHistory()
+    print_change_summary({
+        "glazewm": update_glazewm(glazewm_config_path, colors, history, label),
+        "zebar": update_zebar_css(zebar_css_path, colors, history, label),
+    })
     
     print("To apply changes, reload GlazeWM (alt+shift+r) and restart Zebar")
 
-def update_glazewm(config_path, colors):
-    """Update GlazeWM config colors"""
-    # Create backup of GlazeWM config
-    backup_path = config_path.with_suffix('.yaml.bak')
-    shutil.copy2(config_path, backup_path)
-    print(f"Created backup at {backup_path}")
-    
+def _glazewm_values(colors):
+    derived = derive(colors)
+    return {key: derived.hex(key, default) for key, default in GLAZEWM_DEFAULTS.items()}
+
+def render_glazewm(glazewm_config, colors):
+    """Return the GlazeWM config text with the border colors updated"""
+    rendered = render_template(glazewm_config, colors, GLAZEWM_DEFAULTS)
+    if rendered is not None:
+        return rendered
+    
+    # Update the colors in place by key path, leaving comments and layout alone
+    TRACE.add(mode="yaml paths")
+    values = _glazewm_values(colors)
+    rendered, _ = set_yaml_values(glazewm_config, {path: values[key] for path, key in GLAZEWM_PATHS.items()})
+    return rendered
+
+def mark_glazewm(glazewm_config, colors):
+    """Mark the border color slots for template mode, applying colors at the same time"""
+    values = _glazewm_values(colors)
+    index = index_yaml(glazewm_config)
+    parts = []
+    pos = 0
+    for entry, key in sorted((index[path], key) for path, key in GLAZEWM_PATHS.items() if path in index):
+        # Keep the value quoted and put the marker right after it, ahead of any comment on the line
+        quote = entry.quote or '"'
+        parts.append(glazewm_config[pos:entry.start - len(entry.quote)])
+        parts.append(f'{quote}{values[key]}{quote} {yaml_marker(key)}')
+        pos = entry.end + len(entry.quote)
+    parts.append(glazewm_config[pos:])
+    return ''.join(parts)
+
+def update_glazewm(config_path, colors, history=None, label=None):
+    """Update GlazeWM config colors, return True if the file was rewritten"""
     # Extract specific colors for GlazeWM
-    focused_color = colors.get('color4', '#0000FF')
-    unfocused_color = colors.get('color8', '#A1A1A1')
+    values = _glazewm_values(colors)
+    focused_color = values['color4']
+    unfocused_color = values['color8']
     
     print(f"GlazeWM - Using colors:")
     print(f"  Focused window border: {focused_color}")
     print(f"  Unfocused window border: {unfocused_color}")
     
     # Read GlazeWM config
-    with open(config_path, 'r') as f:
-        glazewm_config = f.read()
-    
-    # Update the colors in the config using regex patterns
-    # Update focused window border color
-    glazewm_config = re.sub(
-        r'(focused_window:\s*\n\s*# Highlight.*\n\s*border:\s*\n\s*enabled:.*\n\s*color:) .*',
-        r'\1 "' + focused_color + '"',
-        glazewm_config
-    )
-    
-    # Update unfocused window border color
-    glazewm_config = re.sub(
-        r'(other_windows:\s*\n\s*border:\s*\n\s*enabled:.*\n\s*color:) .*',
-        r'\1 "' + unfocused_color + '"',
-        glazewm_config
-    )
-    
-    # Write updated config
-    with open(config_path, 'w') as f:
-        f.write(glazewm_config)
-    
+    with TRACE.span("read config", target="glazewm"):
+        with open(config_path, 'r') as f:
+            glazewm_config = f.read()
+        TRACE.add(bytes_read=len(glazewm_config.encode('utf-8')))
+    
+    index = index_yaml(glazewm_config)
+    for path in GLAZEWM_PATHS:
+        if path not in index:
+            print(f"  Warning: {path} not found in {config_path}")
+    
+    # Write updated config, snapshotting it in the theme history only if something changed
+    with TRACE.span("render", target="glazewm"):
+        rendered = render_glazewm(glazewm_config, colors)
+    write_time = write_if_changed(config_path, glazewm_config, rendered)
+    if write_time is None:
+        print(f"GlazeWM config already up to date")
+        return False
+    
+    record_theme("glazewm", config_path, glazewm_config, rendered, colors, history, label, write_time)
     print(f"Updated GlazeWM config with pywal colors")
+    return True
 
-def update_zebar_css(css_path, colors):
-    """Update Zebar CSS colors"""
-    # Create backup of Zebar CSS
-    backup_path = css_path.with_suffix('.css.bak')
-    shutil.copy2(css_path, backup_path)
-    print(f"Created backup at {backup_path}")
-    
+def zebar_secondary_background(derived):
+    """color0 as the lower gradient stop"""
+    return derived.rgb('color0', '#050214')
+
+def _zebar_values(colors):
+    """Return {slot: rgb() text} for every slot in ZEBAR_SLOTS"""
+    derived = derive(colors)
+    values = {}
+    for _, key, alpha in ZEBAR_SLOTS:
+        if key == 'secondary-background':
+            values[key, alpha] = format_css_rgb(zebar_secondary_background(derived), alpha)
+        else:
+            values[key, alpha] = derived.css_rgb(key, alpha, ZEBAR_DEFAULTS[key])
+    return values
+
+def render_zebar_css(css_content, colors):
+    """Return the Zebar CSS text with the accent, text and background colors updated"""
+    extra = {'secondary-background': zebar_secondary_background(derive(colors))}
+    rendered = render_template(css_content, colors, ZEBAR_DEFAULTS, extra)
+    if rendered is not None:
+        return rendered
+    
+    TRACE.add(mode="regex")
+    return _apply_zebar_slots(css_content, _zebar_values(colors))
+
+def _apply_zebar_slots(css_content, values):
+    for prefix, key, alpha in ZEBAR_SLOTS:
+        css_content, count = re.subn(
+            f'({prefix})rgb\\([^)]+\\)',
+            lambda m: m.group(1) + values[key, alpha],
+            css_content
+        )
+        TRACE.count("substitutions", count)
+    return css_content
+
+def mark_zebar_css(css_content, colors):
+    """Mark the color slots for template mode, applying colors at the same time"""
+    values = _zebar_values(colors)
+    for prefix, key, alpha in ZEBAR_SLOTS:
+        css_content = re.sub(
+            f'({prefix})rgb\\([^)]+\\)',
+            lambda m: m.group(1) + css_marker(key, f"rgb/{alpha}") + values[key, alpha],
+            css_content
+        )
+    return css_content
+
+def zebar_piece_renderer(colors):
+    """Return a css_stream render callback doing what render_zebar_css does to a whole stylesheet"""
+    values = _zebar_values(colors)
+    extra = {'secondary-background': zebar_secondary_background(derive(colors))}
+
+    def render(css_piece, template):
+        if template:
+            return fill_markers(css_piece, colors, ZEBAR_DEFAULTS, extra)[0]
+        return _apply_zebar_slots(css_piece, values)
+    return render
+
+def update_zebar_css(css_path, colors, history=None, label=None):
+    """Update Zebar CSS colors, return True if the file was rewritten"""
     # Extract colors we want to use for Zebar
-    accent_color_hex = colors.get('color4', '#4B73FF')  # Blue accent
-    accent_rgb = hex_to_rgb(accent_color_hex)
-    
-    background_color_hex = colors.get('background', '#000000')  # Background
-    background_rgb = hex_to_rgb(background_color_hex)
+    derived = derive(colors)
+    accent_color_hex = derived.hex('color4', '#4B73FF')  # Blue accent
+    accent_rgb = derived.rgb('color4', '#4B73FF')
     
-    foreground_color_hex = colors.get('foreground', '#FFFFFF')  # Foreground
-    foreground_rgb = hex_to_rgb(foreground_color_hex)
+    background_color_hex = derived.hex('background', '#000000')  # Background
+    background_rgb = derived.rgb('background', '#000000')
     
-    # Secondary background color - slightly lighter than background
-    secondary_bg_hex = colors.get('color0', '#050214')  # Usually color0 is dark background
-    secondary_bg_rgb = hex_to_rgb(secondary_bg_hex)
+    foreground_color_hex = derived.hex('foreground', '#FFFFFF')  # Foreground
+    foreground_rgb = derived.rgb('foreground', '#FFFFFF')
     
     print(f"Zebar - Using colors:")
     print(f"  Accent: {accent_color_hex} -> rgb({accent_rgb[0]}, {accent_rgb[1]}, {accent_rgb[2]})")
     print(f"  Background: {background_color_hex} -> rgb({background_rgb[0]}, {background_rgb[1]}, {background_rgb[2]})")
     print(f"  Foreground: {foreground_color_hex} -> rgb({foreground_rgb[0]}, {foreground_rgb[1]}, {foreground_rgb[2]})")
-    
+    text_contrast = derived.contrast('foreground', 'background', '#FFFFFF', '#000000')
+    print(f"  Text contrast: {text_contrast:.2f}:1" + (" (below WCAG AA 4.5:1)" if text_contrast < 4.5 else ""))
+    
+    if os.path.getsize(css_path) >= STREAM_THRESHOLD:
+        # Too large to read whole; rewritten in chunks instead
+        if not update_css_file("zebar", css_path, zebar_piece_renderer(colors), colors, history, label):
+            print(f"Zebar CSS already up to date")
+            return False
+        print(f"Updated Zebar CSS with pywal colors")
+        return True
+
     # Read CSS file
-    with open(css_path, 'r') as f:
-        css_content = f.read()
-    
-    # Update icon color (using accent color)
-    css_content = re.sub(
-        r'i \{\s*color: rgb\([^)]+\);',
-        f'i {{\n  color: rgb({accent_rgb[0]} {accent_rgb[1]} {accent_rgb[2]} / 95%);',
-        css_content
-    )
-    
-    # Update text color (using foreground color)
-    css_content = re.sub(
-        r'body \{\s*color: rgb\([^)]+\);',
-        f'body {{\n  color: rgb({foreground_rgb[0]} {foreground_rgb[1]} {foreground_rgb[2]} / 90%);',
-        css_content
-    )
-    
-    # Update background gradient
-    css_content = re.sub(
-        r'background: linear-gradient\(rgb\([^)]+\), rgb\([^)]+\)\);',
-        f'background: linear-gradient(rgb({background_rgb[0]} {background_rgb[1]} {background_rgb[2]} / 90%), ' +
-        f'rgb({secondary_bg_rgb[0]} {secondary_bg_rgb[1]} {secondary_bg_rgb[2]} / 85%));',
-        css_content
-    )
-    
-    # Update focused workspace background (using accent color)
-    css_content = re.sub(
-        r'background: rgb\(75 115 255 \/ 50%\);',
-        f'background: rgb({accent_rgb[0]} {accent_rgb[1]} {accent_rgb[2]} / 50%);',
-        css_content
-    )
-    
-    # Write updated CSS
-    with open(css_path, 'w') as f:
-        f.write(css_content)
-    
+    with TRACE.span("read config", target="zebar"):
+        with open(css_path, 'r') as f:
+            css_content = f.read()
+        TRACE.add(bytes_read=len(css_content.encode('utf-8')))
+    
+    # Write updated CSS, snapshotting it in the theme history only if something changed
+    with TRACE.span("render", target="zebar"):
+        rendered = render_zebar_css(css_content, colors)
+    write_time = write_if_changed(css_path, css_content, rendered)
+    if write_time is None:
+        print(f"Zebar CSS already up to date")
+        return False
+    
+    record_theme("zebar", css_path, css_content, rendered, colors, history, label, write_time)
     print(f"Updated Zebar CSS with pywal colors")
+    return True
 
 if __name__ == "__main__":
-    main()
+    run_main(main, "UpdateGlazeColors", "Apply the pywal palette to GlazeWM and Zebar")
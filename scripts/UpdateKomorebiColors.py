@@ -2,10 +2,56 @@
 
 import json
 import os
-import shutil
-import re
 from pathlib import Path
 
+import jsonc
+from color_math import derive
+from theme_history import palette_label, record_theme
+from theme_io import print_change_summary, write_if_changed
+from theme_trace import TRACE, run_main
+from wal_sequences import load_palette_with_fallback
+
+# Palette entries render_komorebi reads, used to skip the target when they did not change
+KOMOREBI_COLOR_KEYS = ('color0', 'color1', 'color2', 'color4')
+
+def parse_komorebi_config(content):
+    """Parse komorebi.json content, allowing comments and trailing commas"""
+    return jsonc.loads(content)
+
+def border_colours(colors):
+    """Map winwal colors to komorebi border colors"""
+    derived = derive(colors)
+    return {
+        "monocle": derived.hex('color1', "#f38ba8"),    # Red/pink tone
+        "single": derived.hex('color4', "#89b4fa"),     # Blue tone
+        "stack": derived.hex('color2', "#a6e3a1"),      # Green tone
+        "unfocused": derived.hex('color0', "#10151D")   # Dark/background color
+    }
+
+def render_komorebi(content, colors):
+    """Return komorebi.json with only the border_colours values spliced in
+
+    The rest of the file, including $schema, comments and formatting, is
+    left untouched. A missing border_colours object is added after theme.
+    """
+    if not colors:
+        return content
+    TRACE.add(mode="jsonc splice")
+    return jsonc.set_object_values(content, 'border_colours', border_colours(colors), after='theme')
+
+def update_komorebi(config_path, config_content, colors, history=None, label=None):
+    """Patch the border colours into already loaded komorebi.json content, return True if written"""
+    with TRACE.span("render", target="komorebi"):
+        rendered = render_komorebi(config_content, colors)
+    write_time = write_if_changed(config_path, config_content, rendered)
+    if write_time is None:
+        print(f"Komorebi config already up to date")
+        return False
+    
+    record_theme("komorebi", config_path, config_content, rendered, colors, history, label, write_time)
+    print(f"Successfully updated komorebi colors from winwal!")
+    return True
+
 def main():
     # Use Path for better path handling
     home_dir = Path.home()
@@ -21,103 +67,48 @@ def main():
         print(f"Error: Komorebi config file not found at {komorebi_config_path}")
         return 1
     
-    # Create backup of the original config
-    backup_path = komorebi_config_path.with_suffix('.json.bak')
-    shutil.copy2(komorebi_config_path, backup_path)
-    print(f"Created backup at {backup_path}")
-    
     # Load Komorebi config
     try:
-        # Read the raw content first
-        with open(komorebi_config_path, 'r') as f:
-            lines = f.readlines()
-        
-        # Filter out comment lines and create a clean JSON
-        clean_lines = []
-        for line in lines:
-            if not line.strip().startswith('//'):
-                clean_lines.append(line)
+        with TRACE.span("read config", target="komorebi"):
+            with open(komorebi_config_path, 'r') as f:
+                config_content = f.read()
+            TRACE.add(bytes_read=len(config_content.encode('utf-8')))
         
-        clean_json = ''.join(clean_lines)
-        komorebi_config = json.loads(clean_json)
+        # Validate before touching the colors
+        with TRACE.span("validate config", target="komorebi"):
+            parse_komorebi_config(config_content)
+        if jsonc.find_member(config_content, ['theme']):
+            print("Note: komorebi.json has a theme block, which komorebi may apply over border_colours")
         
     except Exception as e:
         print(f"Error loading komorebi config: {e}")
         return 1
     
-    # Load winwal colors with extra care for potentially malformed JSON
-    colors = {}
+    # Load winwal colors (served from the shared palette cache when unchanged),
+    # falling back to the sequences file if colors.json cannot be parsed
     try:
-        # Read raw content
-        with open(wal_colors_path, 'r', encoding='utf-8') as f:
-            content = f.read()
-        
-        # Fix any potential issues with escape characters
-        # Replace any problematic escape sequences
-        content = content.replace('\\', '\\\\')  # Double escape backslashes
-        content = re.sub(r'\\(?!["\\/bfnrt])', r'\\\\', content)  # Escape invalid escapes
-        
-        # Try to parse the JSON
-        wal_data = json.loads(content)
-        colors = wal_data.get('colors', {})
+        palette = load_palette_with_fallback(wal_colors_path)
+        colors = palette.flat()
+        label = palette_label(palette)
         
     except json.JSONDecodeError as e:
         print(f"Error parsing winwal colors.json: {e}")
-        print("Attempting to read colors directly from file...")
-        
-        # Fallback: try to extract colors using regex
-        try:
-            with open(wal_colors_path, 'r', encoding='utf-8') as f:
-                content = f.read()
-                
-            # Extract colors using regex
-            color_pattern = r'"color(\d+)"\s*:\s*"(#[0-9a-fA-F]+)"'
-            matches = re.findall(color_pattern, content)
-            
-            for num, color in matches:
-                colors[f'color{num}'] = color
-                
-            # Look for background/foreground
-            bg_match = re.search(r'"background"\s*:\s*"(#[0-9a-fA-F]+)"', content)
-            if bg_match:
-                colors['color0'] = bg_match.group(1)
-            
-            if not colors:
-                print("Could not extract colors from malformed JSON.")
-                return 1
-                
-        except Exception as e2:
-            print(f"Failed to extract colors: {e2}")
-            return 1
+        return 1
     
     # Map winwal colors to komorebi border colors
     if colors:
+        borders = border_colours(colors)
         print("Updating Komorebi border colors:")
-        print(f"  Monocle: {colors.get('color1', '#f38ba8')}")
-        print(f"  Single: {colors.get('color4', '#89b4fa')}")
-        print(f"  Stack: {colors.get('color2', '#a6e3a1')}")
-        print(f"  Unfocused: {colors.get('color0', '#10151D')}")
-        
-        komorebi_config['border_colours'] = {
-            "monocle": colors.get('color1', "#f38ba8"),    # Red/pink tone
-            "single": colors.get('color4', "#89b4fa"),     # Blue tone
-            "stack": colors.get('color2', "#a6e3a1"),      # Green tone
-            "unfocused": colors.get('color0', "#10151D")   # Dark/background color
-        }
+        print(f"  Monocle: {borders['monocle']}")
+        print(f"  Single: {borders['single']}")
+        print(f"  Stack: {borders['stack']}")
+        print(f"  Unfocused: {borders['unfocused']}")
     else:
         print("No colors found in winwal file. Using defaults.")
     
-    # Write updated config
+    # Write updated config, snapshotting it in the theme history only if something changed
     try:
-        with open(komorebi_config_path, 'w') as f:
-            # Preserve the schema comment if it existed in the original file
-            schema_pattern = r'//\s*\$schema'
-            if any(re.search(schema_pattern, line) for line in lines):
-                f.write('// $schema: "https://raw.githubusercontent.com/LGUG2Z/komorebi/v0.1.34/schema.json"\n')
-            
-            json.dump(komorebi_config, f, indent=2)
-            
-        print(f"Successfully updated komorebi colors from winwal!")
+        print_change_summary({"komorebi": update_komorebi(komorebi_config_path, config_content, colors, label=label)})
     except Exception as e:
         print(f"Error writing updated config: {e}")
         return 1
@@ -125,4 +116,4 @@ def main():
     return 0
 
 if __name__ == "__main__":
-    exit(main())
\ No newline at end of file
+    exit(run_main(main, "UpdateKomorebiColors", "Apply the winwal palette to komorebi's border colours"))
\ No newline at end of file
@@ -1,67 +1,104 @@
 #!/usr/bin/env python3
 # filepath: c:\Users\leons\.config\scripts\UpdateYasbColors.py
 import os
-import json
 import re
-import shutil
 import sys
 from pathlib import Path
 
-def find_winwal_colors():
-    """Find and load the winwal colors file with proper escape handling"""
-    home_dir = os.path.expanduser("~")
-    # First try the primary location specified by user
-    primary_path = os.path.join(home_dir, ".cache", "wal", "colors.json")
+from color_math import derive
+from css_stream import STREAM_THRESHOLD, update_css_file
+from theme_history import palette_label, record_theme
+from theme_io import print_change_summary, write_if_changed
+from theme_template import css_marker, fill_markers, render_template
+from theme_trace import TRACE, run_main
+from wal_palette import locate_palette, remember_location
+from wal_sequences import load_palette_with_fallback
+
+# Palette entries yasb_color_mappings reads, used to skip the target when they did not change
+YASB_COLOR_KEYS = ('background', 'foreground', 'color0', 'color1', 'color3', 'color4', 'color6', 'color7')
+
+# Fallback colors for entries missing from the palette
+YASB_DEFAULTS = {
+    "background": "#221f2e",
+    "foreground": "#bec8e7",
+    "color4": "#c2a8e3",  # Purple
+    "color6": "#9ecfd7",  # Cyan
+    "color1": "#f38ba8",  # Red
+    "color3": "#f5c276",  # Yellow
+    "color7": "#9cd1dd",
+    "color0": "#1b1925",
+}
+
+# Yasb elements by palette entry - selector: {property: palette key}
+YASB_MAPPINGS = {
+    # General
+    "*": {"color": "foreground"},
+    ".komorebi-workspaces": {"background-color": "background"},
+    ".taskbar-widget": {"background-color": "background"},
     
-    if os.path.exists(primary_path):
-        try:
-            # Read the file contents as a string first
-            with open(primary_path, 'r') as f:
-                json_content = f.read()
-            
-            # Fix common issues with escape sequences
-            json_content = json_content.replace('\\', '\\\\')  # Double all backslashes
-            json_content = json_content.replace('\\\\\"', '\\"')  # Fix any already escaped quotes
-            json_content = json_content.replace('\\\\n', '\\n')  # Fix any already escaped newlines
-            
-            # Parse the fixed JSON content
-            wal_data = json.loads(json_content)
-            print(f"Found winwal colors at: {primary_path}")
-            return wal_data
-            
-        except Exception as e:
-            print(f"Error parsing colors file at {primary_path}: {e}")
-    else:
-        print(f"Primary colors path not found: {primary_path}")
+    # Workspaces
+    ".komorebi-workspaces .ws-btn": {"background-color": "color7"},
+    ".komorebi-workspaces .ws-btn.populated": {"background-color": "color1"},
+    ".komorebi-workspaces .ws-btn.active": {"background-color": "color4"},
     
-    # Fallback to other possible locations
-    fallback_paths = [
+    # Widgets
+    ".clock-widget": {"background-color": "color4"},
+    ".weather-widget": {"background-color": "color6"},
+    ".volume-widget": {"background-color": "color1"},
+    ".power-menu-widget": {"background-color": "color4"},
+    ".language-widget": {"background-color": "color3"},
+    ".traffic-widget": {"background-color": "color6"},
+    ".active-window-widget": {"background-color": "color4"},
+    
+    # Widget labels
+    ".clock-widget .label": {"color": "color4", "background-color": "background"},
+    ".weather-widget .label": {"color": "color6", "background-color": "background"},
+    ".volume-widget .label": {"color": "color1", "background-color": "background"},
+    ".language-widget .label": {"color": "color3", "background-color": "background"},
+    ".traffic-widget .label": {"color": "color6", "background-color": "background"},
+    ".active-window-widget .label": {"color": "color4", "background-color": "background"},
+    
+    # Widget icons
+    ".clock-widget .icon": {"color": "background"},
+    ".weather-widget .icon": {"color": "background"},
+    ".volume-widget .icon": {"color": "background"},
+    ".language-widget .icon": {"color": "background"},
+    ".traffic-widget .icon": {"color": "background"},
+    ".power-menu-widget .label": {"color": "background"},
+    ".win-btn .icon": {"color": "background"},
+    
+    # Power menu
+    ".power-menu-popup .button": {"background-color": "background", "color": "color4"},
+    ".power-menu-popup .button.hover": {"background-color": "color0"},
+    ".power-menu-popup .button .label": {"color": "color4"},
+    ".power-menu-popup .button .icon": {"color": "color4"},
+}
+
+def winwal_candidates(home_dir):
+    """Palette locations in the order they are preferred"""
+    return [
+        os.path.join(home_dir, ".cache", "wal", "colors.json"),
         os.path.join(home_dir, "AppData", "Local", "winwal", "colors.json"),
         os.path.join(home_dir, "AppData", "Roaming", "winwal", "colors.json"),
         os.path.join(home_dir, ".config", "winwal", "colors.json"),
     ]
-    
-    for path in fallback_paths:
-        if os.path.exists(path):
-            try:
-                # Read file contents and fix escapes
-                with open(path, 'r') as f:
-                    json_content = f.read()
-                
-                # Fix common issues with escape sequences
-                json_content = json_content.replace('\\', '\\\\')
-                json_content = json_content.replace('\\\\\"', '\\"')
-                json_content = json_content.replace('\\\\n', '\\n')
-                
-                wal_data = json.loads(json_content)
-                print(f"Found winwal colors at: {path}")
-                return wal_data
-                
-            except Exception as e:
-                print(f"Error with fallback path {path}: {e}")
-                continue
-    
+
+def find_winwal_colors(interactive=True):
+    """Find and load the winwal palette through the shared palette cache
+
+    The location found is remembered, so the usual run is a single stat and
+    a cache hit. Only an interactive run asks for the path when no candidate
+    works; otherwise it exits with an error instead of waiting for input.
+    """
+    palette = locate_palette(winwal_candidates(os.path.expanduser("~")), load=load_palette_with_fallback)
+    if palette is not None:
+        print(f"Found winwal colors at: {palette.source}")
+        return palette
+
     print("Could not find winwal colors file automatically.")
+    if not interactive:
+        print("Error: no winwal colors.json found and running non-interactively")
+        sys.exit(1)
     print("Please enter the full path to your winwal colors.json file:")
     user_path = input("> ").strip()
     
@@ -70,55 +107,12 @@ def find_winwal_colors():
         sys.exit(1)
         
     try:
-        # Read file with escape handling
-        with open(user_path, 'r') as f:
-            json_content = f.read()
-        
-        # Fix common issues with escape sequences
-        json_content = json_content.replace('\\', '\\\\')
-        json_content = json_content.replace('\\\\\"', '\\"')
-        json_content = json_content.replace('\\\\n', '\\n')
-        
-        return json.loads(json_content)
+        palette = load_palette_with_fallback(user_path)
     except Exception as e:
         print(f"Error reading file: {e}")
         sys.exit(1)
-
-def backup_css(css_path):
-    """Create a backup of the CSS file"""
-    backup_path = f"{css_path}.bak"
-    try:
-        shutil.copy2(css_path, backup_path)
-        print(f"Created backup at: {backup_path}")
-    except Exception as e:
-        print(f"Warning: Could not create backup: {e}")
-
-def extract_colors(winwal_data):
-    """Extract colors from winwal data in various possible formats"""
-    colors = {}
-    
-    # Handle pywal format with nested structure
-    if isinstance(winwal_data, dict):
-        if "colors" in winwal_data and isinstance(winwal_data["colors"], dict):
-            for i in range(16):
-                color_key = f"color{i}"
-                if color_key in winwal_data["colors"]:
-                    colors[color_key] = winwal_data["colors"][color_key]
-        
-        if "special" in winwal_data and isinstance(winwal_data["special"], dict):
-            for key in ["background", "foreground", "cursor"]:
-                if key in winwal_data["special"]:
-                    colors[key] = winwal_data["special"][key]
-        
-        # Handle flat format
-        for key in ["color0", "color1", "color2", "color3", "color4", "color5", 
-                   "color6", "color7", "color8", "color9", "color10", "color11", 
-                   "color12", "color13", "color14", "color15", 
-                   "background", "foreground", "cursor"]:
-            if key in winwal_data and key not in colors:
-                colors[key] = winwal_data[key]
-    
-    return colors
+    remember_location(user_path)
+    return palette
 
 def update_css_property(css_content, selector, property_name, new_value):
     """Update a specific CSS property for a selector"""
@@ -126,98 +120,218 @@ def update_css_property(css_content, selector, property_name, new_value):
     replacement = rf'\g<1>{new_value}\g<2>'
     return re.sub(pattern, replacement, css_content, flags=re.DOTALL)
 
-def update_yasb_css(css_path, colors):
-    """Update the YASB CSS with the new colors"""
+# Hex value following a "property:" inside a rule body, as matched by update_css_property
+CSS_HEX_VALUE = re.compile(r'\s*#[0-9a-fA-F]{6}')
+
+def index_css_rules(css_content):
+    """Tokenize the stylesheet into rule groups and a selector index
+
+    A group spans from an opening brace to the next closing brace, which is
+    exactly the region update_css_property's `[^}]` classes can cover. Opening
+    braces nested before that closing brace belong to the same group.
+    Returns (groups, headers) where groups is a list of (start, end, braces)
+    and headers maps each rule's selector text to the groups it opens.
+    """
+    groups = []
+    headers = {}
+    pos = 0
+    while True:
+        start = css_content.find('{', pos)
+        if start == -1:
+            break
+        end = css_content.find('}', start)
+        if end == -1:
+            break
+        
+        braces = [start]
+        inner = css_content.find('{', start + 1, end)
+        while inner != -1:
+            braces.append(inner)
+            inner = css_content.find('{', inner + 1, end)
+        
+        header = css_content[pos:start].strip()
+        headers.setdefault(header, []).append(len(groups))
+        groups.append((start, end, braces))
+        pos = end + 1
+    
+    return groups, headers
+
+def _selector_matches(text, brace, selector):
+    """Check whether selector plus optional whitespace ends right before text[brace]"""
+    end = brace
+    while end > 0 and text[end - 1].isspace():
+        end -= 1
+    return text.endswith(selector, 0, end)
+
+def match_rule_group(before, segment, mappings):
+    """Return {offset in segment: (selector, property)} for the hex values a rule group's mappings replace
+
+    segment runs from a group's opening brace to its closing one and before
+    is the text between the previous group and it. Each selector/property
+    pair takes the first "property:" followed by a hex value after the
+    first brace the selector ends right before; later pairs win when two
+    land on the same value, exactly as update_css_property applied in
+    order would leave it. Replacement values are all 7 characters, so
+    every offset is found on the original text.
+    """
+    text = before + segment
+    braces = [i for i, char in enumerate(segment) if char == '{']
+    slots = {}
+    for selector, properties in mappings.items():
+        matching = [brace for brace in braces if _selector_matches(text, len(before) + brace, selector)]
+        if not matching:
+            continue
+        for prop in properties:
+            needle = f"{prop}:"
+            offset = _find_hex_value(segment, matching, needle)
+            if offset is not None:
+                slots[offset] = (selector, prop)
+    return slots
+
+def _find_hex_value(segment, braces, needle):
+    for brace in braces:
+        found = segment.find(needle, brace + 1)
+        while found != -1:
+            value = CSS_HEX_VALUE.match(segment, found + len(needle))
+            if value:
+                return value.end() - 7
+            found = segment.find(needle, found + 1)
+    return None
+
+def apply_css_mappings(css_content, mappings, values=None):
+    """Apply a whole selector -> {property: color} table in a single pass
+
+    Produces the same output as calling update_css_property for every pair
+    in order, but tokenizes the stylesheet once and builds the result once.
+    values(selector, property) can supply the replacement text instead,
+    e.g. a template marker in front of the color.
+    """
+    groups, headers = index_css_rules(css_content)
+    if values is None:
+        values = lambda selector, prop: mappings[selector][prop]
+    
+    # Resolve every selector to the rule groups it can match. Groups with nested
+    # braces are always candidates since their inner headers live in rule bodies.
+    candidates = {}
+    for header, group_ids in headers.items():
+        for selector in mappings:
+            if header.endswith(selector):
+                for group_id in group_ids:
+                    candidates.setdefault(group_id, set()).add(selector)
+    for group_id, (_, _, braces) in enumerate(groups):
+        if len(braces) > 1:
+            candidates[group_id] = set(mappings)
+    
+    parts = []
+    pos = 0
+    for group_id in sorted(candidates):
+        start, end, _ = groups[group_id]
+        previous_end = groups[group_id - 1][1] + 1 if group_id else 0
+        selectors = candidates[group_id]
+        slots = match_rule_group(css_content[previous_end:start], css_content[start:end + 1],
+                                 {selector: properties for selector, properties in mappings.items() if selector in selectors})
+        for offset, (selector, prop) in sorted(slots.items()):
+            parts.append(css_content[pos:start + offset])
+            parts.append(values(selector, prop))
+            pos = start + offset + 7
+            TRACE.count("substitutions")
+    
+    parts.append(css_content[pos:])
+    return ''.join(parts)
+
+def yasb_color_mappings(colors):
+    """Map winwal colors to yasb elements - selector: {property: color}"""
+    derived = derive(colors)
+    values = {key: derived.hex(key, default) for key, default in YASB_DEFAULTS.items()}
+    return {selector: {prop: values[key] for prop, key in properties.items()}
+            for selector, properties in YASB_MAPPINGS.items()}
+
+def yasb_piece_renderer(colors):
+    """Return a css_stream render callback doing what render_yasb_css does to a whole stylesheet"""
+    mappings = yasb_color_mappings(colors)
+
+    def render(css_piece, template):
+        if template:
+            return fill_markers(css_piece, colors, YASB_DEFAULTS)[0]
+        return apply_css_mappings(css_piece, mappings)
+    return render
+
+def render_yasb_css(css_content, colors):
+    """Return the YASB CSS text with the winwal colors applied"""
+    rendered = render_template(css_content, colors, YASB_DEFAULTS)
+    if rendered is not None:
+        return rendered
+    TRACE.add(mode="css index")
+    return apply_css_mappings(css_content, yasb_color_mappings(colors))
+
+def mark_yasb_css(css_content, colors):
+    """Mark the mapped color slots for template mode, applying colors at the same time"""
+    mappings = yasb_color_mappings(colors)
+    return apply_css_mappings(css_content, mappings,
+                              lambda selector, prop: css_marker(YASB_MAPPINGS[selector][prop]) + mappings[selector][prop])
+
+def stream_yasb_css(css_path, colors, history=None, label=None):
+    """update_yasb_css for stylesheets too large to read whole, rewritten in chunks"""
     try:
-        with open(css_path, 'r') as f:
-            css_content = f.read()
+        written = update_css_file("yasb", css_path, yasb_piece_renderer(colors), colors, history, label)
+    except Exception as e:
+        print(f"Error updating CSS file: {e}")
+        sys.exit(1)
+    if written:
+        print(f"Successfully updated CSS file: {css_path}")
+    else:
+        print(f"CSS file already up to date: {css_path}")
+    return written
+
+def update_yasb_css(css_path, colors, history=None, label=None):
+    """Update the YASB CSS with the new colors, return True if the file was rewritten"""
+    if os.path.isfile(css_path) and os.path.getsize(css_path) >= STREAM_THRESHOLD:
+        return stream_yasb_css(css_path, colors, history, label)
+    try:
+        with TRACE.span("read config", target="yasb"):
+            with open(css_path, 'r') as f:
+                css_content = f.read()
+            TRACE.add(bytes_read=len(css_content.encode('utf-8')))
     except Exception as e:
         print(f"Error reading CSS file: {e}")
         sys.exit(1)
     
-    # Map winwal colors to yasb elements
-    main_bg = colors.get("background", "#221f2e")
-    main_fg = colors.get("foreground", "#bec8e7")
-    accent1 = colors.get("color4", "#c2a8e3")  # Purple
-    accent2 = colors.get("color6", "#9ecfd7")  # Cyan
-    accent3 = colors.get("color1", "#f38ba8")  # Red
-    accent4 = colors.get("color3", "#f5c276")  # Yellow
-    
-    # Define color mappings - selector: {property: color}
-    mappings = {
-        # General
-        "*": {"color": main_fg},
-        ".komorebi-workspaces": {"background-color": main_bg},
-        ".taskbar-widget": {"background-color": main_bg},
-        
-        # Workspaces
-        ".komorebi-workspaces .ws-btn": {"background-color": colors.get("color7", "#9cd1dd")},
-        ".komorebi-workspaces .ws-btn.populated": {"background-color": accent3},
-        ".komorebi-workspaces .ws-btn.active": {"background-color": accent1},
-        
-        # Widgets
-        ".clock-widget": {"background-color": accent1},
-        ".weather-widget": {"background-color": accent2},
-        ".volume-widget": {"background-color": accent3},
-        ".power-menu-widget": {"background-color": accent1},
-        ".language-widget": {"background-color": accent4},
-        ".traffic-widget": {"background-color": accent2},
-        ".active-window-widget": {"background-color": accent1},
-        
-        # Widget labels
-        ".clock-widget .label": {"color": accent1, "background-color": main_bg},
-        ".weather-widget .label": {"color": accent2, "background-color": main_bg},
-        ".volume-widget .label": {"color": accent3, "background-color": main_bg},
-        ".language-widget .label": {"color": accent4, "background-color": main_bg},
-        ".traffic-widget .label": {"color": accent2, "background-color": main_bg},
-        ".active-window-widget .label": {"color": accent1, "background-color": main_bg},
-        
-        # Widget icons
-        ".clock-widget .icon": {"color": main_bg},
-        ".weather-widget .icon": {"color": main_bg},
-        ".volume-widget .icon": {"color": main_bg},
-        ".language-widget .icon": {"color": main_bg},
-        ".traffic-widget .icon": {"color": main_bg},
-        ".power-menu-widget .label": {"color": main_bg},
-        ".win-btn .icon": {"color": main_bg},
-        
-        # Power menu
-        ".power-menu-popup .button": {"background-color": main_bg, "color": accent1},
-        ".power-menu-popup .button.hover": {"background-color": colors.get("color0", "#1b1925")},
-        ".power-menu-popup .button .label": {"color": accent1},
-        ".power-menu-popup .button .icon": {"color": accent1},
-    }
-    
     # Apply the color mappings
-    for selector, properties in mappings.items():
-        for prop, value in properties.items():
-            css_content = update_css_property(css_content, selector, prop, value)
+    with TRACE.span("render", target="yasb"):
+        rendered = render_yasb_css(css_content, colors)
     
-    # Write the updated CSS
+    # Write the updated CSS, snapshotting it in the theme history only if something changed
     try:
-        with open(css_path, 'w') as f:
-            f.write(css_content)
+        write_time = write_if_changed(css_path, css_content, rendered)
+        if write_time is None:
+            print(f"CSS file already up to date: {css_path}")
+            return False
+        record_theme("yasb", css_path, css_content, rendered, colors, history, label, write_time)
         print(f"Successfully updated CSS file: {css_path}")
+        return True
     except Exception as e:
         print(f"Error writing to CSS file: {e}")
         sys.exit(1)
 
-def main():
+def add_arguments(parser):
+    parser.add_argument('--non-interactive', action='store_true',
+                        help="never prompt for the palette path (implied when stdin is not a terminal)")
+
+def main(args):
     yasb_css_path = os.path.join(os.path.expanduser("~"), ".config", "yasb", "styles.css")
     
     print("Updating YASB colors with winwal theme...")
     print("Looking for colors in ~/.cache/wal/...")
-    winwal_data = find_winwal_colors()
-    colors = extract_colors(winwal_data)
+    palette = find_winwal_colors(interactive=not args.non_interactive and sys.stdin is not None and sys.stdin.isatty())
+    colors = palette.flat()
     
     if not colors:
         print("Error: Could not extract colors from winwal data")
         sys.exit(1)
     
     print(f"Found {len(colors)} colors in the winwal theme")
-    backup_css(yasb_css_path)
-    update_yasb_css(yasb_css_path, colors)
+    print_change_summary({"yasb": update_yasb_css(yasb_css_path, colors, label=palette_label(palette))})
     print("Done! Restart YASB to see the changes.")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    run_main(main, "UpdateYasbColors", "Apply the winwal palette to the YASB stylesheet", add_arguments=add_arguments)
\ No newline at end of file
@@ -0,0 +1,204 @@
+#!/usr/bin/env python3
+# filepath: YasbReloadLatency.py
+
+import argparse
+import json
+import os
+import re
+import sys
+import time
+from pathlib import Path
+
+from BenchmarkThemes import percentile
+from theme_history import ThemeHistory
+from theme_io import atomic_write
+
+YASB_LOG_PATH = Path.home() / ".config" / "yasb" / "yasb.log"
+STATE_PATH = Path.home() / ".cache" / "wal" / "yasb-reload-latency.json"
+CHUNK_SIZE = 256 * 1024
+MAX_EVENTS = 1000
+MAX_LATENCIES = 1000
+
+# Both YASB log formats:
+#   2025-03-16 11:13:01 INFO bar_manager.py:46: Successfully loaded updated stylesheet and applied to all bars.
+#   2025-06-12 16:58:15,205 [INFO] [MainThread] [root/controller.py:13]: Reloading Application because of config change.
+RELOAD_LINE = re.compile(
+    rb'^(\d{4}-\d\d-\d\d \d\d:\d\d:\d\d)(?:[,.](\d{1,6}))? .*?'
+    rb'(?:Successfully loaded updated stylesheet|Reloading Application because of config change)'
+)
+
+def load_state(state_path):
+    try:
+        with open(state_path, 'r', encoding='utf-8') as f:
+            state = json.load(f)
+        if isinstance(state, dict):
+            return state
+    except (OSError, ValueError):
+        pass
+    return {}
+
+def save_state(state_path, state):
+    os.makedirs(os.path.dirname(state_path), exist_ok=True)
+    atomic_write(state_path, json.dumps(state, indent=1).encode('utf-8'))
+
+def log_identity(f):
+    """Identify the log file so a rotated or recreated yasb.log is read from the start"""
+    stat = os.fstat(f.fileno())
+    f.seek(0)
+    head = f.read(128)
+    return {"dev": stat.st_dev, "ino": stat.st_ino, "head": head.hex()}, stat.st_size
+
+def same_log(saved, identity):
+    """True if identity is the saved log, which may have grown since (its head too, if it was short)"""
+    if not saved or (saved["dev"], saved["ino"]) != (identity["dev"], identity["ino"]):
+        return False
+    return identity["head"].startswith(saved["head"])
+
+def parse_reload(line):
+    """Return [epoch time, timestamp resolution in seconds] for a reload line, or None"""
+    match = RELOAD_LINE.match(line)
+    if not match:
+        return None
+    seconds = time.mktime(time.strptime(match.group(1).decode('ascii'), '%Y-%m-%d %H:%M:%S'))
+    fraction = match.group(2)
+    if not fraction:
+        # The older format only says which second the reload happened in
+        return [seconds, 1.0]
+    return [seconds + int(fraction) / 10 ** len(fraction), 10 ** -len(fraction)]
+
+def read_new_reloads(log_path, state):
+    """Return the reloads logged since the saved offset, advancing it
+
+    Only complete lines are consumed; a line still being written is read
+    again next time. The file is streamed in chunks from the offset, so a
+    large log is never reread.
+    """
+    reloads = []
+    with open(log_path, 'rb') as f:
+        identity, size = log_identity(f)
+        offset = state.get("offset", 0)
+        if not same_log(state.get("log"), identity) or offset > size:
+            offset = 0
+        if offset == 0 and "log" in state:
+            print(f"{log_path} was rotated or replaced; reading it from the start")
+
+        f.seek(offset)
+        remainder = b''
+        while True:
+            chunk = f.read(CHUNK_SIZE)
+            if not chunk:
+                break
+            lines = (remainder + chunk).split(b'\n')
+            remainder = lines.pop()
+            for line in lines:
+                reload = parse_reload(line)
+                if reload is not None:
+                    reloads.append(reload)
+            offset += len(chunk)
+
+    state["log"] = identity
+    state["offset"] = offset - len(remainder)
+    return reloads
+
+def yasb_writes(history):
+    """Return [(write time, theme label)] for the recorded yasb stylesheet writes, oldest first"""
+    writes = []
+    for entry in history.entries():
+        file = entry["files"].get("yasb")
+        if file is not None and entry["key"] != "external":
+            writes.append((file.get("time", entry["time"]), entry["label"]))
+    return sorted(writes)
+
+def correlate(writes, reloads):
+    """Match each write with the first reload logged at or after it
+
+    A write followed by another write before any reload was superseded and
+    gets no latency. A reload counts if the write falls within its
+    timestamp's resolution, e.g. in the same second for the older format;
+    the latency is then the middle of the possible interval.
+    Returns ([latency record], unmatched writes).
+    """
+    matched = []
+    pending = []
+    reloads = sorted(reloads)
+    r = 0
+    for i, (written, label) in enumerate(writes):
+        while r < len(reloads) and reloads[r][0] + reloads[r][1] <= written:
+            r += 1
+        if r == len(reloads):
+            pending.append((written, label))
+            continue
+        next_write = writes[i + 1][0] if i + 1 < len(writes) else None
+        reloaded, resolution = reloads[r]
+        if next_write is not None and next_write <= reloaded:
+            continue
+        # The reload happened somewhere between its timestamp (or the write) and the next tick
+        earliest = max(reloaded, written)
+        matched.append({"label": label, "written": written, "reloaded": reloaded,
+                        "latency": (earliest + reloaded + resolution) / 2 - written,
+                        "uncertainty": (reloaded + resolution - earliest) / 2})
+        r += 1
+    return matched, pending
+
+def print_latency(record):
+    when = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(record["written"]))
+    accuracy = f" (±{record['uncertainty'] * 1000:.0f} ms)" if record["uncertainty"] >= 0.0005 else ""
+    print(f"  {when}  {record['label']}: restyled after {record['latency'] * 1000:.0f} ms{accuracy}")
+
+def print_report(latencies):
+    if not latencies:
+        print("No theme switches matched to a YASB reload yet")
+        return
+    values = sorted(record["latency"] * 1000 for record in latencies)
+    print(f"End-to-end latency over {len(values)} theme switches (ms): "
+          f"min {values[0]:.0f}  p50 {percentile(values, 0.50):.0f}  p90 {percentile(values, 0.90):.0f}  "
+          f"p99 {percentile(values, 0.99):.0f}  max {values[-1]:.0f}")
+
+def update(log_path, state, history):
+    """Consume new log lines and return the newly matched latency records"""
+    reloads = state.get("reloads", []) + read_new_reloads(log_path, state)
+    since = state.get("matched_until", 0)
+    writes = [(written, label) for written, label in yasb_writes(history) if written > since]
+
+    matched, pending = correlate(writes, reloads)
+    if matched:
+        state["matched_until"] = max(record["written"] for record in matched)
+    # Keep only the reloads that a pending write could still match
+    earliest = min((written for written, _ in pending), default=None)
+    state["reloads"] = [] if earliest is None else [reload for reload in reloads if sum(reload) > earliest][-MAX_EVENTS:]
+    state["latencies"] = (state.get("latencies", []) + matched)[-MAX_LATENCIES:]
+    return matched
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure the time from a theme write to YASB restyling, from yasb.log")
+    parser.add_argument('--log', default=str(YASB_LOG_PATH), help=f"YASB log file (default: {YASB_LOG_PATH})")
+    parser.add_argument('--state', default=str(STATE_PATH), help="where the log offset and results are kept")
+    parser.add_argument('--follow', action='store_true', help="keep tailing the log and report each switch as it happens")
+    parser.add_argument('--interval', type=float, default=0.5, help="seconds between checks with --follow (default: 0.5)")
+    parser.add_argument('--reset', action='store_true', help="forget the saved offset and results first")
+    args = parser.parse_args()
+
+    if not os.path.exists(args.log):
+        print(f"Error: YASB log not found at {args.log}")
+        return 1
+
+    state = {} if args.reset else load_state(args.state)
+    history = ThemeHistory()
+
+    try:
+        while True:
+            matched = update(args.log, state, history)
+            for record in matched:
+                print_latency(record)
+            save_state(args.state, state)
+            if not args.follow:
+                break
+            time.sleep(args.interval)
+    except KeyboardInterrupt:
+        save_state(args.state, state)
+
+    print_report(state.get("latencies", []))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
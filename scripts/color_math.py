@@ -0,0 +1,219 @@
+"""Batch color math over whole palettes for the theme updaters
+
+Every palette is held as one array of RGB rows, so lighter and darker
+shades, luminance and nearest-color lookups are computed for all of its
+colors at once (and for many palettes at once with derive_many). NumPy is
+used when it is installed; otherwise the same operations run on plain
+lists and give identical hex output.
+"""
+
+import re
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+HEX_COLOR = re.compile(r'#?([0-9a-fA-F]{6})$')
+WHITE = (255.0, 255.0, 255.0)
+BLACK = (0.0, 0.0, 0.0)
+# Lighten/darken amounts precomputed for every palette color
+SHADE_STEPS = (0.05, 0.1, 0.2, 0.3)
+# sRGB channel weights for relative luminance (WCAG 2.x)
+LUMINANCE_WEIGHTS = (0.2126, 0.7152, 0.0722)
+# Derived palettes kept in memory; bounded so a watch session can't grow forever
+MAX_CACHED = 1024
+
+def parse_hex(hex_color):
+    """Return (r, g, b) ints for a #rrggbb color, raising ValueError otherwise"""
+    match = HEX_COLOR.match(hex_color.strip()) if isinstance(hex_color, str) else None
+    if not match:
+        raise ValueError(f"not a #rrggbb color: {hex_color!r}")
+    value = match.group(1)
+    return tuple(int(value[i:i + 2], 16) for i in (0, 2, 4))
+
+def to_hex(rgb):
+    return '#{:02x}{:02x}{:02x}'.format(*rgb)
+
+def format_css_rgb(rgb, alpha=None):
+    """CSS Color 4 rgb(), e.g. rgb(99 178 205 / 95%)"""
+    r, g, b = rgb
+    return f"rgb({r} {g} {b} / {alpha}%)" if alpha is not None else f"rgb({r} {g} {b})"
+
+def _linear(channel):
+    c = channel / 255
+    return c / 12.92 if c <= 0.04045 else ((c + 0.055) / 1.055) ** 2.4
+
+def contrast_ratio(luminance_a, luminance_b):
+    """WCAG contrast ratio between two relative luminances"""
+    lighter, darker = max(luminance_a, luminance_b), min(luminance_a, luminance_b)
+    return (lighter + 0.05) / (darker + 0.05)
+
+class PythonBackend:
+    """Palette rows as lists of float tuples"""
+    name = "python"
+
+    def array(self, rows):
+        return [tuple(float(c) for c in row) for row in rows]
+
+    def mix(self, rows, target, amount):
+        tr, tg, tb = target
+        return [(r + (tr - r) * amount, g + (tg - g) * amount, b + (tb - b) * amount) for r, g, b in rows]
+
+    def to_ints(self, rows):
+        return [(int(r + 0.5), int(g + 0.5), int(b + 0.5)) for r, g, b in rows]
+
+    def luminance(self, rows):
+        wr, wg, wb = LUMINANCE_WEIGHTS
+        return [wr * _linear(r) + wg * _linear(g) + wb * _linear(b) for r, g, b in rows]
+
+    def nearest(self, rows, target):
+        distances = [sum((c - t) ** 2 for c, t in zip(row, target)) for row in rows]
+        return min(range(len(distances)), key=distances.__getitem__)
+
+class NumpyBackend:
+    """Palette rows as an (n, 3) float array"""
+    name = "numpy"
+
+    def array(self, rows):
+        return np.array(rows, dtype=float).reshape(-1, 3)
+
+    def mix(self, rows, target, amount):
+        return rows + (np.asarray(target, dtype=float) - rows) * amount
+
+    def to_ints(self, rows):
+        return [tuple(row) for row in np.floor(rows + 0.5).astype(int).tolist()]
+
+    def luminance(self, rows):
+        c = rows / 255
+        linear = np.where(c <= 0.04045, c / 12.92, ((c + 0.055) / 1.055) ** 2.4)
+        return (linear @ np.array(LUMINANCE_WEIGHTS)).tolist()
+
+    def nearest(self, rows, target):
+        return int(((rows - np.asarray(target, dtype=float)) ** 2).sum(axis=1).argmin())
+
+BACKEND = NumpyBackend() if np is not None else PythonBackend()
+_cache = {}
+
+def set_backend(name):
+    """Switch between the "numpy" and "python" backends, e.g. to compare them"""
+    global BACKEND
+    if name == "numpy" and np is None:
+        raise ImportError("numpy is not installed")
+    BACKEND = NumpyBackend() if name == "numpy" else PythonBackend()
+    _cache.clear()
+
+class DerivedColors:
+    """A palette together with its precomputed shades and luminances
+
+    Lookups take the target's old hardcoded default; if the palette lacks the
+    entry, the nearest palette color to that default is used instead, so a
+    partial palette still produces a consistent theme.
+    """
+
+    def __init__(self, colors, names, rows, shades, luminance):
+        self.colors = colors
+        self.names = names
+        self.index = {name: i for i, name in enumerate(names)}
+        self.rows = rows
+        self.shades = shades
+        self.luminance = luminance
+
+    def _resolve(self, name, default):
+        """Return the row index for name, falling back to the color nearest to default"""
+        if name in self.index:
+            return self.index[name]
+        if default is None or not self.names:
+            return None
+        return BACKEND.nearest(self.rows, parse_hex(default))
+
+    def hex(self, name, default=None):
+        i = self._resolve(name, default)
+        return default if i is None else self.colors[self.names[i]]
+
+    def rgb(self, name, default=None):
+        i = self._resolve(name, default)
+        return parse_hex(default) if i is None else self.shades[0.0][i]
+
+    def lighten(self, name, amount, default=None):
+        return self._shade(name, amount, default)
+
+    def darken(self, name, amount, default=None):
+        return self._shade(name, -amount, default)
+
+    def _shade(self, name, amount, default):
+        i = self._resolve(name, default)
+        if i is None:
+            return default
+        if amount not in self.shades:
+            target = WHITE if amount > 0 else BLACK
+            return to_hex(BACKEND.to_ints(BACKEND.mix(BACKEND.array([self.shades[0.0][i]]), target, abs(amount)))[0])
+        return to_hex(self.shades[amount][i])
+
+    def blend(self, name, over, alpha, default=None):
+        """Opaque color of name drawn at alpha over the palette entry over"""
+        foreground = self.rgb(name, default)
+        background = BACKEND.array([self.rgb(over, default)])
+        return to_hex(BACKEND.to_ints(BACKEND.mix(background, foreground, alpha))[0])
+
+    def css_rgb(self, name, alpha=None, default=None):
+        return format_css_rgb(self.rgb(name, default), alpha)
+
+    def contrast(self, name_a, name_b, default_a=None, default_b=None):
+        """WCAG contrast ratio between two palette entries"""
+        a, b = self._resolve(name_a, default_a), self._resolve(name_b, default_b)
+        lum_a = self.luminance[a] if a is not None else BACKEND.luminance(BACKEND.array([parse_hex(default_a)]))[0]
+        lum_b = self.luminance[b] if b is not None else BACKEND.luminance(BACKEND.array([parse_hex(default_b)]))[0]
+        return contrast_ratio(lum_a, lum_b)
+
+def _cache_key(colors):
+    return tuple(sorted((name, str(value)) for name, value in colors.items()))
+
+def derive_many(palettes):
+    """Derive shades for many flat palettes in one batch, return [DerivedColors]
+
+    All palettes are stacked into a single array so each shade step and the
+    luminances are one vectorized operation, however many palettes there are.
+    """
+    palettes = list(palettes)
+    results = [_cache.get(_cache_key(colors)) for colors in palettes]
+    pending = [i for i, derived in enumerate(results) if derived is None]
+    if not pending:
+        return results
+
+    names_per_palette = []
+    all_rgb = []
+    for i in pending:
+        names = []
+        for name, value in palettes[i].items():
+            try:
+                all_rgb.append(parse_hex(value))
+            except ValueError:
+                continue
+            names.append(name)
+        names_per_palette.append(names)
+
+    rows = BACKEND.array(all_rgb)
+    shades = {0.0: BACKEND.to_ints(rows)}
+    for step in SHADE_STEPS:
+        shades[step] = BACKEND.to_ints(BACKEND.mix(rows, WHITE, step))
+        shades[-step] = BACKEND.to_ints(BACKEND.mix(rows, BLACK, step))
+    luminance = BACKEND.luminance(rows) if all_rgb else []
+
+    if len(_cache) + len(pending) > MAX_CACHED:
+        _cache.clear()
+    start = 0
+    for i, names in zip(pending, names_per_palette):
+        end = start + len(names)
+        derived = DerivedColors(
+            palettes[i], names, rows[start:end],
+            {step: values[start:end] for step, values in shades.items()},
+            luminance[start:end],
+        )
+        results[i] = _cache[_cache_key(palettes[i])] = derived
+        start = end
+    return results
+
+def derive(colors):
+    """Return the DerivedColors for one flat palette, computed once per palette"""
+    return derive_many([colors])[0]
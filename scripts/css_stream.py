@@ -0,0 +1,212 @@
+"""Streaming rendering for stylesheets too large to hold in memory
+
+The stylesheet is read in chunks and split into pieces that end after a
+closing brace at the end of a line, outside parentheses, comments and
+strings. No mapped rule, regex slot or template marker can span such a
+cut, so every piece goes through the same renderer as a whole stylesheet
+does and the output is identical; only the current piece is held in memory.
+
+Lines longer than MAX_PENDING (minified stylesheets) are also cut after a
+closing brace inside the line, so memory stays bounded whatever the file.
+"""
+
+import contextlib
+import os
+import re
+
+from theme_history import ThemeHistory, palette_key
+from theme_io import commit_write, discard_write, stage_stream
+from theme_template import compile_template
+from theme_trace import TRACE
+
+# Stylesheets from this size on are streamed instead of rendered in memory
+STREAM_THRESHOLD = 1024 * 1024
+CHUNK_SIZE = 64 * 1024
+MAX_PENDING = 1024 * 1024
+
+# Characters that can change the scanner state outside comments, strings and url() tokens
+TOKEN = re.compile(r'/\*|["\'()\\}]|(?<![\w-])url\(\s*', re.IGNORECASE)
+STRING_END = {'"': re.compile(r'["\\\n]'), "'": re.compile(r"['\\\n]")}
+LINE_END = re.compile(r'[ \t\r]*\n')
+
+class RuleSplitter:
+    """Incremental scanner cutting a stylesheet into pieces that end between rules
+
+    Comments, strings, url() tokens and the parenthesis depth are tracked
+    across chunks, and only newly fed text is scanned, so splitting is
+    linear in the size of the file. A closing brace outside all of them is
+    a cut; the latest one ending a line is taken, or the latest one at all
+    once more than max_pending characters are waiting.
+    """
+
+    def __init__(self, max_pending=MAX_PENDING):
+        self.max_pending = max_pending
+        self.pending = ''
+        self.pos = 0            # how far pending has been scanned
+        self.line_cut = 0       # latest cut after a brace ending a line, 0 for none
+        self.brace_cut = 0      # latest cut after any brace, 0 for none
+        self.comment = False
+        self.quote = None
+        self.url = False
+        self.depth = 0
+
+    def feed(self, chunk):
+        """Take the next chunk, return the piece that is complete so far ('' if none)"""
+        self.pending += chunk
+        self._scan()
+        cut = self.line_cut
+        if not cut and len(self.pending) > self.max_pending:
+            cut = self.brace_cut
+        if not cut:
+            return ''
+        piece, self.pending = self.pending[:cut], self.pending[cut:]
+        self.pos -= cut
+        self.line_cut = 0
+        self.brace_cut = max(0, self.brace_cut - cut)
+        return piece
+
+    def close(self):
+        """Return the rest of the text"""
+        rest, self.pending, self.pos = self.pending, '', 0
+        return rest
+
+    def _scan(self):
+        text, pos = self.pending, self.pos
+        # Leave the last few characters for the next chunk: "/*", "\\x" or "url(" may be split;
+        # the rest after the last cut is passed through as it is anyway
+        limit = len(text) - 3
+        while pos < limit:
+            if self.comment:
+                end = text.find('*/', pos)
+                if end == -1:
+                    pos = max(pos, len(text) - 1)
+                    break
+                pos = end + 2
+                self.comment = False
+                continue
+            if self.quote:
+                match = STRING_END[self.quote].search(text, pos)
+                if not match:
+                    pos = len(text)
+                    break
+                if match.group() == '\\':
+                    if match.end() == len(text):
+                        pos = match.start()
+                        break
+                    pos = match.end() + 1
+                    continue
+                pos = match.end()
+                self.quote = None
+                continue
+            if self.url:
+                end = text.find(')', pos)
+                if end == -1:
+                    pos = len(text)
+                    break
+                pos = end + 1
+                self.url = False
+                continue
+
+            match = TOKEN.search(text, pos)
+            if not match or match.start() >= limit:
+                pos = max(pos, limit)
+                break
+            token = match.group()
+            if token[0] in 'uU' and match.end() == len(text):
+                # Whether a quoted string follows decides the token
+                pos = match.start()
+                break
+            pos = match.end()
+
+            if token == '/*':
+                self.comment = True
+            elif token in ('"', "'"):
+                self.quote = token
+            elif token == '\\':
+                pos += 1
+            elif token == '(':
+                self.depth += 1
+            elif token == ')':
+                self.depth = max(0, self.depth - 1)
+            elif token == '}':
+                if not self.depth:
+                    self.brace_cut = pos
+                    line_end = LINE_END.match(text, pos)
+                    if line_end:
+                        self.line_cut = line_end.end()
+            elif text[pos:pos + 1] in ('"', "'"):
+                self.depth += 1
+            else:
+                self.url = True
+        self.pos = min(pos, len(text))
+
+def split_rules(chunks, max_pending=MAX_PENDING):
+    """Yield the text of an iterable of chunks again, in pieces that end between rules"""
+    splitter = RuleSplitter(max_pending)
+    for chunk in chunks:
+        piece = splitter.feed(chunk)
+        if piece:
+            yield piece
+    rest = splitter.close()
+    if rest:
+        yield rest
+
+def read_chunks(f, chunk_size=CHUNK_SIZE):
+    while True:
+        chunk = f.read(chunk_size)
+        if not chunk:
+            return
+        yield chunk
+
+def _read_pieces(css_path, chunk_size):
+    with open(css_path, 'r') as f:
+        yield from split_rules(read_chunks(f, chunk_size))
+
+def update_css_file(target, css_path, render, colors, history=None, label=None, chunk_size=CHUNK_SIZE):
+    """Render css_path piece by piece into place, return True if the file was rewritten
+
+    render(piece, template) is the target's in-memory renderer for one
+    piece; template says whether the stylesheet has marked slots, which a
+    first pass over the file finds out. The output is staged next to the
+    stylesheet and only renamed over it if something changed. Both
+    versions are streamed into the theme history.
+    """
+    changed = []
+
+    def rendered(pieces, template):
+        for piece in pieces:
+            out = render(piece, template)
+            if out != piece:
+                changed.append(True)
+            yield out
+
+    with TRACE.span("stream", target=target):
+        TRACE.add(bytes_read=os.path.getsize(css_path))
+        template = any(compile_template(piece) for piece in _read_pieces(css_path, chunk_size))
+        if template:
+            TRACE.add(mode="template")
+        tmp_path = stage_stream(css_path, rendered(_read_pieces(css_path, chunk_size), template))
+    if not changed:
+        discard_write(tmp_path)
+        return False
+
+    history = history or ThemeHistory()
+    with contextlib.ExitStack() as hold:
+        # Both snapshots have to be recorded before another run's eviction could see them
+        try:
+            hold.enter_context(history.locked())
+            stored = (history.store_file(css_path), history.store_file(tmp_path))
+        except OSError as e:
+            print(f"Warning: Could not record {target} in theme history: {e}")
+            stored = None
+        try:
+            write_time = commit_write(tmp_path, css_path)
+        except BaseException:
+            discard_write(tmp_path)
+            raise
+        if stored is not None:
+            try:
+                history.record_stored(target, css_path, *stored, palette_key(colors), label, write_time)
+            except Exception as e:
+                print(f"Warning: Could not record {target} in theme history: {e}")
+    return True
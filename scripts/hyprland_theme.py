@@ -0,0 +1,93 @@
+"""Hyprland border colors from the winwal palette
+
+The col.* variables are set where they already are, either inside a
+general { } section or as general:col.* one-liners. Missing ones are added
+to the first general section, next to existing one-liners, or in a new
+general section at the end of the file.
+"""
+
+import re
+
+from color_math import derive
+from theme_trace import TRACE
+
+# Hyprland variable in the general section: (palette key, alpha hex)
+HYPRLAND_SETTINGS = {
+    "col.active_border": ("color4", "ff"),
+    "col.inactive_border": ("color8", "aa"),
+}
+
+# Palette entries render_hyprland reads, used to skip the target when they did not change
+HYPRLAND_COLOR_KEYS = ('color4', 'color8')
+
+# Hyprland's own defaults, for entries missing from the palette
+HYPRLAND_DEFAULTS = {"color4": "#ffffff", "color8": "#444444"}
+
+SECTION_OPEN = re.compile(r'^[ \t]*([\w.:-]+)[ \t]*\{[ \t]*(?:#.*)?$')
+SECTION_CLOSE = re.compile(r'^[ \t]*\}[ \t]*(?:#.*)?$')
+ASSIGNMENT = re.compile(r'^([ \t]*)([\w.:-]+)[ \t]*=[ \t]*(.*?)[ \t]*(?:[ \t]#(?!#).*)?$')
+
+def hyprland_values(colors):
+    """Return {variable: rgba(rrggbbaa)}"""
+    derived = derive(colors)
+    values = {}
+    for name, (key, alpha) in HYPRLAND_SETTINGS.items():
+        values[name] = f"rgba({derived.hex(key, HYPRLAND_DEFAULTS[key]).lstrip('#').lower()}{alpha})"
+    return values
+
+def render_hyprland(content, colors):
+    """Return the Hyprland config with the border colors set to the palette"""
+    values = hyprland_values(colors)
+    lines = content.split('\n')
+    sections = []
+    seen = set()
+    general_end = None      # index of the first general section's closing line
+    child_indent = None
+    one_liners = False      # general:col.* set outside of a section
+    count = 0
+
+    for number, line in enumerate(lines):
+        if line.lstrip().startswith('#'):
+            continue
+        opened = SECTION_OPEN.match(line)
+        if opened:
+            sections.append(opened.group(1))
+            continue
+        if SECTION_CLOSE.match(line):
+            if sections == ['general'] and general_end is None:
+                general_end = number
+            if sections:
+                sections.pop()
+            continue
+
+        assignment = ASSIGNMENT.match(line)
+        if not assignment:
+            continue
+        name = ':'.join(sections + [assignment.group(2)])
+        if sections == ['general'] and child_indent is None:
+            child_indent = assignment.group(1)
+        if not name.startswith('general:') or name[len('general:'):] not in values:
+            continue
+        variable = name[len('general:'):]
+        seen.add(variable)
+        one_liners = one_liners or not sections
+        if assignment.group(3) != values[variable]:
+            lines[number] = line[:assignment.start(3)] + values[variable] + line[assignment.end(3):]
+            count += 1
+
+    missing = [variable for variable in values if variable not in seen]
+    if missing:
+        indent = child_indent if child_indent is not None else '    '
+        added = [f"{indent}{variable} = {values[variable]}" for variable in missing]
+        if general_end is not None:
+            lines[general_end:general_end] = added
+        elif one_liners:
+            last = max(i for i, line in enumerate(lines) if line.strip())
+            lines[last + 1:last + 1] = [f"general:{variable} = {values[variable]}" for variable in missing]
+        else:
+            while lines and not lines[-1].strip():
+                lines.pop()
+            lines += ['', 'general {'] + added + ['}', '']
+        count += len(missing)
+    TRACE.count("substitutions", count)
+    return '\n'.join(lines)
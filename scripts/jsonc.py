@@ -0,0 +1,279 @@
+"""Comment- and format-preserving edits for JSONC files such as komorebi.json
+
+Instead of loading and re-dumping the whole document, the scanner locates
+object members by offset and edits are spliced into the original text, so
+everything outside the changed values is left byte-for-byte untouched.
+"""
+
+import json
+from collections import namedtuple
+
+from theme_trace import TRACE
+
+# Offsets of one "key": value pair inside an object
+Member = namedtuple('Member', 'key key_start value_start value_end')
+
+class JSONCError(ValueError):
+    """Raised when the text is not the JSONC the scanner expects"""
+
+    def __init__(self, message, offset):
+        super().__init__(f"{message} at offset {offset}")
+        self.offset = offset
+
+def skip_whitespace(text, i):
+    """Skip whitespace, // line comments and /* block */ comments"""
+    length = len(text)
+    while i < length:
+        char = text[i]
+        if char in ' \t\r\n':
+            i += 1
+        elif text.startswith('//', i):
+            newline = text.find('\n', i)
+            i = length if newline == -1 else newline + 1
+        elif text.startswith('/*', i):
+            end = text.find('*/', i + 2)
+            if end == -1:
+                raise JSONCError("Unterminated comment", i)
+            i = end + 2
+        else:
+            break
+    return i
+
+def scan_string(text, i):
+    """Return the offset just past the string starting at text[i]"""
+    i += 1
+    while True:
+        end = text.find('"', i)
+        if end == -1:
+            raise JSONCError("Unterminated string", i)
+        # Count the backslashes before the quote to see if it is escaped
+        backslashes = 0
+        while text[end - 1 - backslashes] == '\\':
+            backslashes += 1
+        if backslashes % 2 == 0:
+            return end + 1
+        i = end + 1
+
+def scan_value(text, i):
+    """Return the offset just past the value starting at text[i]"""
+    char = text[i:i + 1]
+    if char == '"':
+        return scan_string(text, i)
+    if char == '{':
+        return scan_object(text, i)[1]
+    if char == '[':
+        return scan_array(text, i)[1]
+
+    # Number, true, false or null
+    start = i
+    while i < len(text) and text[i] not in ' \t\r\n,}]/':
+        i += 1
+    if i == start:
+        raise JSONCError("Expected a value", start)
+    return i
+
+def scan_object(text, i):
+    """Return ([Member], end) for the object starting at text[i], end is past its '}'"""
+    if text[i:i + 1] != '{':
+        raise JSONCError("Expected '{'", i)
+    members = []
+    i = skip_whitespace(text, i + 1)
+    while text[i:i + 1] != '}':
+        if text[i:i + 1] != '"':
+            raise JSONCError("Expected a key", i)
+        key_start = i
+        i = scan_string(text, i)
+        key = json.loads(text[key_start:i])
+
+        i = skip_whitespace(text, i)
+        if text[i:i + 1] != ':':
+            raise JSONCError("Expected ':'", i)
+        value_start = skip_whitespace(text, i + 1)
+        value_end = scan_value(text, value_start)
+        members.append(Member(key, key_start, value_start, value_end))
+
+        i = skip_whitespace(text, value_end)
+        if text[i:i + 1] == ',':
+            i = skip_whitespace(text, i + 1)
+        elif text[i:i + 1] != '}':
+            raise JSONCError("Expected ',' or '}'", i)
+    return members, i + 1
+
+def scan_array(text, i):
+    """Return ([(start, end)], end) for the array starting at text[i], end is past its ']'"""
+    if text[i:i + 1] != '[':
+        raise JSONCError("Expected '['", i)
+    items = []
+    i = skip_whitespace(text, i + 1)
+    while text[i:i + 1] != ']':
+        end = scan_value(text, i)
+        items.append((i, end))
+        i = skip_whitespace(text, end)
+        if text[i:i + 1] == ',':
+            i = skip_whitespace(text, i + 1)
+        elif text[i:i + 1] != ']':
+            raise JSONCError("Expected ',' or ']'", i)
+    return items, i + 1
+
+def find_member(text, path):
+    """Return the Member at a key path like ["theme", "palette"], or None"""
+    start = skip_whitespace(text, 0)
+    member = None
+    for key in path:
+        members, _ = scan_object(text, start)
+        member = next((m for m in members if m.key == key), None)
+        if member is None:
+            return None
+        start = member.value_start
+    return member
+
+def loads(text):
+    """Parse JSONC by blanking out comments and trailing commas, keeping offsets intact"""
+    chars = list(text)
+    i = 0
+    last_significant = None
+    while i < len(text):
+        char = text[i]
+        if char == '"':
+            end = scan_string(text, i)
+            last_significant = end - 1
+            i = end
+        elif text.startswith('//', i) or text.startswith('/*', i):
+            end = skip_whitespace(text, i)
+            for j in range(i, end):
+                if chars[j] not in '\r\n':
+                    chars[j] = ' '
+            i = end
+        elif char in '}]':
+            if last_significant is not None and text[last_significant] == ',':
+                chars[last_significant] = ' '
+            last_significant = i
+            i += 1
+        else:
+            if char not in ' \t\r\n':
+                last_significant = i
+            i += 1
+    return json.loads(''.join(chars))
+
+def _line_indent(text, offset):
+    """Return the whitespace at the start of the line containing offset"""
+    line_start = text.rfind('\n', 0, offset) + 1
+    end = line_start
+    while end < offset and text[end] in ' \t':
+        end += 1
+    return text[line_start:end]
+
+def indent_unit(text):
+    """Guess the file's indentation unit from its first indented line"""
+    for line in text.splitlines():
+        stripped = line.lstrip(' \t')
+        if stripped and len(stripped) < len(line):
+            indent = line[:len(line) - len(stripped)]
+            return '\t' if indent.startswith('\t') else indent
+    return '  '
+
+def format_object(values, indent, unit):
+    """Format a flat {key: value} dict in the file's own indentation style"""
+    lines = [f'{indent}{unit}{json.dumps(key)}: {json.dumps(value)}' for key, value in values.items()]
+    return '{\n' + ',\n'.join(lines) + f'\n{indent}}}'
+
+def _insert_member(text, members, key, value_text, after=None):
+    """Return an edit adding "key": value_text to a non-empty object, after the named member if present"""
+    anchor = next((m for m in members if m.key == after), members[-1])
+    indent = _line_indent(text, anchor.key_start)
+    return (anchor.value_end, anchor.value_end, f',\n{indent}{json.dumps(key)}: {value_text}')
+
+def apply_edits(text, edits):
+    """Splice (start, end, replacement) edits into text in one pass
+
+    Edits at the same offset are applied in the order given.
+    """
+    TRACE.count("substitutions", len(edits))
+    parts = []
+    pos = 0
+    for start, end, replacement in sorted(edits, key=lambda edit: edit[0]):
+        parts.append(text[pos:start])
+        parts.append(replacement)
+        pos = end
+    parts.append(text[pos:])
+    return ''.join(parts)
+
+def set_object_values(text, key, values, after=None):
+    """Set string values inside a top-level object member, splicing only what changed
+
+    Existing values are replaced in place, missing keys are appended to the
+    object, and a missing object is inserted after the `after` member (or
+    at the end of the document). Everything else keeps its bytes, comments
+    and formatting.
+    """
+    unit = indent_unit(text)
+    root_start = skip_whitespace(text, 0)
+    root_members, root_end = scan_object(text, root_start)
+    member = next((m for m in root_members if m.key == key), None)
+
+    if member is None:
+        if not root_members:
+            value_text = format_object(values, unit, unit)
+            return apply_edits(text, [(root_start, root_end, f'{{\n{unit}{json.dumps(key)}: {value_text}\n}}')])
+        indent = _line_indent(text, root_members[0].key_start)
+        edit = _insert_member(text, root_members, key, format_object(values, indent, unit), after)
+        return apply_edits(text, [edit])
+
+    members = []
+    if text[member.value_start] == '{':
+        members, _ = scan_object(text, member.value_start)
+    if not members:
+        value_text = format_object(values, _line_indent(text, member.key_start), unit)
+        return apply_edits(text, [(member.value_start, member.value_end, value_text)])
+
+    return apply_edits(text, _member_edits(text, members, values))
+
+def _member_edits(text, members, values):
+    """Return the edits setting {key: value} in an object with the given non-empty members"""
+    existing = {m.key: m for m in members}
+    edits = []
+    for name, value in values.items():
+        value_text = json.dumps(value)
+        if name not in existing:
+            edits.append(_insert_member(text, members, name, value_text))
+        elif text[existing[name].value_start:existing[name].value_end] != value_text:
+            edits.append((existing[name].value_start, existing[name].value_end, value_text))
+    return edits
+
+def set_array_item_values(text, key, match_key, match_value, values):
+    """Set string values in the object of a top-level array whose match_key is match_value
+
+    Used for lists of named objects such as Windows Terminal's schemes. A
+    missing object is appended to the array (with match_key first), and a
+    missing array is added at the end of the document.
+    """
+    unit = indent_unit(text)
+    root_start = skip_whitespace(text, 0)
+    root_members, root_end = scan_object(text, root_start)
+    member = next((m for m in root_members if m.key == key), None)
+    new_values = {match_key: match_value, **values}
+
+    if member is None:
+        indent = _line_indent(text, root_members[0].key_start) if root_members else unit
+        array_text = f'[\n{indent}{unit}{format_object(new_values, indent + unit, unit)}\n{indent}]'
+        if not root_members:
+            return apply_edits(text, [(root_start, root_end, f'{{\n{unit}{json.dumps(key)}: {array_text}\n}}')])
+        return apply_edits(text, [_insert_member(text, root_members, key, array_text)])
+
+    if text[member.value_start] != '[':
+        raise JSONCError(f"Expected {key} to be an array", member.value_start)
+    items, _ = scan_array(text, member.value_start)
+    for start, end in items:
+        if text[start] != '{':
+            continue
+        members, _ = scan_object(text, start)
+        found = next((m for m in members if m.key == match_key), None)
+        if found is not None and json.loads(text[found.value_start:found.value_end]) == match_value:
+            return apply_edits(text, _member_edits(text, members, values))
+
+    key_indent = _line_indent(text, member.key_start)
+    if not items:
+        value_text = f'[\n{key_indent}{unit}{format_object(new_values, key_indent + unit, unit)}\n{key_indent}]'
+        return apply_edits(text, [(member.value_start, member.value_end, value_text)])
+    indent = _line_indent(text, items[-1][0])
+    return apply_edits(text, [(items[-1][1], items[-1][1], f',\n{indent}{format_object(new_values, indent, unit)}')])
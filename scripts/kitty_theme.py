@@ -0,0 +1,75 @@
+"""kitty.conf colors from the winwal palette
+
+Settings that already exist are rewritten in place (every occurrence, as
+kitty uses the last one); missing ones are appended in a block at the end
+of the file, after any include, so they take precedence.
+"""
+
+import re
+
+from color_math import derive
+from theme_trace import TRACE
+
+# kitty setting: palette key
+KITTY_SETTINGS = {
+    "foreground": "foreground",
+    "background": "background",
+    "cursor": "cursor",
+    "selection_foreground": "background",
+    "selection_background": "foreground",
+    "active_border_color": "color4",
+    "inactive_border_color": "color8",
+    "active_tab_foreground": "background",
+    "active_tab_background": "color4",
+    "inactive_tab_foreground": "foreground",
+    "inactive_tab_background": "color0",
+    **{f"color{i}": f"color{i}" for i in range(16)},
+}
+
+# Palette entries render_kitty reads, used to skip the target when they did not change
+KITTY_COLOR_KEYS = tuple(dict.fromkeys(KITTY_SETTINGS.values()))
+
+# kitty's own defaults, for entries missing from the palette
+KITTY_DEFAULTS = {
+    "foreground": "#dddddd", "background": "#000000", "cursor": "#cccccc",
+    "color0": "#000000", "color1": "#cc0403", "color2": "#19cb00", "color3": "#cecb00",
+    "color4": "#0d73cc", "color5": "#cb1ed1", "color6": "#0dcdcd", "color7": "#dddddd",
+    "color8": "#767676", "color9": "#f2201f", "color10": "#23fd00", "color11": "#fffd00",
+    "color12": "#1a8fff", "color13": "#fd28ff", "color14": "#14ffff", "color15": "#ffffff",
+}
+
+BLOCK_HEADER = "# Colors from winwal"
+SETTING_LINE = re.compile(r'^[ \t]*(\w+)[ \t]+(\S[^\n]*?)[ \t]*$', re.MULTILINE)
+
+def kitty_values(colors):
+    """Return {kitty setting: hex color}"""
+    derived = derive(colors)
+    return {setting: derived.hex(key, KITTY_DEFAULTS[key]) for setting, key in KITTY_SETTINGS.items()}
+
+def render_kitty(content, colors):
+    """Return kitty.conf with the color settings set to the palette"""
+    values = kitty_values(colors)
+    seen = set()
+    count = 0
+
+    def replace(match):
+        nonlocal count
+        setting = match.group(1)
+        if setting not in values:
+            return match.group(0)
+        seen.add(setting)
+        if match.group(2) == values[setting]:
+            return match.group(0)
+        count += 1
+        return match.group(0)[:match.start(2) - match.start(0)] + values[setting]
+
+    rendered = SETTING_LINE.sub(replace, content)
+    missing = [setting for setting in values if setting not in seen]
+    if missing:
+        width = max(len(setting) for setting in missing)
+        block = [BLOCK_HEADER] if BLOCK_HEADER not in rendered else []
+        block += [f"{setting:<{width}} {values[setting]}" for setting in missing]
+        rendered = rendered.rstrip('\n') + ('\n\n' if block[0] == BLOCK_HEADER else '\n') + '\n'.join(block) + '\n'
+        count += len(missing)
+    TRACE.count("substitutions", count)
+    return rendered
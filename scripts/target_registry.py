@@ -0,0 +1,167 @@
+"""Registry of the configs a palette is applied to
+
+A target declares its config file (relative to the home directory), the
+module implementing it, and by name the render function, the palette keys
+it reads and optionally a template marker. Render functions take the config
+text and the flat palette and return the new text, so one palette load can
+theme every target.
+
+Modules are imported on first use, so running with a few targets enabled
+only pays for those. More targets can be declared in
+~/.config/wal/targets.json, with their modules in ~/.config/wal/targets/:
+
+    {"nvim": {"path": ".config/nvim/lua/plugins/wal.lua", "module": "nvim_theme",
+              "render": "render_nvim", "color_keys": "NVIM_COLOR_KEYS"},
+     "kitty": null}
+
+A null entry disables a built-in target, and "animate": true streams
+transition frames to a target whose app reloads its config live.
+"""
+
+import importlib
+import importlib.util
+import json
+import sys
+import threading
+from collections import namedtuple
+from pathlib import Path
+
+PLUGINS_PATH = Path.home() / ".config" / "wal" / "targets.json"
+PLUGINS_DIR = Path.home() / ".config" / "wal" / "targets"
+
+# path is relative to the home directory; render, color_keys and mark are attribute names in module.
+# animate marks targets whose app reloads the file live, so transitions stream frames to it.
+TargetSpec = namedtuple('TargetSpec', 'name path module render color_keys mark animate', defaults=(None, False))
+
+BUILTIN_TARGETS = [
+    TargetSpec("glazewm", ".config/glazewm/config.yaml", "UpdateGlazeColors", "render_glazewm", "GLAZEWM_COLOR_KEYS", "mark_glazewm"),
+    TargetSpec("zebar", ".glzr/zebar/starter/styles.css", "UpdateGlazeColors", "render_zebar_css", "ZEBAR_COLOR_KEYS", "mark_zebar_css", animate=True),
+    TargetSpec("komorebi", ".config/komorebi/komorebi.json", "UpdateKomorebiColors", "render_komorebi", "KOMOREBI_COLOR_KEYS", animate=True),
+    TargetSpec("yasb", ".config/yasb/styles.css", "UpdateYasbColors", "render_yasb_css", "YASB_COLOR_KEYS", "mark_yasb_css", animate=True),
+    TargetSpec("kitty", ".config/kitty/kitty.conf", "kitty_theme", "render_kitty", "KITTY_COLOR_KEYS"),
+    TargetSpec("hyprland", ".config/hypr/userprefs.conf", "hyprland_theme", "render_hyprland", "HYPRLAND_COLOR_KEYS"),
+    TargetSpec("windows-terminal", "AppData/Local/Packages/Microsoft.WindowsTerminal_8wekyb3d8bbwe/LocalState/settings.json",
+               "wt_theme", "render_windows_terminal", "WT_COLOR_KEYS"),
+]
+
+# Plugin modules by resolved file path; two plugin directories may each have a module of the same name
+_plugin_modules = {}
+# Held while a plugin runs with its directory on sys.path
+_plugin_lock = threading.Lock()
+
+def load_plugin_module(path):
+    """Import a plugin module from its file, once per path and without taking over its name in sys.modules
+
+    Helpers the plugin imports from its own directory are found there while
+    it loads and dropped from sys.modules again afterwards, so every plugin
+    directory gets its own copy of a helper with a common name. Helpers have
+    to be imported when the plugin loads, not later from its functions.
+    """
+    path = Path(path).resolve()
+    with _plugin_lock:
+        module = _plugin_modules.get(path)
+        if module is None:
+            module = _exec_plugin(path)
+            _plugin_modules[path] = module
+    return module
+
+def _exec_plugin(path):
+    directory = path.parent
+    loaded = set(sys.modules)
+    sys.path.insert(0, str(directory))
+    try:
+        spec = importlib.util.spec_from_file_location(path.stem, path)
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+    finally:
+        sys.path.remove(str(directory))
+        for name in set(sys.modules) - loaded:
+            if _is_in(getattr(sys.modules[name], '__file__', None), directory):
+                del sys.modules[name]
+    return module
+
+def _is_in(file, directory):
+    if not file:
+        return False
+    try:
+        Path(file).resolve().relative_to(directory)
+        return True
+    except ValueError:
+        return False
+
+class Target:
+    """One themed config, importing its module only when render or the keys are needed
+
+    A module found in plugins_dir is loaded from there, otherwise it is imported by name.
+    """
+
+    def __init__(self, spec, home_dir, plugins_dir=None):
+        self.spec = spec
+        self.name = spec.name
+        self.path = Path(home_dir) / spec.path
+        self.plugins_dir = plugins_dir
+        self._module = None
+
+    @property
+    def module(self):
+        if self._module is None:
+            plugin_path = Path(self.plugins_dir) / f"{self.spec.module}.py" if self.plugins_dir else None
+            if plugin_path is not None and plugin_path.is_file():
+                self._module = load_plugin_module(plugin_path)
+            else:
+                self._module = importlib.import_module(self.spec.module)
+        return self._module
+
+    @property
+    def render(self):
+        return getattr(self.module, self.spec.render)
+
+    @property
+    def color_keys(self):
+        return tuple(getattr(self.module, self.spec.color_keys))
+
+    @property
+    def mark(self):
+        """Template marker function, or None if the target has no template mode"""
+        return getattr(self.module, self.spec.mark) if self.spec.mark else None
+
+    @property
+    def animate(self):
+        return self.spec.animate
+
+    def __repr__(self):
+        return f"Target({self.name!r}, {str(self.path)!r})"
+
+def load_plugin_specs(plugins_path=PLUGINS_PATH):
+    """Return {name: TargetSpec or None} declared in targets.json, empty if there is none"""
+    try:
+        with open(plugins_path, 'r', encoding='utf-8') as f:
+            declared = json.load(f)
+    except FileNotFoundError:
+        return {}
+    except (OSError, ValueError) as e:
+        print(f"Warning: Could not read {plugins_path}: {e}")
+        return {}
+    if not isinstance(declared, dict):
+        print(f"Warning: Could not read {plugins_path}: expected an object of targets")
+        return {}
+
+    specs = {}
+    for name, entry in declared.items():
+        if entry is None:
+            specs[name] = None
+            continue
+        try:
+            specs[name] = TargetSpec(name, entry["path"], entry["module"], entry["render"],
+                                     entry["color_keys"], entry.get("mark"), bool(entry.get("animate")))
+        except (KeyError, TypeError) as e:
+            print(f"Warning: Ignoring target {name} in {plugins_path}: missing {e}")
+    return specs
+
+def discover_targets(home_dir, plugins_path=PLUGINS_PATH, plugins_dir=PLUGINS_DIR):
+    """Return {name: Target} for the built-in and declared targets; nothing is imported yet"""
+    specs = {spec.name: spec for spec in BUILTIN_TARGETS}
+    plugins = load_plugin_specs(plugins_path)
+    specs.update(plugins)
+    return {name: Target(spec, home_dir, plugins_dir if name in plugins else None)
+            for name, spec in specs.items() if spec is not None}
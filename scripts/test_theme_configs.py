@@ -0,0 +1,227 @@
+# filepath: test_theme_configs.py
+"""Checks for the palette parser corpus and that the renderers agree: streamed, marked and in-memory output"""
+
+import concurrent.futures
+import importlib
+import json
+import sys
+import threading
+from pathlib import Path
+from types import SimpleNamespace
+
+import pytest
+
+SCRIPTS_DIR = Path(__file__).resolve().parent
+YASB_CSS = SCRIPTS_DIR.parent / "yasb" / "styles.css"
+
+@pytest.fixture(scope="module")
+def home(tmp_path_factory):
+    """A scratch home directory, set before the scripts resolve their cache paths on import"""
+    home_dir = tmp_path_factory.mktemp("home")
+    with pytest.MonkeyPatch.context() as mp:
+        mp.setenv("HOME", str(home_dir))
+        mp.setenv("USERPROFILE", str(home_dir))
+        yield home_dir
+
+@pytest.fixture(scope="module")
+def scripts(home):
+    return {name: importlib.import_module(name) for name in (
+        "ApplyTheme", "BenchmarkThemes", "UpdateGlazeColors", "UpdateYasbColors", "css_stream",
+        "target_registry", "theme_history", "theme_io", "theme_template", "theme_transition", "wal_palette")}
+
+@pytest.fixture(scope="module")
+def palettes(scripts):
+    """Two different palettes from the corpus samples: one as shipped and one rotated"""
+    sample = scripts["wal_palette"].CORPUS_DIR / "pywal-flat.json"
+    colors = scripts["wal_palette"].parse_palette(sample.read_text()).flat()
+    rotated = dict(colors)
+    for n in range(16):
+        rotated[f"color{n}"] = colors[f"color{(n + 5) % 16}"]
+    rotated["background"], rotated["foreground"] = colors["foreground"], colors["background"]
+    return colors, rotated
+
+@pytest.fixture(scope="module")
+def stylesheets(scripts):
+    """(name, stylesheet text, render, mark, stream renderer factory, updater)"""
+    yasb = scripts["UpdateYasbColors"]
+    glaze = scripts["UpdateGlazeColors"]
+    return [
+        ("yasb", YASB_CSS.read_text(),
+         yasb.render_yasb_css, yasb.mark_yasb_css, yasb.yasb_piece_renderer, yasb.update_yasb_css),
+        ("zebar", scripts["BenchmarkThemes"].scale_zebar(3),
+         glaze.render_zebar_css, glaze.mark_zebar_css, glaze.zebar_piece_renderer, glaze.update_zebar_css),
+    ]
+
+def test_palette_corpus_parses_as_expected(scripts):
+    assert scripts["wal_palette"].check_corpus() == []
+
+def test_palette_parser_only_raises_parse_errors(scripts):
+    assert scripts["wal_palette"].fuzz_corpus(200, seed=0) == []
+
+@pytest.mark.parametrize("target", ["yasb", "zebar", "glazewm", "glazewm-comments"])
+def test_marking_does_not_change_the_output(scripts, palettes, stylesheets, target):
+    glaze = scripts["UpdateGlazeColors"]
+    glazewm = scripts["BenchmarkThemes"].GLAZEWM_BASE
+    # Inline comments, other quoting and trailing whitespace on the marked lines are kept
+    commented = (glazewm.replace('color: "#8dbcff"', "color: '#8dbcff' # accent")
+                        .replace('color: "#a1a1a1"', 'color: gray\t# unfocused  '))
+    assert commented != glazewm
+    configs = {name: (text, render, mark) for name, text, render, mark, _, _ in stylesheets}
+    configs["glazewm"] = (glazewm, glaze.render_glazewm, glaze.mark_glazewm)
+    configs["glazewm-comments"] = (commented, glaze.render_glazewm, glaze.mark_glazewm)
+    text, render, mark = configs[target]
+    strip_markers = scripts["theme_template"].strip_markers
+    first, second = palettes
+    with scripts["theme_template"].memory_cache():
+        marked = mark(text, first)
+        assert strip_markers(marked) == render(text, first)
+        assert strip_markers(render(marked, second)) == render(text, second)
+
+@pytest.mark.parametrize("marked", [False, True])
+@pytest.mark.parametrize("chunk_size", [1, 7, 4096])
+def test_streamed_matches_in_memory(scripts, palettes, stylesheets, tmp_path, marked, chunk_size):
+    css_stream = scripts["css_stream"]
+    history = scripts["theme_history"].ThemeHistory(tmp_path / "history")
+    first, second = palettes
+    for name, text, render, mark, renderer, _ in stylesheets:
+        if marked:
+            text = mark(text, first)
+        path = tmp_path / f"{name}.css"
+        path.write_text(text)
+        assert css_stream.update_css_file(name, path, renderer(second), second, history, chunk_size=chunk_size)
+        assert path.read_text() == render(text, second), name
+
+        # Lines longer than max_pending, as in minified stylesheets, are cut after any closing brace
+        chunks = [text[i:i + chunk_size] for i in range(0, len(text), chunk_size)]
+        pieces = list(css_stream.split_rules(chunks, max_pending=16))
+        template = any(scripts["theme_template"].compile_template(piece) for piece in pieces)
+        assert ''.join(renderer(second)(piece, template) for piece in pieces) == render(text, second), name
+
+def test_parentheses_in_comments_and_strings_keep_cutting(scripts):
+    rules = ''.join(f".rule-{n} {{ color: #{n:06x}; }}\n" for n in range(2000))
+    text = '/* :( */\n.a { content: "("; background: url(x/*y); }\n' + rules
+    pieces = list(scripts["css_stream"].split_rules(text[i:i + 4096] for i in range(0, len(text), 4096)))
+    assert ''.join(pieces) == text
+    assert len(pieces) > 1 and max(map(len, pieces)) < 2 * 4096
+
+@pytest.mark.parametrize("target", ["yasb", "zebar"])
+def test_threshold_zero_updates_like_in_memory(scripts, palettes, stylesheets, tmp_path, monkeypatch, target):
+    first, second = palettes
+    name, text, render, _, _, update = next(sheet for sheet in stylesheets if sheet[0] == target)
+    history = scripts["theme_history"].ThemeHistory(tmp_path / "history")
+    expected = render(text, second)
+
+    path = tmp_path / f"{name}.css"
+    path.write_text(text)
+    monkeypatch.setattr(scripts["UpdateYasbColors"], "STREAM_THRESHOLD", 0)
+    monkeypatch.setattr(scripts["UpdateGlazeColors"], "STREAM_THRESHOLD", 0)
+    assert update(str(path), second, history) == (expected != text)
+    assert path.read_text() == expected
+    assert not update(str(path), second, history)
+
+def _animate(scripts, states, palettes):
+    apply_theme = scripts["ApplyTheme"]
+    first, second = palettes
+    with concurrent.futures.ThreadPoolExecutor() as executor:
+        return apply_theme.apply_theme(states, second, executor, transition=(first, 0.1, 30))
+
+def _state(scripts, target):
+    history = scripts["theme_history"].ThemeHistory(target.path.parent / "history")
+    return scripts["ApplyTheme"].TargetState(target, history)
+
+def test_transition_ends_on_the_normal_render(scripts, palettes, tmp_path, monkeypatch):
+    registry = scripts["target_registry"]
+    yasb = registry.Target(registry.TargetSpec("yasb", "styles.css", "UpdateYasbColors", "render_yasb_css",
+                                               "YASB_COLOR_KEYS", "mark_yasb_css", animate=True), tmp_path)
+    glazewm = registry.Target(registry.TargetSpec("glazewm", "config.yaml", "UpdateGlazeColors",
+                                                  "render_glazewm", "GLAZEWM_COLOR_KEYS"), tmp_path)
+    text = YASB_CSS.read_text()
+    yasb.path.write_text(text)
+    glazewm.path.write_text(scripts["BenchmarkThemes"].GLAZEWM_BASE)
+
+    # The targets without a transition are in place before the first frame
+    frames = []
+    write_if_changed = scripts["theme_transition"].write_if_changed
+    def record_frame(path, current, text):
+        frames.append(glazewm.path.read_text())
+        return write_if_changed(path, current, text)
+    monkeypatch.setattr(scripts["theme_transition"], "write_if_changed", record_frame)
+
+    states = [_state(scripts, yasb), _state(scripts, glazewm)]
+    assert _animate(scripts, states, palettes) == {"yasb": ("written", None), "glazewm": ("written", None)}
+    assert frames and frames[0] == glazewm.path.read_text()
+    assert yasb.path.read_text() == scripts["UpdateYasbColors"].render_yasb_css(text, palettes[1])
+
+def test_transition_skips_a_marking_that_changes_the_output(scripts, palettes, tmp_path, monkeypatch):
+    # A marker on a value the renderer leaves alone would animate it, then snap back at the end
+    text = ".unmapped { color: #123456; }\n" + YASB_CSS.read_text()
+    target = SimpleNamespace(
+        name="custom", path=tmp_path / "custom.css", animate=True, color_keys=("color1",),
+        render=scripts["UpdateYasbColors"].render_yasb_css,
+        mark=lambda css, colors: css.replace("#123456", scripts["theme_template"].css_marker("color1") + "#123456"))
+    target.path.write_text(text)
+
+    frames = []
+    write_if_changed = scripts["theme_transition"].write_if_changed
+    def record_frame(path, current, text):
+        frames.append(text)
+        return write_if_changed(path, current, text)
+    monkeypatch.setattr(scripts["theme_transition"], "write_if_changed", record_frame)
+
+    assert _animate(scripts, [_state(scripts, target)], palettes) == {"custom": ("written", None)}
+    assert frames and all(".unmapped { color: #123456; }" in frame for frame in frames)
+    assert target.path.read_text() == target.render(text, palettes[1])
+
+def test_a_change_to_a_hand_marked_entry_is_applied(scripts, palettes, tmp_path):
+    registry = scripts["target_registry"]
+    target = registry.Target(registry.TargetSpec("yasb", "styles.css", "UpdateYasbColors", "render_yasb_css",
+                                                 "YASB_COLOR_KEYS", "mark_yasb_css"), tmp_path)
+    first = palettes[0]
+    target.path.write_text(".accent { color: " + scripts["theme_template"].css_marker("color13") + "#000000; }\n")
+    state = _state(scripts, target)
+    batch = scripts["theme_io"].WriteBatch()
+    assert state.stage(first, batch)
+    batch.commit()
+    state.written(state.pending, first)
+
+    changed = dict(first, color13="#123456")
+    assert changed != first and state.stage(changed, batch)
+    batch.commit()
+    assert "#123456" in target.path.read_text()
+
+def test_plugin_helpers_load_from_their_own_root(scripts, tmp_path, capsys):
+    registry = scripts["target_registry"]
+    entry = {"path": "plugin.conf", "module": "plugin_theme", "render": "render", "color_keys": "KEYS"}
+    renders = []
+    for root in ("one", "two"):
+        config_dir = tmp_path / root
+        (config_dir / "targets").mkdir(parents=True)
+        (config_dir / "targets.json").write_text(json.dumps({"plugin": entry}))
+        (config_dir / "targets" / "plugin_helper.py").write_text(f"ROOT = {root!r}\n")
+        (config_dir / "targets" / "plugin_theme.py").write_text(
+            "from plugin_helper import ROOT\nKEYS = ()\ndef render(text, colors):\n    return ROOT\n")
+        targets = registry.discover_targets(config_dir, config_dir / "targets.json", config_dir / "targets")
+        renders.append(targets["plugin"].render("", {}))
+    assert renders == ["one", "two"]
+    assert str(tmp_path / "one" / "targets") not in sys.path
+
+    (tmp_path / "list.json").write_text("[]")
+    assert registry.load_plugin_specs(tmp_path / "list.json") == {}
+    assert "expected an object" in capsys.readouterr().out
+
+def test_eviction_waits_for_snapshots_being_recorded(scripts, tmp_path):
+    ThemeHistory = scripts["theme_history"].ThemeHistory
+    history = ThemeHistory(tmp_path, max_entries=1)
+    other = ThemeHistory(tmp_path, max_entries=1)
+    other.record("b", "/b", "old", "new", "k0")
+    evicting = threading.Thread(target=other.record, args=("b", "/b", "new", "newer", "k1"))
+    with history.locked():
+        stored = history.store("before"), history.store("after")
+        evicting.start()
+        evicting.join(0.2)
+        assert evicting.is_alive()
+        history.record_stored("a", "/a", *stored, "ka")
+    evicting.join()
+    for entry in history.entries():
+        for file in entry["files"].values():
+            history.load(file["sha256"])
@@ -0,0 +1,274 @@
+"""Content-addressed theme history shared by the theme updaters
+
+Every config the updaters rewrite is stored once under objects/ by the
+sha256 of its content, so identical snapshots are skipped instead of copied.
+history.json lists one entry per applied theme mapping each target to the
+object it was written with, which makes any earlier theme restorable.
+"""
+
+import contextlib
+import hashlib
+import json
+import ntpath
+import os
+import re
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+from theme_io import WriteBatch, atomic_write, file_lock
+from theme_trace import TRACE
+
+HISTORY_DIR = Path.home() / ".cache" / "wal" / "theme-history"
+MAX_ENTRIES = 50
+# Snapshots are named by their sha256; anything else under objects/ is a temp file
+SNAPSHOT_NAME = re.compile(r'[0-9a-f]{64}')
+
+def palette_key(colors):
+    """Identify a palette by the hash of its colors"""
+    return hashlib.sha256(json.dumps(colors, sort_keys=True).encode('utf-8')).hexdigest()[:16]
+
+def palette_label(palette):
+    """Name a theme after its wallpaper (winwal writes Windows paths)"""
+    return ntpath.basename(palette.wallpaper) if palette.wallpaper else None
+
+class ThemeHistory:
+    """Deduplicated store of config snapshots with bounded retention"""
+
+    def __init__(self, root=HISTORY_DIR, max_entries=MAX_ENTRIES):
+        self.root = Path(root)
+        self.objects_dir = self.root / "objects"
+        self.index_path = self.root / "history.json"
+        self.lock_path = self.root / "history.lock"
+        self.max_entries = max_entries
+        self.lock = threading.RLock()
+        self._depth = 0
+
+    @contextlib.contextmanager
+    def locked(self):
+        """Hold the history against other threads and processes; nested uses share the hold
+
+        Snapshots must be stored and recorded under one hold, or another
+        process evicting in between would delete them as unreferenced.
+        """
+        with self.lock:
+            if self._depth:
+                self._depth += 1
+                try:
+                    yield
+                finally:
+                    self._depth -= 1
+                return
+            self.root.mkdir(parents=True, exist_ok=True)
+            with file_lock(self.lock_path):
+                self._depth = 1
+                try:
+                    yield
+                finally:
+                    self._depth = 0
+
+    def _object_path(self, digest):
+        return self.objects_dir / digest[:2] / digest
+
+    def store(self, text):
+        """Store a config's content unless an identical snapshot exists, return its hash"""
+        data = text.encode('utf-8')
+        digest = hashlib.sha256(data).hexdigest()
+        path = self._object_path(digest)
+        if not path.exists():
+            path.parent.mkdir(parents=True, exist_ok=True)
+            atomic_write(path, data)
+        return digest
+
+    def store_file(self, path, chunk_size=64 * 1024):
+        """store() for a file's content, copied in chunks so it is never held in memory"""
+        digest = hashlib.sha256()
+        # Staged under objects/tmp, which eviction leaves alone, until the digest is known
+        tmp_dir = self.objects_dir / "tmp"
+        tmp_dir.mkdir(parents=True, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(suffix=".tmp", dir=tmp_dir)
+        tmp_path = Path(tmp_path)
+        os.close(fd)
+        try:
+            # Text mode like the updaters' reads, so the digest matches store() of the same config
+            with open(path, 'r') as src, open(tmp_path, 'wb') as dst:
+                for chunk in iter(lambda: src.read(chunk_size), ''):
+                    data = chunk.encode('utf-8')
+                    digest.update(data)
+                    dst.write(data)
+            digest = digest.hexdigest()
+            object_path = self._object_path(digest)
+            if object_path.exists():
+                return digest
+            object_path.parent.mkdir(parents=True, exist_ok=True)
+            os.replace(tmp_path, object_path)
+            return digest
+        finally:
+            if tmp_path.exists():
+                tmp_path.unlink()
+
+    def load(self, digest):
+        """Return the content of a stored snapshot"""
+        with open(self._object_path(digest), 'rb') as f:
+            return f.read().decode('utf-8')
+
+    def entries(self):
+        """Return the history entries, oldest first"""
+        try:
+            with open(self.index_path, 'r', encoding='utf-8') as f:
+                return json.load(f).get("entries", [])
+        except (OSError, ValueError):
+            return []
+
+    def _save(self, entries):
+        self.root.mkdir(parents=True, exist_ok=True)
+        atomic_write(self.index_path, json.dumps({"entries": entries}, indent=1).encode('utf-8'))
+
+    def record(self, target, path, previous, rendered, key, label=None, write_time=None):
+        """Record that target was rewritten from previous to rendered for a theme key
+
+        Updates for the same palette are merged into one entry, so running
+        the updaters one after another still yields a single theme. If the
+        file on disk was not written by us (first run or a manual edit), its
+        previous content is recorded as an "external" entry first so it can
+        be rolled back to. write_time is when the file was renamed into place,
+        which is what reload latency is measured from; it defaults to now.
+        """
+        with self.locked():
+            self.record_stored(target, path, self.store(previous), self.store(rendered), key, label, write_time)
+
+    def record_stored(self, target, path, previous_sha256, rendered_sha256, key, label=None, write_time=None):
+        """record() for contents already stored, e.g. with store_file, under the same locked()"""
+        # Other processes (a watcher and a manual run, say) read, modify and save the same index
+        with self.locked():
+            entries = self.entries()
+            now = time.time()
+            previous_file = {"path": str(path), "sha256": previous_sha256}
+            rendered_file = {"path": str(path), "sha256": rendered_sha256}
+
+            last = entries[-1] if entries else None
+            merge = last is not None and last["key"] == key and target not in last["files"]
+
+            latest = self._latest(entries, target)
+            if latest is None or latest["sha256"] != previous_file["sha256"]:
+                position = len(entries) - 1 if merge else len(entries)
+                external = entries[position - 1] if position > 0 else None
+                if external and external["key"] == "external" and target not in external["files"]:
+                    external["files"][target] = previous_file
+                else:
+                    entries.insert(position, {"key": "external", "time": now, "label": "external", "files": {target: previous_file}})
+
+            if merge:
+                current = entries[-1]
+            else:
+                current = {"key": key, "files": {}}
+                entries.append(current)
+            current["time"] = now
+            current["label"] = label or current.get("label") or key
+            current["files"][target] = dict(rendered_file, time=now if write_time is None else write_time)
+
+            self._evict(entries)
+            self._save(entries)
+
+    @staticmethod
+    def _latest(entries, target, index=None):
+        """Return the newest recorded file for target, up to and including entries[index]"""
+        end = len(entries) if index is None else index + 1
+        for entry in reversed(entries[:end]):
+            if target in entry["files"]:
+                return entry["files"][target]
+        return None
+
+    def _evict(self, entries):
+        """Drop the oldest entries beyond the limit and delete unreferenced snapshots"""
+        if len(entries) <= self.max_entries:
+            return
+
+        # Carry each target's oldest surviving state into the new first entry
+        dropped = entries[:len(entries) - self.max_entries]
+        del entries[:len(dropped)]
+        for entry in reversed(dropped):
+            for target, file in entry["files"].items():
+                entries[0]["files"].setdefault(target, file)
+
+        referenced = {file["sha256"] for entry in entries for file in entry["files"].values()}
+        # Only snapshots are deleted; temp files of writes in progress are left alone
+        for bucket in self.objects_dir.iterdir():
+            if bucket.name == "tmp" or not bucket.is_dir():
+                continue
+            for path in bucket.iterdir():
+                if SNAPSHOT_NAME.fullmatch(path.name) and path.name not in referenced and path.is_file():
+                    path.unlink()
+
+    def snapshot(self, steps_back):
+        """Return (entry, {target: file}) for the theme steps_back entries before the latest"""
+        entries = self.entries()
+        index = len(entries) - 1 - steps_back
+        if steps_back < 0 or index < 0:
+            raise IndexError(f"history has {len(entries)} entries")
+
+        files = {}
+        for target in {target for entry in entries for target in entry["files"]}:
+            file = self._latest(entries, target, index)
+            if file is not None:
+                files[target] = file
+        return entries[index], files
+
+def list_history(history):
+    """Print the recorded themes, newest first"""
+    entries = history.entries()
+    if not entries:
+        print("No theme history recorded yet")
+        return
+
+    for steps_back, entry in enumerate(reversed(entries)):
+        when = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(entry["time"]))
+        targets = ', '.join(sorted(entry["files"]))
+        print(f"{steps_back:3d}  {when}  {entry['label']}  [{targets}]")
+
+def record_theme(target, path, previous, rendered, colors, history=None, label=None, write_time=None):
+    """Record a rewritten config in the theme history, warning instead of failing"""
+    try:
+        with TRACE.span("record history", target=target):
+            (history or ThemeHistory()).record(target, path, previous, rendered, palette_key(colors), label, write_time)
+    except Exception as e:
+        print(f"Warning: Could not record {target} in theme history: {e}")
+
+def rollback(history, steps_back):
+    """Restore every recorded config to the theme steps_back entries ago
+
+    Returns the names of the targets that were rewritten. The restored state
+    is itself recorded, so a rollback can be undone with another rollback.
+    """
+    entry, files = history.snapshot(steps_back)
+    staged = {}
+    batch = WriteBatch()
+    try:
+        for target, file in sorted(files.items()):
+            path = Path(file["path"])
+            content = history.load(file["sha256"])
+            try:
+                with open(path, 'r') as f:
+                    current = f.read()
+            except FileNotFoundError:
+                print(f"Skipping {target}: {path} not found")
+                continue
+
+            if batch.stage(path, current, content):
+                staged[target] = (path, current, content)
+    except BaseException:
+        batch.abort()
+        raise
+
+    # Every snapshot was readable, so all configs switch back together
+    errors = batch.commit()
+    restored = []
+    for target, (path, current, content) in staged.items():
+        if path in errors:
+            print(f"Error restoring {target}: {errors[path]}")
+            continue
+        history.record(target, path, current, content, f"rollback:{entry['key']}", f"rollback to {entry['label']}",
+                       batch.write_times.get(path))
+        restored.append(target)
+    return restored
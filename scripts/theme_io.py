@@ -0,0 +1,227 @@
+"""File helpers shared by the theme updaters"""
+
+import contextlib
+import hashlib
+import os
+import stat
+import tempfile
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:
+    # Windows
+    fcntl = None
+    import msvcrt
+
+from theme_trace import TRACE
+
+# mkstemp creates files as 0600; new configs get the mode open() would have given them
+_umask = os.umask(0)
+os.umask(_umask)
+DEFAULT_MODE = 0o666 & ~_umask
+
+def content_hash(text):
+    """Return the sha256 hex digest of a config's text"""
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+def stage_write(path, text):
+    """Write text (or bytes) to a fsynced temp file next to path and return the temp file's path
+
+    The temp file is in the same directory so commit_write can rename it over
+    path atomically, and it takes over the mode of the file it replaces.
+    """
+    return stage_stream(path, (text,), binary=isinstance(text, bytes))
+
+def stage_stream(path, chunks, binary=False):
+    """stage_write for text produced piece by piece, which is written as it comes"""
+    directory, name = os.path.split(os.fspath(path))
+    fd, tmp_path = tempfile.mkstemp(prefix=f".{name}.", suffix=".tmp", dir=directory or ".")
+    try:
+        with os.fdopen(fd, 'wb' if binary else 'w') as f:
+            for chunk in chunks:
+                f.write(chunk)
+            f.flush()
+            os.fsync(f.fileno())
+        # A config switched in from the theme bank may be a symlink; it is replaced, not written through
+        try:
+            mode = stat.S_IMODE(os.stat(path).st_mode)
+        except FileNotFoundError:
+            mode = DEFAULT_MODE
+        os.chmod(tmp_path, mode)
+    except BaseException:
+        discard_write(tmp_path)
+        raise
+    return tmp_path
+
+def commit_write(tmp_path, path, sync=True):
+    """Rename a staged temp file over path, so readers see either the old or the new file
+
+    Returns the time of the rename, when watchers can first see the new file.
+
+    With sync the rename itself is made durable too; a batch of renames
+    syncs each directory once at the end instead.
+    """
+    os.replace(tmp_path, path)
+    write_time = time.time()
+    if sync:
+        _fsync_directory(os.path.dirname(os.fspath(path)))
+    return write_time
+
+def discard_write(tmp_path):
+    """Remove a staged temp file that will not be committed"""
+    try:
+        os.remove(tmp_path)
+    except FileNotFoundError:
+        pass
+
+def _fsync_directory(directory):
+    """Make a rename in directory durable; Windows cannot open directories and needs no fsync"""
+    if not hasattr(os, 'O_DIRECTORY'):
+        return
+    fd = os.open(directory or ".", os.O_RDONLY | os.O_DIRECTORY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+def atomic_write(path, text):
+    """Replace path with text (or bytes) in one rename, never leaving a truncated file behind
+
+    Returns the time of the rename.
+    """
+    return commit_write(stage_write(path, text), path)
+
+@contextlib.contextmanager
+def file_lock(path):
+    """Hold an exclusive lock on path, created if missing, shared with other processes"""
+    with open(path, 'a+b') as f:
+        if fcntl is not None:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        else:
+            f.seek(0)
+            while True:
+                try:
+                    msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+                    break
+                except OSError:
+                    # LK_LOCK gives up after ten seconds
+                    continue
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+            else:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+def write_if_changed(path, current, rendered):
+    """Write the rendered config unless it matches what is on disk
+
+    Returns the time it was renamed into place, or None if it was skipped.
+
+    Skipping identical output avoids both the history snapshot and the write,
+    so file watchers in YASB, Zebar and komorebi don't reload for nothing.
+    The write is atomic, so an app reloading mid-write never sees half a config.
+    """
+    with TRACE.span("write", path=os.path.basename(path)):
+        if content_hash(current) == content_hash(rendered):
+            TRACE.add(bytes_written=0, skipped=True)
+            return None
+
+        write_time = atomic_write(path, rendered)
+        TRACE.add(bytes_written=len(rendered.encode('utf-8')))
+        return write_time
+
+class WriteBatch:
+    """Configs staged to temp files and renamed into place together
+
+    Every target is rendered and staged first and commit then only does one
+    rename per file, so the window in which some configs have the new theme
+    and others the old one is a few renames long, and abort after a failed
+    render leaves all of them as they were.
+    """
+
+    def __init__(self):
+        self.staged = {}
+        self.write_times = {}   # path -> time of its rename, filled by commit
+        self.lock = threading.Lock()
+
+    def stage(self, path, current, rendered):
+        """Stage rendered for path unless it matches current, return True if staged"""
+        if content_hash(current) == content_hash(rendered):
+            return False
+        with TRACE.span("stage", path=os.path.basename(path)):
+            tmp_path = stage_write(path, rendered)
+            TRACE.add(bytes_written=len(rendered.encode('utf-8')))
+        with self.lock:
+            previous = self.staged.pop(path, None)
+            self.staged[path] = tmp_path
+        if previous is not None:
+            discard_write(previous)
+        return True
+
+    def stage_symlink(self, path, source):
+        """Stage a symlink to source that will replace path"""
+        directory, name = os.path.split(os.fspath(path))
+        # A unique name like stage_write's, so concurrent switches never share a link
+        while True:
+            tmp_path = os.path.join(directory, f".{name}.{os.urandom(4).hex()}.link.tmp")
+            try:
+                os.symlink(source, tmp_path)
+                break
+            except FileExistsError:
+                continue
+        with self.lock:
+            previous = self.staged.pop(path, None)
+            self.staged[path] = tmp_path
+        if previous is not None:
+            discard_write(previous)
+
+    def discard(self, path):
+        """Drop the staged write for path, if any"""
+        with self.lock:
+            tmp_path = self.staged.pop(path, None)
+        if tmp_path is not None:
+            discard_write(tmp_path)
+
+    def commit(self, hold=()):
+        """Rename every staged file into place in staging order, return {path: error} for renames that failed
+
+        Paths in hold stay staged for a later commit.
+        """
+        with self.lock:
+            staged = {path: tmp for path, tmp in self.staged.items() if path not in hold}
+            self.staged = {path: tmp for path, tmp in self.staged.items() if path in hold}
+        errors = {}
+        with TRACE.span("commit", files=len(staged)):
+            for path, tmp_path in staged.items():
+                try:
+                    self.write_times[path] = commit_write(tmp_path, path, sync=False)
+                except OSError as e:
+                    discard_write(tmp_path)
+                    errors[path] = e
+            for directory in {os.path.dirname(os.fspath(path)) for path in staged if path not in errors}:
+                try:
+                    _fsync_directory(directory)
+                except OSError as e:
+                    print(f"Warning: Could not sync {directory}: {e}")
+        return errors
+
+    def abort(self):
+        """Remove every staged temp file, leaving the configs as they were"""
+        with self.lock:
+            staged, self.staged = self.staged, {}
+        for tmp_path in staged.values():
+            discard_write(tmp_path)
+
+def print_change_summary(results):
+    """Print which targets were rewritten, given {name: written}"""
+    changed = [name for name, written in results.items() if written]
+    unchanged = [name for name, written in results.items() if not written]
+    if changed:
+        print(f"Changed: {', '.join(changed)}")
+    if unchanged:
+        print(f"Unchanged (write skipped): {', '.join(unchanged)}")
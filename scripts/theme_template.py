@@ -0,0 +1,226 @@
+"""Template mode for configs whose color slots have been marked
+
+A slot is marked once with a comment naming the palette entry it takes:
+
+    color: /*wal:color4 rgb/95*/rgb(99 178 205 / 95%);    (CSS, before the value)
+    color: "#63B2CD" # wal:color4                         (YAML, after the value)
+
+A YAML marker ends the line or comes before the line's own comment.
+
+The optional format is "hex" (the default), "rgb" or "rgb/<alpha percent>".
+Compiling a config finds the slot offsets once; they are cached by the
+content's sha256, together with the offsets in every output we render, so
+re-applying a theme to a config we wrote ourselves is a direct fill with no
+searching. Configs without markers fall back to each target's regex mode.
+"""
+
+import contextlib
+import json
+import re
+import threading
+from collections import namedtuple
+from pathlib import Path
+
+from color_math import derive, format_css_rgb, to_hex
+from theme_io import atomic_write, content_hash
+from theme_trace import TRACE
+
+TEMPLATE_CACHE_PATH = Path.home() / ".cache" / "wal" / "template-cache.json"
+MAX_CACHED = 256
+
+# /*wal:key fmt*/ before a CSS value, or "# wal:key fmt" after a YAML value, ending the line or before its comment
+MARKER = re.compile(r'/\*\s*wal:([\w.-]+)(?:\s+([\w/]+))?\s*\*/|#[ \t]*wal:([\w.-]+)(?:[ \t]+([\w/]+))?(?=[ \t]*$|[ \t]+#)', re.MULTILINE)
+# A marker as css_marker and the YAML markers applied by the target scripts write it
+MARKER_TEXT = re.compile(r'/\*wal:[\w.-]+(?: [\w/]+)?\*/| # wal:[\w.-]+(?: [\w/]+)?(?=[ \t]*$|[ \t]+#)', re.MULTILINE)
+CSS_VALUE = re.compile(r'\s*(#[0-9a-fA-F]{3,8}\b|rgba?\([^)]*\))')
+YAML_VALUE = re.compile(r'[^:#\n]+:[ \t]*(?:"([^"\n]*)"|\'([^\'\n]*)\'|([^\s"\'#][^#\n]*?))[ \t]*$')
+
+Slot = namedtuple('Slot', 'start end key format')
+
+def css_marker(key, fmt=None):
+    return f"/*wal:{key} {fmt}*/" if fmt else f"/*wal:{key}*/"
+
+def yaml_marker(key, fmt=None):
+    return f"# wal:{key} {fmt}" if fmt else f"# wal:{key}"
+
+def strip_markers(text):
+    """Return text without its template markers, as it was before marking"""
+    return MARKER_TEXT.sub('', text)
+
+def compile_template(text):
+    """Return the [Slot] marked in text, in order; empty if it has no markers"""
+    slots = []
+    for marker in MARKER.finditer(text):
+        if marker.group(1):
+            value = CSS_VALUE.match(text, marker.end())
+            if value:
+                slots.append(Slot(value.start(1), value.end(1), marker.group(1), marker.group(2)))
+        else:
+            line_start = text.rfind('\n', 0, marker.start()) + 1
+            value = YAML_VALUE.match(text[line_start:marker.start()])
+            group = value and next((i for i in (1, 2, 3) if value.group(i)), None)
+            if group:
+                slots.append(Slot(line_start + value.start(group), line_start + value.end(group), marker.group(3), marker.group(4)))
+    return slots
+
+def format_slot(derived, slot, defaults, extra):
+    """Return the text for one slot, or None to leave it unchanged"""
+    if slot.key in extra:
+        rgb = extra[slot.key]
+        hex_value = to_hex(rgb)
+    else:
+        hex_value = derived.hex(slot.key, defaults.get(slot.key))
+        if hex_value is None:
+            return None
+        rgb = derived.rgb(slot.key, defaults.get(slot.key))
+
+    if not slot.format or slot.format == "hex":
+        return hex_value
+    if slot.format == "rgb":
+        return format_css_rgb(rgb)
+    if slot.format.startswith("rgb/"):
+        return format_css_rgb(rgb, slot.format[4:])
+    return None
+
+class TemplateCache:
+    """Slot offsets by content sha256, kept in memory and in a small JSON file (path None: memory only)
+
+    Configs without markers are only remembered in memory, so plain runs
+    never write the file and edits to unmarked configs don't grow it.
+    """
+
+    def __init__(self, path=TEMPLATE_CACHE_PATH, max_entries=MAX_CACHED, entries=None):
+        self.path = None if path is None else Path(path)
+        self.max_entries = max_entries
+        self.entries = None if entries is None else {digest: [Slot(*slot) for slot in slots] for digest, slots in entries.items() if slots}
+        self.unmarked = set()
+        self.lock = threading.Lock()
+
+    def _load(self):
+        if self.entries is None:
+            if self.path is None:
+                self.entries = {}
+                return
+            try:
+                with open(self.path, 'r', encoding='utf-8') as f:
+                    # Older caches also hold empty slot lists for unmarked configs
+                    self.entries = {digest: [Slot(*slot) for slot in slots] for digest, slots in json.load(f).items() if slots}
+            except (OSError, ValueError, TypeError):
+                self.entries = {}
+
+    def snapshot(self):
+        """Return a copy of {digest: [Slot]}, e.g. to seed the caches of worker processes"""
+        with self.lock:
+            self._load()
+            return dict(self.entries)
+
+    def get(self, digest):
+        with self.lock:
+            if digest in self.unmarked:
+                return []
+            self._load()
+            return self.entries.get(digest)
+
+    def put(self, *items):
+        """Store (digest, slots) pairs and persist the cache"""
+        with self.lock:
+            self._load()
+            changed = False
+            for digest, slots in items:
+                if not slots:
+                    if len(self.unmarked) >= self.max_entries:
+                        self.unmarked.clear()
+                    self.unmarked.add(digest)
+                    continue
+                self.entries.pop(digest, None)
+                self.entries[digest] = slots
+                changed = True
+            while len(self.entries) > self.max_entries:
+                del self.entries[next(iter(self.entries))]
+            if self.path is None or not changed:
+                return
+            try:
+                self.path.parent.mkdir(parents=True, exist_ok=True)
+                atomic_write(self.path, json.dumps(self.entries).encode('utf-8'))
+            except OSError as e:
+                print(f"Warning: Could not write template cache: {e}")
+
+CACHE = TemplateCache()
+
+@contextlib.contextmanager
+def memory_cache():
+    """Keep slot offsets in memory only, e.g. while rendering many transition frames"""
+    global CACHE
+    saved = CACHE
+    CACHE = TemplateCache(path=None)
+    try:
+        yield CACHE
+    finally:
+        CACHE = saved
+
+def fill_markers(text, colors, defaults=None, extra=None):
+    """Fill the slots marked in a short piece of text, such as one CSS value, without the cache
+
+    Returns (text, number of slots filled).
+    """
+    slots = compile_template(text)
+    if not slots:
+        return text, 0
+    derived = derive(colors)
+    parts = []
+    pos = 0
+    for slot in slots:
+        value = format_slot(derived, slot, defaults or {}, extra or {})
+        parts.append(text[pos:slot.start])
+        parts.append(text[slot.start:slot.end] if value is None else value)
+        pos = slot.end
+    parts.append(text[pos:])
+    return ''.join(parts), len(slots)
+
+def render_template(text, colors, defaults=None, extra=None, cache=None):
+    """Fill the marked slots in text, or return None if it has no markers
+
+    defaults are the target's fallback colors by palette key and extra maps
+    target-specific slot names to (r, g, b).
+    """
+    cache = cache or CACHE
+    digest = content_hash(text)
+    slots = cache.get(digest)
+    compiled = slots is None
+    if compiled:
+        slots = compile_template(text)
+    if not slots:
+        if compiled:
+            cache.put((digest, slots))
+        return None
+
+    derived = derive(colors)
+    defaults = defaults or {}
+    extra = extra or {}
+    parts = []
+    filled = []
+    pos = 0
+    length = 0
+    for slot in slots:
+        value = format_slot(derived, slot, defaults, extra)
+        if value is None:
+            value = text[slot.start:slot.end]
+        parts.append(text[pos:slot.start])
+        length += slot.start - pos
+        filled.append(Slot(length, length + len(value), slot.key, slot.format))
+        parts.append(value)
+        length += len(value)
+        pos = slot.end
+    parts.append(text[pos:])
+    rendered = ''.join(parts)
+    TRACE.add(mode="template", template_cache="miss" if compiled else "hit")
+    TRACE.count("substitutions", len(slots))
+
+    # Remember the output's offsets too, so the next run on it is a direct fill
+    items = [(digest, slots)] if compiled else []
+    rendered_digest = content_hash(rendered)
+    if cache.get(rendered_digest) != filled:
+        items.append((rendered_digest, filled))
+    if items:
+        cache.put(*items)
+    return rendered
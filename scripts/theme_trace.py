@@ -0,0 +1,205 @@
+"""Per-phase timing spans for the theme updaters
+
+The shared helpers open spans around each phase (reading colors.json,
+parsing, rendering, writing, recording history) and attach counters such as
+bytes read and written or the number of substitutions applied. Tracing is
+off unless an updater is run with --timings, --trace or --profile, in which
+case run_main prints a span tree, appends JSON lines to the trace file for
+tracking regressions over time, or dumps cProfile stats.
+"""
+
+import argparse
+import cProfile
+import functools
+import json
+import os
+import pstats
+import sys
+import threading
+import time
+import uuid
+
+class _NullSpan:
+    def __enter__(self):
+        return None
+
+    def __exit__(self, *exc_info):
+        return False
+
+NULL_SPAN = _NullSpan()
+
+class _Span:
+    def __init__(self, tracer, name, attrs):
+        self.tracer = tracer
+        self.record = {"name": name, "attrs": attrs}
+
+    def __enter__(self):
+        tracer = self.tracer
+        stack = tracer._stack()
+        with tracer.lock:
+            tracer.next_id += 1
+            self.record["id"] = tracer.next_id
+        self.record["parent"] = stack[-1]["id"] if stack else None
+        self.record["thread"] = threading.current_thread().name
+        self.start = time.perf_counter()
+        self.record["start_ms"] = (self.start - tracer.origin) * 1000
+        stack.append(self.record)
+        return self.record
+
+    def __exit__(self, exc_type, exc, tb):
+        self.record["duration_ms"] = (time.perf_counter() - self.start) * 1000
+        if exc_type is not None:
+            self.record["attrs"]["error"] = exc_type.__name__
+        self.tracer._stack().pop()
+        with self.tracer.lock:
+            self.tracer.spans.append(self.record)
+        return False
+
+class Tracer:
+    """Collects nested spans per thread; a no-op until enabled"""
+
+    def __init__(self):
+        self.enabled = False
+        self.spans = []
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self.origin = time.perf_counter()
+        self.next_id = 0
+
+    def _stack(self):
+        stack = getattr(self.local, 'stack', None)
+        if stack is None:
+            stack = self.local.stack = []
+        return stack
+
+    def span(self, name, **attrs):
+        """Context manager timing one phase"""
+        if not self.enabled:
+            return NULL_SPAN
+        return _Span(self, name, attrs)
+
+    def add(self, **attrs):
+        """Attach attributes to the innermost open span"""
+        if self.enabled:
+            stack = self._stack()
+            if stack:
+                stack[-1]["attrs"].update(attrs)
+
+    def count(self, name, n=1):
+        """Add n to a counter on the innermost open span"""
+        if self.enabled:
+            stack = self._stack()
+            if stack:
+                attrs = stack[-1]["attrs"]
+                attrs[name] = attrs.get(name, 0) + n
+
+TRACE = Tracer()
+
+def process_age():
+    """Seconds since this process was created (interpreter start), or None where unknown"""
+    try:
+        if sys.platform.startswith('linux'):
+            with open('/proc/self/stat', 'r') as f:
+                # Fields after the parenthesised command name; starttime is field 22
+                fields = f.read().rsplit(')', 1)[1].split()
+            with open('/proc/uptime', 'r') as f:
+                uptime = float(f.read().split()[0])
+            return uptime - int(fields[19]) / os.sysconf('SC_CLK_TCK')
+        if sys.platform == 'win32':
+            import ctypes
+            from ctypes import wintypes
+            kernel32 = ctypes.windll.kernel32
+            creation, exited, kernel, user, now = (wintypes.FILETIME() for _ in range(5))
+            kernel32.GetProcessTimes(kernel32.GetCurrentProcess(), ctypes.byref(creation),
+                                     ctypes.byref(exited), ctypes.byref(kernel), ctypes.byref(user))
+            kernel32.GetSystemTimeAsFileTime(ctypes.byref(now))
+            ticks = lambda filetime: (filetime.dwHighDateTime << 32) | filetime.dwLowDateTime
+            return (ticks(now) - ticks(creation)) / 1e7
+    except (OSError, ValueError, IndexError, AttributeError):
+        pass
+    return None
+
+def print_timings(spans):
+    """Print the spans as an indented tree in start order"""
+    children = {}
+    for span in spans:
+        children.setdefault(span["parent"], []).append(span)
+
+    def show(parent, depth):
+        for span in sorted(children.get(parent, []), key=lambda s: s["start_ms"]):
+            attrs = ' '.join(f"{key}={value}" for key, value in span["attrs"].items())
+            thread = f" [{span['thread']}]" if span["thread"] != "MainThread" else ""
+            print(f"  {'  ' * depth}{span['name']:<{36 - 2 * depth}} {span['duration_ms']:8.2f} ms{thread}  {attrs}".rstrip())
+            show(span["id"], depth + 1)
+
+    print("Timings:")
+    show(None, 0)
+
+def write_trace(path, script, spans):
+    """Append one JSON line per span, tagged with a run id and the script name"""
+    run = uuid.uuid4().hex[:12]
+    started = time.time()
+    with open(path, 'a', encoding='utf-8') as f:
+        for span in sorted(spans, key=lambda s: s["start_ms"]):
+            f.write(json.dumps(dict(span, run=run, script=script, time=started)) + '\n')
+
+def add_trace_arguments(parser):
+    parser.add_argument('--timings', action='store_true', help="print how long each phase took")
+    parser.add_argument('--trace', metavar='FILE', help="append per-phase spans to a JSON-lines file")
+    parser.add_argument('--profile', metavar='FILE', help="dump cProfile stats for the run to FILE")
+
+def start_tracing(args, tracer=TRACE):
+    """Enable tracing if any of the trace options were given, return True if enabled"""
+    tracer.enabled = bool(args.timings or args.trace or args.profile)
+    return tracer.enabled
+
+def finish_tracing(args, script, tracer=TRACE, profiler=None):
+    """Report the collected spans and profile as requested by the options"""
+    if args.timings:
+        print_timings(tracer.spans)
+    if args.trace:
+        try:
+            write_trace(args.trace, script, tracer.spans)
+        except OSError as e:
+            print(f"Warning: Could not write trace file: {e}")
+    if profiler is not None:
+        profiler.dump_stats(args.profile)
+        print(f"Profile written to {args.profile}")
+        if args.timings:
+            pstats.Stats(profiler).sort_stats('cumulative').print_stats(15)
+
+def run_main(main, script, description=None, tracer=TRACE, add_arguments=None):
+    """Run an updater's main() with --timings, --trace and --profile support
+
+    With add_arguments(parser) the script adds its own options and main is
+    called with the parsed arguments.
+    """
+    parser = argparse.ArgumentParser(description=description)
+    add_trace_arguments(parser)
+    if add_arguments is not None:
+        add_arguments(parser)
+    args = parser.parse_args()
+    if add_arguments is not None:
+        main = functools.partial(main, args)
+    if not start_tracing(args, tracer):
+        return main()
+
+    # Interpreter start and imports happened before any span could open
+    age = process_age()
+    if age is not None:
+        startup_ms = age * 1000 - (time.perf_counter() - tracer.origin) * 1000
+        tracer.spans.append({"id": 0, "parent": None, "name": "interpreter start", "attrs": {},
+                             "thread": "MainThread", "start_ms": -startup_ms, "duration_ms": max(0.0, startup_ms)})
+
+    profiler = cProfile.Profile() if args.profile else None
+    try:
+        with tracer.span(script):
+            if profiler is not None:
+                profiler.enable()
+            try:
+                return main()
+            finally:
+                if profiler is not None:
+                    profiler.disable()
+    finally:
+        finish_tracing(args, script, tracer, profiler)
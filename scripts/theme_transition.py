@@ -0,0 +1,118 @@
+"""Animated transitions from one palette to another
+
+Every palette color is interpolated from the old to the new theme over a
+number of frames, which are produced on a fixed clock; a frame whose slot
+has already passed is skipped rather than delaying the ones after it.
+Each file gets a CoalescingWriter that writes at most once per frame
+interval and only ever the newest pending frame, so a slow disk or an app
+busy reloading drops frames instead of queueing them.
+"""
+
+import threading
+import time
+
+from color_math import derive_many, parse_hex, to_hex
+from theme_io import write_if_changed
+
+def interpolate_palette(old, new, t):
+    """Return the flat palette t of the way from old to new (0 <= t <= 1)"""
+    frame = {}
+    for key, value in new.items():
+        try:
+            start, end = parse_hex(old[key]), parse_hex(value)
+        except (KeyError, ValueError, TypeError):
+            frame[key] = value
+            continue
+        frame[key] = to_hex(tuple(round(a + (b - a) * t) for a, b in zip(start, end)))
+    return frame
+
+def transition_palettes(old, new, frames):
+    """Return the frames' palettes, ending with new itself
+
+    Their shades are derived in one batch up front, so the renderers only
+    look them up while the clock is running.
+    """
+    palettes = [interpolate_palette(old, new, i / frames) for i in range(1, frames)] + [new]
+    derive_many(palettes)
+    return palettes
+
+def run_frames(palettes, render_frame, fps):
+    """Call render_frame(colors) for each palette on a clock of fps frames per second
+
+    Frames whose time has passed by the time they would start are skipped;
+    the last one is always rendered. Returns (rendered, skipped, elapsed seconds).
+    """
+    interval = 1 / fps
+    started = time.monotonic()
+    rendered = skipped = 0
+    for i, colors in enumerate(palettes):
+        last = i == len(palettes) - 1
+        if not last and time.monotonic() > started + (i + 1) * interval:
+            skipped += 1
+            continue
+        render_frame(colors)
+        rendered += 1
+        if not last:
+            delay = started + (i + 1) * interval - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+    # The last frame holds its slot like the others, unless we overran the schedule
+    return rendered, skipped, max(time.monotonic(), started + len(palettes) * interval) - started
+
+class CoalescingWriter:
+    """Write the newest submitted text to one file, at most once per interval, on its own thread"""
+
+    def __init__(self, path, current, interval):
+        self.path = path
+        self.written = current
+        self.interval = interval
+        self.pending = None
+        self.closed = False
+        self.error = None
+        self.submitted = self.writes = self.dropped = 0
+        self.write_time = None
+        self.condition = threading.Condition()
+        self.thread = threading.Thread(target=self._run, name=f"transition-{path.name}", daemon=True)
+        self.thread.start()
+
+    def submit(self, text):
+        """Queue text to be written, replacing a pending frame that was not written yet"""
+        with self.condition:
+            if self.pending is not None:
+                self.dropped += 1
+            self.pending = text
+            self.submitted += 1
+            self.condition.notify()
+
+    def _run(self):
+        next_write = 0
+        while True:
+            with self.condition:
+                while self.pending is None and not self.closed:
+                    self.condition.wait()
+                if self.pending is None:
+                    return
+
+            # Newer frames can still replace the pending one while we wait our turn
+            delay = next_write - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            with self.condition:
+                text, self.pending = self.pending, None
+
+            try:
+                write_time = write_if_changed(self.path, self.written, text)
+                if write_time is not None:
+                    self.write_time = write_time
+                    self.writes += 1
+                self.written = text
+            except OSError as e:
+                self.error = e
+            next_write = time.monotonic() + self.interval
+
+    def close(self):
+        """Flush the last submitted text and stop the thread"""
+        with self.condition:
+            self.closed = True
+            self.condition.notify()
+        self.thread.join()
@@ -0,0 +1,485 @@
+"""Shared pywal/winwal palette loader used by the Update*Colors scripts"""
+
+import argparse
+import codecs
+import hashlib
+import json
+import os
+import random
+import re
+import sys
+from pathlib import Path
+
+from theme_io import atomic_write
+from theme_trace import TRACE
+
+COLOR_KEYS = [f"color{i}" for i in range(16)]
+SPECIAL_KEYS = ["background", "foreground", "cursor"]
+
+WAL_COLORS_PATH = Path.home() / ".cache" / "wal" / "colors.json"
+PALETTE_CACHE_PATH = Path.home() / ".cache" / "wal" / "palette-cache.json"
+# Palette cache member remembering where locate_palette last found the palette
+LOCATION_KEY = "location"
+
+class Palette:
+    """Normalized palette: color0-color15 plus the special colors"""
+
+    def __init__(self, colors, special, wallpaper=None, source=None):
+        self.colors = colors
+        self.special = special
+        self.wallpaper = wallpaper
+        self.source = source
+
+    def flat(self):
+        """Return a flat {name: hex} dict as used by the updaters"""
+        flat = dict(self.colors)
+        flat.update(self.special)
+        return flat
+
+    def get(self, key, default=None):
+        return self.special.get(key, self.colors.get(key, default))
+
+    def __len__(self):
+        return len(self.colors) + len(self.special)
+
+    def to_dict(self):
+        return {
+            "colors": self.colors,
+            "special": self.special,
+            "wallpaper": self.wallpaper,
+        }
+
+    @classmethod
+    def from_dict(cls, data, source=None):
+        return cls(data.get("colors", {}), data.get("special", {}), data.get("wallpaper"), source)
+
+class PaletteParseError(json.JSONDecodeError):
+    """colors.json could not be parsed even tolerantly
+
+    Besides the usual msg, pos, lineno and colno it carries key_path, the
+    dotted path of the member being parsed (e.g. "colors.color4"), so the
+    updaters can say where a broken winwal output went wrong.
+    """
+
+    def __init__(self, msg, doc, pos, key_path=()):
+        self.key_path = '.'.join(str(key) for key in key_path)
+        super().__init__(f"{msg} in {self.key_path}" if self.key_path else msg, doc, pos)
+        self.reason = msg
+
+    def __reduce__(self):
+        # Keep the error picklable for ThemeBank's worker processes
+        return self.__class__, (self.reason, self.doc, self.pos, tuple(self.key_path.split('.')) if self.key_path else ())
+
+# String members that hold file paths; winwal writes these without escaping
+PATH_KEYS = {"wallpaper"}
+DRIVE_PATH = re.compile(r'[A-Za-z]:\\[^\\]|\\\\[^\\]')
+VALID_ESCAPE = re.compile(r'\\(?:["\\/bfnrt]|u[0-9a-fA-F]{4})')
+BACKSLASH_RUN = re.compile(r'\\+')
+NUMBER = re.compile(r'-?(?:0|[1-9][0-9]*)(\.[0-9]+)?([eE][-+]?[0-9]+)?')
+LITERALS = {'true': True, 'false': False, 'null': None}
+MAX_DEPTH = 32
+
+def decode_palette_bytes(raw):
+    """Decode colors.json bytes, honouring the BOMs PowerShell's Out-File writes"""
+    if raw.startswith(codecs.BOM_UTF8):
+        return raw[len(codecs.BOM_UTF8):].decode('utf-8')
+    if raw.startswith((codecs.BOM_UTF16_LE, codecs.BOM_UTF16_BE)):
+        return raw.decode('utf-16')
+    try:
+        return raw.decode('utf-8')
+    except UnicodeDecodeError:
+        # Windows PowerShell writes the ANSI code page by default
+        return raw.decode('cp1252', errors='replace')
+
+def _decode_string(raw, key):
+    """Decode a string body, keeping the backslashes of unescaped Windows paths literal
+
+    A body is decoded as JSON only if all its escapes are valid and it does
+    not look like a raw path. For path members and drive/UNC paths any odd
+    run of backslashes marks the path as unescaped, which also catches
+    sequences like the \\n in C:\\walls\\new.png that happen to be valid escapes.
+    """
+    if '\\' not in raw:
+        return raw
+
+    unescaped = any(VALID_ESCAPE.match(raw, m.start() + len(m.group()) - 1) is None
+                    for m in BACKSLASH_RUN.finditer(raw) if len(m.group()) % 2)
+    if not unescaped and (key in PATH_KEYS or DRIVE_PATH.match(raw)):
+        unescaped = any(len(m.group()) % 2 for m in BACKSLASH_RUN.finditer(raw))
+    if unescaped:
+        return raw.replace('\\"', '"')
+    return json.loads(f'"{raw}"', strict=False)
+
+class _TolerantParser:
+    """Single forward pass over colors.json that recovers from winwal's mistakes
+
+    Tolerated: unescaped backslashes in paths (including one right before
+    the closing quote), raw control characters in strings, trailing commas,
+    missing commas between members, and NUL padding after the document.
+    Anything else raises PaletteParseError with its position and key path.
+    """
+
+    def __init__(self, text):
+        self.text = text
+        self.pos = 0
+        self.path = []
+
+    def error(self, msg, pos=None):
+        raise PaletteParseError(msg, self.text, self.pos if pos is None else pos, self.path)
+
+    def expected(self, what, char):
+        self.error(what if char else "Unexpected end of file")
+
+    def skip_whitespace(self):
+        text = self.text
+        while self.pos < len(text) and text[self.pos] in ' \t\r\n':
+            self.pos += 1
+        return text[self.pos:self.pos + 1]
+
+    def parse(self):
+        if self.skip_whitespace() != '{':
+            self.error("Expected '{' at the start of colors.json")
+        value = self.parse_object(0)
+        if self.text[self.pos:].strip(' \t\r\n\0'):
+            self.error("Unexpected data after the palette object")
+        return value
+
+    def parse_value(self, depth):
+        char = self.skip_whitespace()
+        if char == '{':
+            return self.parse_object(depth + 1)
+        if char == '[':
+            return self.parse_array(depth + 1)
+        if char == '"':
+            return self.parse_string()
+        if not char:
+            self.error("Unexpected end of file")
+
+        match = NUMBER.match(self.text, self.pos)
+        if match:
+            self.pos = match.end()
+            return float(match.group()) if match.group(1) or match.group(2) else int(match.group())
+        for word, value in LITERALS.items():
+            if self.text.startswith(word, self.pos):
+                self.pos += len(word)
+                return value
+        self.error(f"Unexpected character {char!r}")
+
+    def parse_string(self, key=None):
+        """Parse the string at pos, return its value"""
+        text = self.text
+        start = self.pos + 1
+        i = start
+        while True:
+            quote = text.find('"', i)
+            newline = text.find('\n', i, len(text) if quote == -1 else quote)
+            if newline != -1 or quote == -1:
+                self.error("Unterminated string", start - 1)
+
+            backslashes = 0
+            while text[quote - 1 - backslashes] == '\\':
+                backslashes += 1
+            if backslashes % 2 == 0:
+                break
+            # An "escaped" quote followed by a delimiter is really a path ending in a backslash
+            following = text[quote + 1:].lstrip(' \t\r')[:1]
+            if following in ('', ',', '}', ']', ':', '\n'):
+                break
+            i = quote + 1
+
+        self.pos = quote + 1
+        return _decode_string(text[start:quote], key)
+
+    def parse_object(self, depth):
+        if depth > MAX_DEPTH:
+            self.error("Palette nested too deeply")
+        self.pos += 1
+        result = {}
+        while True:
+            char = self.skip_whitespace()
+            if char == '}':
+                self.pos += 1
+                return result
+            if char != '"':
+                self.expected("Expected a key", char)
+            key = self.parse_string()
+
+            char = self.skip_whitespace()
+            if char != ':':
+                self.expected("Expected ':'", char)
+            self.pos += 1
+            self.path.append(key)
+            if self.skip_whitespace() == '"':
+                result[key] = self.parse_string(key)
+            else:
+                result[key] = self.parse_value(depth)
+            self.path.pop()
+
+            char = self.skip_whitespace()
+            if char == ',':
+                self.pos += 1
+            elif char not in ('}', '"'):
+                # A '"' here is the next key after a missing comma
+                self.expected("Expected ',' or '}'", char)
+
+    def parse_array(self, depth):
+        if depth > MAX_DEPTH:
+            self.error("Palette nested too deeply")
+        self.pos += 1
+        result = []
+        while True:
+            char = self.skip_whitespace()
+            if char == ']':
+                self.pos += 1
+                return result
+            self.path.append(len(result))
+            result.append(self.parse_value(depth))
+            self.path.pop()
+
+            char = self.skip_whitespace()
+            if char == ',':
+                self.pos += 1
+            elif char != ']':
+                self.expected("Expected ',' or ']'", char)
+
+def parse_wal_json(text):
+    """Parse winwal/pywal colors.json text tolerantly, raising PaletteParseError"""
+    return _TolerantParser(text).parse()
+
+def normalize_palette(wal_data, source=None):
+    """Extract colors from winwal data in the nested pywal or the flat format"""
+    colors = {}
+    special = {}
+    wallpaper = None
+
+    if isinstance(wal_data, dict):
+        if isinstance(wal_data.get("colors"), dict):
+            for key in COLOR_KEYS:
+                if key in wal_data["colors"]:
+                    colors[key] = wal_data["colors"][key]
+
+        if isinstance(wal_data.get("special"), dict):
+            for key in SPECIAL_KEYS:
+                if key in wal_data["special"]:
+                    special[key] = wal_data["special"][key]
+
+        # Handle flat format
+        for key in COLOR_KEYS:
+            if key in wal_data and key not in colors:
+                colors[key] = wal_data[key]
+        for key in SPECIAL_KEYS:
+            if key in wal_data and key not in special:
+                special[key] = wal_data[key]
+
+        wallpaper = wal_data.get("wallpaper")
+
+    return Palette(colors, special, wallpaper, source)
+
+def parse_palette(json_content, source=None):
+    """Parse colors.json text or bytes into a Palette, raising PaletteParseError"""
+    if isinstance(json_content, bytes):
+        json_content = decode_palette_bytes(json_content)
+    return normalize_palette(parse_wal_json(json_content), source)
+
+def _read_cache(cache_path):
+    try:
+        with open(cache_path, 'r', encoding='utf-8') as f:
+            cache = json.load(f)
+        return cache if isinstance(cache, dict) else {}
+    except (OSError, ValueError):
+        return {}
+
+def _write_cache(cache_path, cache):
+    try:
+        os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+        atomic_write(cache_path, json.dumps(cache).encode('utf-8'))
+    except OSError as e:
+        print(f"Warning: Could not write palette cache: {e}")
+
+def cached_palette(colors_path=WAL_COLORS_PATH, cache_path=PALETTE_CACHE_PATH):
+    """Return the palette last loaded from colors_path, even if the file changed since, or None"""
+    entry = _read_cache(cache_path).get(str(Path(colors_path).resolve()))
+    if not isinstance(entry, dict) or "palette" not in entry:
+        return None
+    return Palette.from_dict(entry["palette"], colors_path)
+
+def load_palette(colors_path=WAL_COLORS_PATH, cache_path=PALETTE_CACHE_PATH, cache=None):
+    """Load a palette, serving it from the on-disk cache when colors.json is unchanged
+
+    The cache is keyed by the file's mtime and size, so an unchanged file is
+    served with a single stat. If the stat changed but the sha256 of the
+    content did not (e.g. winwal rewrote the same theme), the cached palette
+    is reused without parsing. Raises OSError if the file cannot be read and
+    PaletteParseError (a json.JSONDecodeError) if it cannot be parsed. A
+    cache dict already read by the caller can be passed in to reuse it.
+    """
+    with TRACE.span("load palette"):
+        key = str(Path(colors_path).resolve())
+        stat = os.stat(colors_path)
+        cache = _read_cache(cache_path) if cache is None else cache
+        entry = cache.get(key)
+
+        if entry and entry.get("mtime_ns") == stat.st_mtime_ns and entry.get("size") == stat.st_size:
+            TRACE.add(source="stat cache")
+            return Palette.from_dict(entry["palette"], colors_path)
+
+        with open(colors_path, 'rb') as f:
+            raw = f.read()
+        TRACE.add(bytes_read=len(raw))
+        digest = hashlib.sha256(raw).hexdigest()
+
+        if entry and entry.get("sha256") == digest:
+            TRACE.add(source="sha256 cache")
+            palette = Palette.from_dict(entry["palette"], colors_path)
+        else:
+            TRACE.add(source="parsed")
+            with TRACE.span("parse colors.json"):
+                palette = parse_palette(raw, colors_path)
+
+        cache[key] = {
+            "mtime_ns": stat.st_mtime_ns,
+            "size": stat.st_size,
+            "sha256": digest,
+            "palette": palette.to_dict(),
+        }
+        _write_cache(cache_path, cache)
+        return palette
+
+def _exists(path):
+    try:
+        os.stat(path)
+        return True
+    except OSError:
+        return False
+
+def locate_palette(candidates, cache_path=PALETTE_CACHE_PATH, load=load_palette):
+    """Load the palette from the first candidate path that works, or return None
+
+    The location that worked last time is remembered in the palette cache
+    and tried first, so when it is the first candidate a run costs one
+    cache read and one stat. Candidates ahead of it are stat'ed so a
+    preferred file that appears later still wins; all of them are when it
+    is not a candidate at all, such as a path the user typed in, since that
+    was only needed while none of them existed. If the remembered file is
+    gone the location is forgotten and the candidates are probed with stat,
+    reading only those that exist. load(path, cache=...) loads one
+    candidate, e.g. to add a fallback for unparsable files.
+    """
+    cache = _read_cache(cache_path)
+    candidates = [str(path) for path in candidates]
+    remembered = cache.get(LOCATION_KEY)
+    if not isinstance(remembered, str):
+        remembered = None
+    ahead = candidates[:candidates.index(remembered)] if remembered in candidates else candidates
+
+    failed = None
+    if remembered is not None and not any(_exists(path) for path in ahead):
+        try:
+            return load(remembered, cache=cache)
+        except FileNotFoundError:
+            print(f"Palette no longer at {remembered}, searching again")
+        except (OSError, json.JSONDecodeError) as e:
+            print(f"Error loading colors file at {remembered}: {e}")
+            failed = remembered
+
+    for path in candidates:
+        if path == failed or not _exists(path):
+            continue
+        try:
+            palette = load(path, cache=cache)
+        except (OSError, json.JSONDecodeError) as e:
+            print(f"Error loading colors file at {path}: {e}")
+            continue
+        if path != remembered:
+            cache[LOCATION_KEY] = path
+            _write_cache(cache_path, cache)
+        return palette
+
+    if remembered is not None:
+        cache.pop(LOCATION_KEY)
+        _write_cache(cache_path, cache)
+    return None
+
+def remember_location(colors_path, cache_path=PALETTE_CACHE_PATH):
+    """Make locate_palette try colors_path first, e.g. after the user typed it in"""
+    cache = _read_cache(cache_path)
+    cache[LOCATION_KEY] = str(colors_path)
+    _write_cache(cache_path, cache)
+
+CORPUS_DIR = Path(__file__).resolve().parent / "palette-corpus"
+
+def check_corpus(corpus_dir=CORPUS_DIR):
+    """Parse every file in the corpus and compare with expected.json, return the failures"""
+    corpus_dir = Path(corpus_dir)
+    with open(corpus_dir / "expected.json", 'r', encoding='utf-8') as f:
+        expected = json.load(f)
+
+    failures = []
+    for name, want in sorted(expected.items()):
+        with open(corpus_dir / name, 'rb') as f:
+            raw = f.read()
+        try:
+            palette = parse_palette(raw)
+            got = {"wallpaper": palette.wallpaper, "colors": len(palette.colors), "special": len(palette.special)}
+        except PaletteParseError as e:
+            got = {"error": e.reason, "key_path": e.key_path}
+        if got != want:
+            failures.append((name, want, got))
+    return failures
+
+# Characters the fuzzer splices in; the ones winwal output tends to get wrong
+FUZZ_ALPHABET = ['\\', '"', ',', ':', '{', '}', '[', ']', '\n', '\0', ' ', '#', 'u', '\\u00', '\\\\']
+
+def fuzz_corpus(iterations, seed=0, corpus_dir=CORPUS_DIR):
+    """Mutate corpus files at random; the parser may only return a Palette or raise PaletteParseError
+
+    Returns the inputs that raised anything else.
+    """
+    rng = random.Random(seed)
+    seeds = [decode_palette_bytes(path.read_bytes()) for path in sorted(Path(corpus_dir).glob('*.json'))
+             if path.name != "expected.json"]
+
+    crashes = []
+    for _ in range(iterations):
+        text = rng.choice(seeds)
+        for _ in range(rng.randint(1, 4)):
+            pos = rng.randint(0, len(text))
+            mutation = rng.randrange(4)
+            if mutation == 0:
+                text = text[:pos] + rng.choice(FUZZ_ALPHABET) + text[pos:]
+            elif mutation == 1:
+                text = text[:pos] + text[pos + rng.randint(1, 8):]
+            elif mutation == 2:
+                text = text[:pos]
+            else:
+                end = min(len(text), pos + rng.randint(1, 40))
+                text = text[:end] + text[pos:end] + text[end:]
+        try:
+            parse_palette(text)
+        except PaletteParseError:
+            pass
+        except Exception as e:
+            crashes.append((text, e))
+    return crashes
+
+def main():
+    parser = argparse.ArgumentParser(description="Check the tolerant colors.json parser against its regression corpus")
+    parser.add_argument('--corpus', type=Path, default=CORPUS_DIR, help=f"corpus directory (default: {CORPUS_DIR})")
+    parser.add_argument('--fuzz', type=int, default=0, metavar='N', help="also parse N random mutations of the corpus")
+    parser.add_argument('--seed', type=int, default=0, help="fuzzer seed (default: 0)")
+    args = parser.parse_args()
+
+    failures = check_corpus(args.corpus)
+    for name, want, got in failures:
+        print(f"FAIL {name}: expected {want}, got {got}")
+    print(f"Corpus: {len(failures)} failures")
+
+    crashes = fuzz_corpus(args.fuzz, args.seed, args.corpus) if args.fuzz else []
+    for text, e in crashes[:10]:
+        print(f"CRASH {type(e).__name__}: {e}\n  input: {text!r}")
+    if args.fuzz:
+        print(f"Fuzz: {len(crashes)} crashes in {args.fuzz} inputs")
+    return 1 if failures or crashes else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,112 @@
+"""Palette recovery from pywal's OSC sequences file
+
+wal writes the palette twice: colors.json and ~/.cache/wal/sequences, the
+escape codes it sends to terminals. When colors.json cannot be parsed the
+sequences file still holds the whole theme:
+
+    ESC ]4;N;#rrggbb ST     color0-color15
+    ESC ]10;#rrggbb ST      foreground
+    ESC ]11;#rrggbb ST      background ([alpha]#rrggbb when wal runs with -a)
+    ESC ]12;#rrggbb ST      cursor
+    ESC ]708;#rrggbb ST     urxvt border, a second copy of the background
+
+ST is ESC \\ or BEL. The file is scanned once, through mmap when it is
+large, so a long stream of repeated sequences is never copied into memory.
+"""
+
+import json
+import mmap
+import os
+import re
+
+from theme_trace import TRACE
+from wal_palette import COLOR_KEYS, WAL_COLORS_PATH, Palette, load_palette
+
+WAL_SEQUENCES_PATH = WAL_COLORS_PATH.parent / "sequences"
+MMAP_THRESHOLD = 64 * 1024
+
+OSC = re.compile(rb'\x1b\](\d+);(?:(\d+);)?([^\x07\x1b]*)(?:\x07|\x1b\\)')
+HEX_COLOR = re.compile(rb'^(?:\[\d+\])?(#[0-9a-fA-F]{6})$')
+XPARSE_COLOR = re.compile(rb'^rgb:([0-9a-fA-F]{1,4})/([0-9a-fA-F]{1,4})/([0-9a-fA-F]{1,4})$')
+
+# OSC number: special color name (4 carries the palette index instead)
+SPECIAL_CODES = {b'10': "foreground", b'11': "background", b'12': "cursor", b'708': "background"}
+
+def parse_color(value):
+    """Return #rrggbb for an OSC color argument, or None if it is not a color"""
+    match = HEX_COLOR.match(value)
+    if match:
+        return match.group(1).decode('ascii')
+    match = XPARSE_COLOR.match(value)
+    if match:
+        # XParseColor scales each channel to its own digit count
+        channels = (int(part, 16) * 255 // (16 ** len(part) - 1) for part in match.groups())
+        return '#' + ''.join(f"{channel:02x}" for channel in channels)
+    return None
+
+def parse_sequences(data):
+    """Return a Palette from an OSC sequence stream (bytes, or an mmap of one)
+
+    Later sequences win, as they would on a terminal; 708 only fills in the
+    background if 11 did not set it.
+    """
+    colors = {}
+    special = {}
+    border = None
+    count = 0
+    for match in OSC.finditer(data):
+        code, index, value = match.groups()
+        color = parse_color(value)
+        if color is None:
+            continue
+        count += 1
+        if code == b'4':
+            if index is not None and int(index) < len(COLOR_KEYS):
+                colors[f"color{int(index)}"] = color
+        elif code == b'708':
+            border = color
+        elif code in SPECIAL_CODES and index is None:
+            special[SPECIAL_CODES[code]] = color
+    if border is not None:
+        special.setdefault("background", border)
+    TRACE.add(sequences=count)
+
+    if not colors and not special:
+        raise ValueError("no color sequences found")
+    # Keep the palette order wal uses
+    colors = {key: colors[key] for key in COLOR_KEYS if key in colors}
+    return Palette(colors, special)
+
+def load_sequences(sequences_path=WAL_SEQUENCES_PATH):
+    """Read the sequences file in one pass and return its Palette"""
+    with TRACE.span("load sequences"):
+        with open(sequences_path, 'rb') as f:
+            size = os.fstat(f.fileno()).st_size
+            TRACE.add(bytes_read=size)
+            if size < MMAP_THRESHOLD:
+                palette = parse_sequences(f.read())
+            else:
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                    palette = parse_sequences(data)
+        palette.source = sequences_path
+        return palette
+
+def load_palette_with_fallback(colors_path=WAL_COLORS_PATH, sequences_path=None, cache=None):
+    """load_palette, falling back to the sequences file next to colors.json if it cannot be parsed
+
+    The parse error is re-raised if the sequences file is missing or holds
+    no colors either.
+    """
+    try:
+        return load_palette(colors_path, cache=cache)
+    except json.JSONDecodeError as e:
+        if sequences_path is None:
+            sequences_path = os.path.join(os.path.dirname(colors_path), "sequences")
+        print(f"Error parsing {colors_path}: {e}")
+        try:
+            palette = load_sequences(sequences_path)
+        except (OSError, ValueError) as sequences_error:
+            print(f"Could not use {sequences_path} instead: {sequences_error}")
+            raise e
+        print(f"Using {len(palette)} colors from {sequences_path} instead")
+        return palette
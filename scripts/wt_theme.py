@@ -0,0 +1,45 @@
+"""Windows Terminal "wal" color scheme from the winwal palette
+
+Only the scheme's members are spliced into settings.json, so comments,
+formatting and the other schemes are left untouched. A missing scheme is
+appended to "schemes"; profiles pick it up with "colorScheme": "wal".
+"""
+
+import jsonc
+from color_math import derive
+from theme_trace import TRACE
+
+WT_SCHEME_NAME = "wal"
+
+# Scheme member: palette key
+WT_SCHEME = {
+    "black": "color0", "red": "color1", "green": "color2", "yellow": "color3",
+    "blue": "color4", "purple": "color5", "cyan": "color6", "white": "color7",
+    "brightBlack": "color8", "brightRed": "color9", "brightGreen": "color10", "brightYellow": "color11",
+    "brightBlue": "color12", "brightPurple": "color13", "brightCyan": "color14", "brightWhite": "color15",
+    "background": "background", "foreground": "foreground", "cursorColor": "cursor",
+}
+
+# Palette entries render_windows_terminal reads, used to skip the target when they did not change
+WT_COLOR_KEYS = tuple(WT_SCHEME.values())
+
+# The Campbell scheme, for entries missing from the palette
+WT_DEFAULTS = {
+    "color0": "#0C0C0C", "color1": "#C50F1F", "color2": "#13A10E", "color3": "#C19C00",
+    "color4": "#0037DA", "color5": "#881798", "color6": "#3A96DD", "color7": "#CCCCCC",
+    "color8": "#767676", "color9": "#E74856", "color10": "#16C60C", "color11": "#F9F1A5",
+    "color12": "#3B78FF", "color13": "#B4009E", "color14": "#61D6D6", "color15": "#F2F2F2",
+    "background": "#0C0C0C", "foreground": "#CCCCCC", "cursor": "#FFFFFF",
+}
+
+def wt_scheme(colors):
+    """Return {scheme member: hex color}"""
+    derived = derive(colors)
+    return {member: derived.hex(key, WT_DEFAULTS[key]) for member, key in WT_SCHEME.items()}
+
+def render_windows_terminal(content, colors):
+    """Return settings.json with the wal scheme set to the palette"""
+    if not colors:
+        return content
+    TRACE.add(mode="jsonc splice")
+    return jsonc.set_array_item_values(content, 'schemes', 'name', WT_SCHEME_NAME, wt_scheme(colors))
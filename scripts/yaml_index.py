@@ -0,0 +1,160 @@
+"""Comment-preserving key path index for block-style YAML such as GlazeWM's config.yaml
+
+One pass over the lines maps dotted key paths like
+window_effects.focused_window.border.color to the offsets of their scalar
+values (list items get numeric segments, e.g. keybindings.0.commands).
+Updates splice new values into those offsets, so comments, blank lines and
+formatting are left untouched and any number of keys are set in one pass.
+
+Only the block style GlazeWM uses is understood: flow collections are
+indexed as opaque values and plain scalars continued over several lines
+are not supported.
+"""
+
+import json
+import re
+from collections import namedtuple
+
+from theme_trace import TRACE
+
+# Offsets of one scalar value; start/end exclude its quotes, line_end is before the newline
+Entry = namedtuple('Entry', 'line column start end quote line_end')
+
+KEY_LINE = re.compile(r'''(?P<indent>[ ]*)(?P<dash>-(?:[ ]+|$))?(?:(?P<key>"[^"\n]*"|'[^'\n]*'|[^\s#'"\[{\-][^:#\n]*?|-[^\s:#\n][^:#\n]*?)[ \t]*:(?=[ \t]|$))?[ \t]*(?P<value>.*)$''')
+# Values that would be read as something other than a plain string if left unquoted
+NEEDS_QUOTES = re.compile(r'''^[\s#&*!|>'"%@`{\[\],?:-]|: | #|\s$|^$''')
+
+def _scalar_span(line, start):
+    """Return (value_start, value_end, quote) for the scalar starting at line[start]"""
+    char = line[start:start + 1]
+    if char == '"':
+        i = start + 1
+        while i < len(line):
+            if line[i] == '\\':
+                i += 2
+                continue
+            if line[i] == '"':
+                return start + 1, i, '"'
+            i += 1
+    elif char == "'":
+        i = start + 1
+        while i < len(line):
+            if line[i] == "'":
+                if line[i + 1:i + 2] == "'":
+                    i += 2
+                    continue
+                return start + 1, i, "'"
+            i += 1
+
+    # Plain scalar (or an unterminated quote): up to a " #" comment
+    comment = re.search(r'[ \t]#', line[start:])
+    end = start + comment.start() if comment else len(line)
+    return start, start + len(line[start:end].rstrip()), ''
+
+def _key_name(key):
+    if key[:1] in '"\'':
+        return key[1:-1]
+    return key.strip()
+
+def index_yaml(text):
+    """Return {dotted path: Entry} for every scalar value in the document"""
+    entries = {}
+    stack = []          # (indent, segment, kind) with kind 'key' or 'item'
+    item_counts = {}    # parent path -> number of list items seen
+    block_indent = None # indent of a key whose value is a | or > block scalar
+
+    offset = 0
+    for number, line in enumerate(text.split('\n'), 1):
+        line_start = offset
+        offset += len(line) + 1
+        line = line.rstrip('\r')
+        stripped = line.lstrip(' ')
+        indent = len(line) - len(stripped)
+
+        if block_indent is not None:
+            if not stripped or indent > block_indent:
+                continue
+            block_indent = None
+        if not stripped or stripped.startswith('#') or stripped.startswith(('---', '...')):
+            continue
+
+        match = KEY_LINE.match(line)
+        if not match:
+            continue
+        dash, key, value = match.group('dash'), match.group('key'), match.group('value')
+
+        if dash:
+            while stack and (stack[-1][0] > indent or (stack[-1][0] == indent and stack[-1][2] == 'item')):
+                stack.pop()
+            parent = tuple(segment for _, segment, _ in stack)
+            index = item_counts.get(parent, 0)
+            item_counts[parent] = index + 1
+            stack.append((indent, str(index), 'item'))
+            content_indent = indent + len(dash)
+        else:
+            while stack and stack[-1][0] >= indent:
+                stack.pop()
+            content_indent = indent
+
+        if key is None and not dash:
+            continue
+        path = [segment for _, segment, _ in stack]
+        if key is not None:
+            path.append(_key_name(key))
+
+        value_offset = match.start('value')
+        if not value or value.startswith('#'):
+            # A parent mapping or sequence; its children follow on deeper lines
+            if key is not None:
+                stack.append((content_indent, _key_name(key), 'key'))
+            continue
+        if value[:1] in '|>':
+            block_indent = content_indent
+            continue
+
+        start, end, quote = _scalar_span(line, value_offset)
+        entries['.'.join(path)] = Entry(number, value_offset, line_start + start, line_start + end, quote, line_start + len(line))
+    return entries
+
+def format_scalar(value, quote=''):
+    """Format a value for a scalar that was written with the given quote style"""
+    if isinstance(value, bool):
+        text = 'true' if value else 'false'
+    else:
+        text = str(value)
+    if quote == '"':
+        return json.dumps(text)[1:-1]
+    if quote == "'":
+        return text.replace("'", "''")
+    if not isinstance(value, (bool, int, float)) and NEEDS_QUOTES.search(text):
+        return json.dumps(text)
+    return text
+
+def set_yaml_values(text, values, index=None):
+    """Set {dotted path: value} in one pass, return (text, [paths not found])
+
+    Only the value bytes change; the existing quote style, comments and
+    formatting are kept. Paths that are missing or are not scalars are
+    returned rather than inserted.
+    """
+    index = index_yaml(text) if index is None else index
+    edits = []
+    missing = []
+    for path, value in values.items():
+        entry = index.get(path)
+        if entry is None:
+            missing.append(path)
+            continue
+        replacement = format_scalar(value, entry.quote)
+        if text[entry.start:entry.end] != replacement:
+            edits.append((entry.start, entry.end, replacement))
+
+    TRACE.count("substitutions", len(edits))
+    parts = []
+    pos = 0
+    for start, end, replacement in sorted(edits):
+        parts.append(text[pos:start])
+        parts.append(replacement)
+        pos = end
+    parts.append(text[pos:])
+    return ''.join(parts), missing